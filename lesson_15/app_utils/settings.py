@@ -37,9 +37,144 @@ SERVER_CONSOLE_COMMAND_LIST = (
     "active_users",
     "login_history",
     "stat",
+    "trace",
     "exit",
     "help",
 )
 
-# Количество сообщений в чате
+# Количество сообщений на странице истории чата
 MAX_HISTORY_MESSAGES_IN_CHAT = 20
+
+# Режим трассировки вызовов функций декоратором FunctionLog:
+# "off" - декоратор возвращает функцию без обёртки (нулевые накладные расходы),
+# "sample" - логируется и замеряется каждый TRACE_SAMPLE_RATE-й вызов,
+# "full" - логируется и замеряется каждый вызов.
+TRACE_MODE = "sample"
+
+# Частота выборки для режима "sample" (1 вызов из N)
+TRACE_SAMPLE_RATE = 100
+
+# Уровни логирования по умолчанию для файла и консоли
+# (для сервера переопределяются в секции LOGGING файла server.ini)
+LOG_FILE_LEVEL = "DEBUG"
+LOG_CONSOLE_LEVEL = "DEBUG"
+
+# Размер очереди записей лога, при переполнении записи отбрасываются
+LOG_QUEUE_SIZE = 10000
+
+# Очередь исходящих сообщений клиента:
+# время ожидания подтверждения доставки сервером (секунды),
+# задержка перед повторной отправкой (удваивается с каждой попыткой)
+# и количество попыток, после которых сообщение считается недоставленным
+OUTBOX_ACK_TIMEOUT = 5
+OUTBOX_RETRY_DELAY = 2
+OUTBOX_MAX_ATTEMPTS = 5
+
+# Максимальное количество сообщений чата, хранимых в модели окна клиента
+HISTORY_MODEL_CAPACITY = 1000
+
+# Количество сообщений в пачке фонового построения индекса поиска
+SEARCH_INDEX_BATCH = 5000
+
+# Параметры соединения с базой данных клиента (PRAGMA SQLite):
+# журнал WAL, при synchronous = NORMAL синхронизация с диском
+# выполняется при сбросе журнала, а не при каждой транзакции
+CLIENT_DATABASE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "temp_store": "MEMORY",
+}
+
+# Запись в базу клиента пачками: записи, поступившие в течение
+# CLIENT_WRITE_WINDOW секунд, фиксируются одной транзакцией
+CLIENT_WRITE_WINDOW = 0.005
+CLIENT_WRITE_BATCH = 500
+
+# Хранилище переданных сообщений сервера (действие get_history):
+# количество сообщений на странице истории, наибольший размер страницы
+# в байтах (меньше буфера разбора сообщений клиента) и количество
+# страниц, отправляемых подряд на один запрос
+HISTORY_PAGE_SIZE = 100
+HISTORY_PAGE_BYTES = 32 * 1024
+HISTORY_STREAM_PAGES = 10
+
+# Подписки клиентов на присутствие контактов (subscribe_presence):
+# входы и выходы за PRESENCE_COALESCE секунд отправляются подписчику
+# одним сообщением, повторный вход за это время не отправляется
+PRESENCE_COALESCE = 0.5
+
+# Уведомления о получении и прочтении сообщений (action receipt):
+# статусы уведомлений, уведомления отправителю объединяются
+# за цикл сервера в одно сообщение с диапазонами msg_id
+RECEIPT_RECEIVED = "received"
+RECEIPT_READ = "read"
+RECEIPT_STATUSES = (RECEIPT_RECEIVED, RECEIPT_READ)
+
+# Количество записей на странице истории входов (окно и консоль сервера)
+LOGIN_HISTORY_PAGE = 100
+
+# Хранение истории входов на сервере: записи старше заданного в server.ini
+# срока архивируются и удаляются пачками по RETENTION_BATCH записей,
+# между пачками выдерживается пауза RETENTION_PAUSE секунд
+RETENTION_BATCH = 1000
+RETENTION_PAUSE = 0.1
+
+# Профили параметров соединений с базой данных сервера (PRAGMA SQLite),
+# профиль и отдельные параметры задаются в секции [STORAGE] server.ini.
+# В режиме WAL окна и консоль читают базу, не блокируя запись потоком
+# сервера. durable - фиксация каждой транзакции на диске, balanced -
+# возможна потеря последних транзакций при отключении питания (но не
+# повреждение базы), throughput - без синхронизации с диском.
+SERVER_DATABASE_PROFILES = {
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -2000,
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+        "busy_timeout": 5000,
+    },
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -16000,
+        "mmap_size": 67108864,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+    "throughput": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -64000,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+}
+SERVER_DATABASE_PROFILE = "balanced"
+SERVER_DATABASE_PRAGMAS = SERVER_DATABASE_PROFILES[SERVER_DATABASE_PROFILE]
+
+# Количество файлов (сегментов) базы сервера в режиме backend = sharded,
+# изменяется утилитой reshard.py
+SERVER_DATABASE_SHARDS = 4
+
+# Журнал входов в файлах с отображением в память (параметр login_log
+# секции [STORAGE]): записей в сегменте, шаг разреженного индекса
+# времени (записей) и период сброса на диск и сжатия (секунды)
+EVENT_LOG_SEGMENT_RECORDS = 65536
+EVENT_LOG_INDEX_INTERVAL = 256
+EVENT_LOG_COMPACT_INTERVAL = 60
+
+# Допустимые значения строковых параметров соединений базы сервера,
+# остальные параметры - целые числа
+SERVER_DATABASE_PRAGMA_CHOICES = {
+    "journal_mode": ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL"),
+    "synchronous": ("OFF", "NORMAL", "FULL", "EXTRA"),
+    "temp_store": ("DEFAULT", "FILE", "MEMORY"),
+}
+
+# Пул соединений записи базы сервера: постоянные соединения
+# и дополнительные соединения при нехватке постоянных
+SERVER_DATABASE_POOL_SIZE = 5
+SERVER_DATABASE_MAX_OVERFLOW = 10
@@ -1,42 +1,137 @@
+import codecs
+import json
+import logging
 import os
+import re
 import socket
+import sys
 from calendar import timegm
 from datetime import datetime
 from functools import wraps
-from inspect import stack
+from time import perf_counter
+
+from app_utils.settings import (
+    ENCODING_VAR,
+    MAX_DATA_LENGTH,
+    TRACE_MODE,
+    TRACE_SAMPLE_RATE,
+)
+
+# Режимы трассировки декоратора FunctionLog
+TRACE_OFF = "off"
+TRACE_SAMPLE = "sample"
+TRACE_FULL = "full"
+
+
+class TraceStat:
+    """
+    Счётчики трассировки одной функции.
+    calls - общее количество вызовов,
+    traced - количество вызовов, попавших в выборку,
+    traced_time - суммарное время выполнения вызовов из выборки (сек).
+    """
+
+    __slots__ = ("calls", "traced", "traced_time")
+
+    def __init__(self):
+        self.calls = 0
+        self.traced = 0
+        self.traced_time = 0.0
+
+
+# Статистика трассировки: {"module.qualname": TraceStat}
+trace_registry = {}
+
+
+def trace_stats():
+    """
+    Функция возвращает снимок статистики трассировки в виде словаря
+    {"module.qualname": {"calls": ..., "traced": ..., "sampled_time": ...,
+    "estimated_total": ..., "avg_time": ...}}. sampled_time - измеренное
+    время трассированных вызовов, estimated_total - оценка времени всех
+    вызовов по среднему; в режиме полной трассировки они совпадают.
+    """
+
+    result = {}
+    for name, stat in trace_registry.items():
+        avg_time = stat.traced_time / stat.traced if stat.traced else 0.0
+        result[name] = {
+            "calls": stat.calls,
+            "traced": stat.traced,
+            "sampled_time": stat.traced_time,
+            "estimated_total": avg_time * stat.calls,
+            "avg_time": avg_time,
+        }
+    return result
+
+
+def reset_trace_stats():
+    """Функция обнуляет накопленную статистику трассировки."""
+    for stat in trace_registry.values():
+        stat.calls = stat.traced = 0
+        stat.traced_time = 0.0
 
 
 class FunctionLog:
     """
-    Декоратор, выполняющий логирование вызовов функций.
+    Декоратор, выполняющий трассировку вызовов функций.
     Сохраняет содержащие информацию об имени вызываемой функции,
     параметры с которыми вызывается функция, и модуль
-    вызывающий функцию.
+    вызывающий функцию, а также считает количество вызовов
+    и суммарное время выполнения функции (см. trace_stats).
+
+    Режим работы задаётся параметром mode или настройкой TRACE_MODE:
+    "off" - функция возвращается без обёртки,
+    "sample" - трассируется каждый sample_rate-й вызов,
+    "full" - трассируется каждый вызов.
     """
 
-    def __init__(self, logger):
+    def __init__(self, logger, mode=None, sample_rate=None):
         self.logger = logger
+        self.mode = TRACE_MODE if mode is None else mode
+        if sample_rate is None:
+            sample_rate = TRACE_SAMPLE_RATE
+        self.sample_rate = max(int(sample_rate), 1)
 
     def __call__(self, func):
+        if self.mode == TRACE_OFF:
+            return func
+
+        stat = trace_registry.setdefault(
+            f"{func.__module__}.{func.__qualname__}", TraceStat()
+        )
+        logger = self.logger
+        rate = self.sample_rate if self.mode == TRACE_SAMPLE else 1
+
         @wraps(func)
         def inner(*args, **kwargs):
-            outer_function_name = stack()[1][3]
-            path = stack()[1][1]
-            module_name = path.split(os.sep)[-1]
-            self.logger.debug(
-                "Function: '%s' running from module:"
-                " '%s' and function: '%s', with params: '%s'",
-                func.__name__,
-                module_name,
-                outer_function_name,
-                (args, kwargs),
-            )
+            stat.calls += 1
+            if stat.calls % rate:
+                return func(*args, **kwargs)
 
-            ret = func(*args, **kwargs)
+            debug = logger.isEnabledFor(logging.DEBUG)
+            if debug:
+                # Информацию о вызывающей функции берём из кадра стека
+                # напрямую, не разбирая стек целиком
+                caller = sys._getframe(1).f_code
+                logger.debug(
+                    "Function: '%s' running from module:"
+                    " '%s' and function: '%s', with params: '%s'",
+                    func.__name__,
+                    os.path.basename(caller.co_filename),
+                    caller.co_name,
+                    (args, kwargs),
+                )
 
-            self.logger.debug(
-                "Function: '%s' return: '%s'", func.__name__, ret
-            )
+            start = perf_counter()
+            try:
+                ret = func(*args, **kwargs)
+            finally:
+                stat.traced += 1
+                stat.traced_time += perf_counter() - start
+
+            if debug:
+                logger.debug("Function: '%s' return: '%s'", func.__name__, ret)
             return ret
 
         return inner
@@ -67,6 +162,155 @@ def log(user_logger):
     return inner
 
 
+class JsonFrameDecoder:
+    """
+    Класс разбора потока байт из сокета на JSON - сообщения.
+    Один вызов recv может вернуть несколько склеенных сообщений
+    или часть сообщения, поэтому неразобранный остаток
+    сохраняется до следующего вызова feed.
+    """
+
+    # Максимальный размер неразобранного остатка
+    max_buffer = 64 * MAX_DATA_LENGTH
+    # Окончания буфера, которые могут быть началом значения JSON:
+    # часть числа или \u-последовательности в строке
+    incomplete_tail = re.compile(r"[-+.eE\d]*|u[0-9a-fA-F]{0,3}")
+    literals = ("true", "false", "null", "NaN", "Infinity", "-Infinity")
+
+    def __init__(self):
+        self.decoder = codecs.getincrementaldecoder(ENCODING_VAR)()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ""
+
+    def feed(self, data):
+        """
+        Метод добавляет байты в буфер и возвращает список сообщений.
+        Если данные не являются JSON, вызывает json.JSONDecodeError,
+        сообщения, разобранные до ошибки, передаются в его атрибуте
+        frames.
+        """
+
+        buffer = self.buffer + self.decoder.decode(data)
+        frames = []
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position == len(buffer):
+                break
+            try:
+                frame, position = self.json_decoder.raw_decode(
+                    buffer, position
+                )
+            except json.JSONDecodeError as error:
+                # Сообщение получено не полностью - ошибка в конце
+                # буфера, иначе данные не являются JSON
+                if (
+                    not self.incomplete(buffer, error)
+                    or len(buffer) - position > self.max_buffer
+                ):
+                    self.buffer = buffer[position:]
+                    error.frames = frames
+                    raise
+                break
+            frames.append(frame)
+        self.buffer = buffer[position:]
+        return frames
+
+    def incomplete(self, buffer, error):
+        """
+        Метод проверяет, что ошибка разбора вызвана концом буфера:
+        после места ошибки нет данных, строка не закрыта или остаток
+        может быть началом числа или литерала.
+        """
+
+        tail = buffer[slice(error.pos, None)]
+        if error.msg.startswith("Unterminated string"):
+            return True
+        return bool(self.incomplete_tail.fullmatch(tail)) or any(
+            literal.startswith(tail) for literal in self.literals
+        )
+
+
+def percentile(sorted_values, fraction):
+    """
+    Функция возвращает перцентиль fraction (0..1)
+    из отсортированного списка значений.
+    """
+
+    if not sorted_values:
+        return None
+    index = min(
+        int(round(fraction * (len(sorted_values) - 1))),
+        len(sorted_values) - 1,
+    )
+    return sorted_values[index]
+
+
+def merge_ranges(ranges):
+    """
+    Функция объединения диапазонов id [[первый, последний], ...]:
+    возвращает отсортированный список непересекающихся диапазонов,
+    соседние диапазоны объединяются. При неверном диапазоне
+    (границы не целые числа или первая больше последней)
+    вызывает ValueError.
+    """
+
+    merged = []
+    for first, last in sorted(ranges):
+        if not is_id(first) or not is_id(last) or first > last:
+            raise ValueError(f"Bad range: {first}, {last}")
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], last)
+        else:
+            merged.append([first, last])
+    return merged
+
+
+def id_ranges(ids):
+    """Функция сворачивания списка id в диапазоны (см. merge_ranges)."""
+    return merge_ranges([identifier, identifier] for identifier in ids)
+
+
+def is_id(value):
+    """Функция проверки, что value - целое число, но не bool."""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def add_to_ranges(ranges, identifier):
+    """
+    Функция добавления id в отсортированный список диапазонов
+    на месте. Возрастающие id расширяют последний диапазон.
+    """
+
+    if ranges and ranges[-1][0] <= identifier <= ranges[-1][1] + 1:
+        ranges[-1][1] = max(ranges[-1][1], identifier)
+    elif not ranges or identifier > ranges[-1][1]:
+        ranges.append([identifier, identifier])
+    else:
+        ranges[:] = merge_ranges(ranges + [[identifier, identifier]])
+
+
+def intersect_ranges(ranges, allowed):
+    """
+    Функция пересечения двух отсортированных списков
+    непересекающихся диапазонов id.
+    """
+
+    result = []
+    position = 0
+    for first, last in ranges:
+        while position < len(allowed) and allowed[position][1] < first:
+            position += 1
+        index = position
+        while index < len(allowed) and allowed[index][0] <= last:
+            result.append(
+                [max(first, allowed[index][0]), min(last, allowed[index][1])]
+            )
+            index += 1
+    return result
+
+
 # Дата Время в часовом поясе пользователя
 def datetime_from_utc_to_local(utc_datetime):
     """
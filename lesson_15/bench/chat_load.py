@@ -0,0 +1,474 @@
+"""
+Нагрузочный тест сервера без графического интерфейса.
+
+Запускает ServerCore с временной базой ServerStorage (или хранилищем
+в памяти MemoryStorage, ``--storage memory``) в отдельном процессе,
+подключает заданное количество симулированных клиентов, которые проходят
+авторизацию, синхронизируют контакты и обмениваются сообщениями по
+выбранной схеме, и выводит результаты в формате JSON.
+
+Запуск из каталога lesson_15:
+
+``python -m bench.chat_load --clients 200 --pattern one_to_one``
+
+``python -m bench.chat_load --clients 200 --storage memory``
+
+Схемы обмена сообщениями:
+
+* one_to_one - клиенты разбиты на пары и пишут друг другу;
+* hotspot - все клиенты пишут нескольким "горячим" пользователям;
+* fanout - первый клиент пишет всем остальным.
+
+ServerCore использует select(), поэтому количество клиентов ограничено
+FD_SETSIZE (1024 сокета).
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import resource
+import selectors
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle
+from time import perf_counter
+
+from app_utils.settings import MAX_DATA_LENGTH
+from app_utils.utils import JsonFrameDecoder, percentile
+
+# Пароль всех симулированных пользователей
+BENCH_PASSWORD = "bench"
+
+# Максимальное количество клиентов, которое выдерживает select() сервера
+MAX_BENCH_CLIENTS = 1000
+
+PATTERNS = ("one_to_one", "hotspot", "fanout")
+
+
+def arg_parser():
+    """Парсер аргументов командной строки нагрузочного теста."""
+    parser = argparse.ArgumentParser(description="Chat server load test")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--pattern", choices=PATTERNS, default="one_to_one")
+    parser.add_argument(
+        "--messages",
+        type=int,
+        default=20,
+        help="Messages sent by every sender",
+    )
+    parser.add_argument(
+        "--hot-users",
+        type=int,
+        default=1,
+        help="Number of recipients in the hotspot pattern",
+    )
+    parser.add_argument(
+        "--window",
+        type=int,
+        default=1,
+        help="Undelivered messages allowed per sender",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=16,
+        help="Parallel logins",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=60.0,
+        help="Seconds to wait for message delivery",
+    )
+    parser.add_argument(
+        "--storage",
+        choices=("sqlite", "memory"),
+        default="sqlite",
+        help="Server storage backend",
+    )
+    parser.add_argument(
+        "--log-level",
+        default="WARNING",
+        help="Server logger level during the run",
+    )
+    parser.add_argument("--output", help="Write JSON report to this file")
+    namespace = parser.parse_args()
+    if not 2 <= namespace.clients <= MAX_BENCH_CLIENTS:
+        parser.error(f"--clients must be between 2 and {MAX_BENCH_CLIENTS}")
+    return namespace
+
+
+def raise_file_limit():
+    """Функция поднимает лимит открытых файлов до максимального."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def free_port():
+    """Функция возвращает свободный TCP порт."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def current_rss_kb():
+    """Функция возвращает текущий размер резидентной памяти процесса."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def run_server(port, user_names, storage, log_level, connection):
+    """
+    Функция процесса сервера. Создаёт временную базу, регистрирует
+    пользователей, запускает ServerCore и по команде stop возвращает
+    использованные сервером процессорное время и память.
+    """
+
+    raise_file_limit()
+    from log.server_log_config import LOGGER_NAME
+    from server.core import ServerCore
+    from server.memory_storage import MemoryStorage
+    from server.server_database import ServerStorage
+
+    logging.getLogger(LOGGER_NAME).setLevel(log_level)
+    temp_dir = tempfile.mkdtemp(prefix="chat_bench_")
+    if storage == "memory":
+        database = MemoryStorage()
+    else:
+        database = ServerStorage(os.path.join(temp_dir, "server_base.db3"))
+    server = ServerCore(
+        server_port=port, server_ip="127.0.0.1", database=database
+    )
+    for name in user_names:
+        database.add_update_user(
+            name, server.get_hash(username=name, password=BENCH_PASSWORD)
+        )
+    server.run()
+
+    start_usage = resource.getrusage(resource.RUSAGE_SELF)
+    start_time = perf_counter()
+    connection.send("ready")
+    connection.recv()
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    elapsed = perf_counter() - start_time
+    cpu_seconds = (usage.ru_utime - start_usage.ru_utime) + (
+        usage.ru_stime - start_usage.ru_stime
+    )
+    connection.send(
+        {
+            "cpu_seconds": cpu_seconds,
+            "cpu_percent": 100 * cpu_seconds / elapsed if elapsed else None,
+            "rss_kb": current_rss_kb(),
+            "max_rss_kb": usage.ru_maxrss,
+        }
+    )
+    server.running = False
+    server.thread.join(timeout=5)
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+class BenchClient:
+    """Класс - симулированный клиент с блокирующими запросами."""
+
+    def __init__(self, name, address):
+        self.name = name
+        self.address = address
+        self.sock = None
+        self.decoder = JsonFrameDecoder()
+        self.frames = []
+
+    def send(self, message):
+        self.sock.sendall(json.dumps(message).encode())
+
+    def receive(self):
+        """Метод получения одного сообщения от сервера."""
+        while not self.frames:
+            data = self.sock.recv(MAX_DATA_LENGTH)
+            if not data:
+                raise ConnectionError("Server closed connection")
+            self.frames.extend(self.decoder.feed(data))
+        return self.frames.pop(0)
+
+    def request(self, message, expected):
+        """Метод отправки запроса с проверкой кода ответа."""
+        self.send(message)
+        answer = self.receive()
+        if answer.get("response") != expected:
+            raise ConnectionError(f"{message['action']}: {answer}")
+        return answer
+
+    def login(self):
+        """Метод подключения и авторизации на сервере."""
+        self.sock = socket.create_connection(self.address, timeout=30)
+        user = {"account_name": self.name, "status": "bench"}
+        self.request(
+            {"action": "presence", "time": time.time(), "user": user}, 401
+        )
+        user["password"] = BENCH_PASSWORD
+        self.request(
+            {"action": "authenticate", "time": time.time(), "user": user},
+            200,
+        )
+
+    def sync_contacts(self, contacts):
+        """Метод добавления контактов и получения списка контактов."""
+        for contact in contacts:
+            self.request(
+                {
+                    "action": "add_contact",
+                    "time": time.time(),
+                    "user_id": self.name,
+                    "user_login": contact,
+                },
+                200,
+            )
+        self.request(
+            {
+                "action": "get_contacts",
+                "time": time.time(),
+                "user_login": self.name,
+            },
+            202,
+        )
+
+    def send_message(self, to_user, text):
+        self.send(
+            {
+                "action": "msg",
+                "time": time.time(),
+                "from": self.name,
+                "to": to_user,
+                "message": text,
+            }
+        )
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+
+
+def build_targets(pattern, names, hot_users):
+    """
+    Функция возвращает словарь отправитель -> список получателей
+    для выбранной схемы обмена сообщениями.
+    """
+
+    if pattern == "one_to_one":
+        targets = {}
+        for i in range(0, len(names) - 1, 2):
+            targets[names[i]] = [names[i + 1]]
+            targets[names[i + 1]] = [names[i]]
+        return targets
+    if pattern == "hotspot":
+        hot = names[: max(1, min(hot_users, len(names) - 1))]
+        return {
+            name: [hot[i % len(hot)]]
+            for i, name in enumerate(names)
+            if name not in hot
+        }
+    return {names[0]: names[1:]}
+
+
+def run_messages(clients, targets, messages, window, timeout):
+    """
+    Функция фазы обмена сообщениями. Каждый отправитель держит
+    не более window недоставленных сообщений, следующее сообщение
+    отправляется после доставки предыдущего получателю.
+    Возвращает (отправлено, доставлено, задержки, длительность, ошибки).
+    """
+
+    by_name = {client.name: client for client in clients}
+    ready = queue.Queue()
+    latencies = []
+    errors = []
+    delivered = 0
+    expected = len(targets) * messages
+    selector = selectors.DefaultSelector()
+    for client in clients:
+        # Сокеты остаются блокирующими, читаем только готовые к чтению
+        selector.register(client.sock, selectors.EVENT_READ, client)
+
+    def reader():
+        nonlocal delivered
+        while delivered < expected and not stop.is_set():
+            for key, _ in selector.select(timeout=0.5):
+                client = key.data
+                try:
+                    data = client.sock.recv(MAX_DATA_LENGTH)
+                except (BlockingIOError, InterruptedError):
+                    continue
+                except OSError as error:
+                    errors.append(f"{client.name}: {error}")
+                    selector.unregister(client.sock)
+                    continue
+                if not data:
+                    errors.append(f"{client.name}: disconnected")
+                    selector.unregister(client.sock)
+                    continue
+                for frame in client.decoder.feed(data):
+                    if frame.get("action") != "msg":
+                        errors.append(f"{client.name}: {frame}")
+                        continue
+                    sender, _, sent_at = frame["message"].split(":")
+                    latencies.append(perf_counter() - float(sent_at))
+                    delivered += 1
+                    ready.put(sender)
+
+    def send(name):
+        client = by_name[name]
+        sent[name] += 1
+        client.send_message(
+            next(recipients[name]), f"{name}:{sent[name]}:{perf_counter()}"
+        )
+
+    stop = threading.Event()
+    recipients = {name: cycle(names) for name, names in targets.items()}
+    sent = {name: 0 for name in targets}
+    reader_thread = threading.Thread(target=reader, daemon=True)
+    reader_thread.start()
+
+    started = perf_counter()
+    for name in targets:
+        for _ in range(min(window, messages)):
+            send(name)
+    deadline = started + timeout
+    while delivered < expected and perf_counter() < deadline:
+        try:
+            name = ready.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        if sent[name] < messages:
+            send(name)
+    duration = perf_counter() - started
+    stop.set()
+    reader_thread.join()
+    selector.close()
+    return sum(sent.values()), delivered, latencies, duration, errors
+
+
+def main():
+    args = arg_parser()
+    raise_file_limit()
+    names = [f"bench_user_{i}" for i in range(args.clients)]
+    port = free_port()
+    address = ("127.0.0.1", port)
+    targets = build_targets(args.pattern, names, args.hot_users)
+
+    parent_connection, child_connection = multiprocessing.Pipe()
+    server_process = multiprocessing.Process(
+        target=run_server,
+        args=(port, names, args.storage, args.log_level, child_connection),
+        daemon=True,
+    )
+    server_process.start()
+    parent_connection.recv()
+
+    clients = [BenchClient(name, address) for name in names]
+    login_errors = []
+
+    def login(client):
+        try:
+            client.login()
+        except (OSError, ValueError) as error:
+            login_errors.append(f"{client.name}: {error}")
+            client.close()
+            client.sock = None
+
+    started = perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        list(executor.map(login, clients))
+    login_duration = perf_counter() - started
+
+    # Клиенты без входа не участвуют в следующих фазах, сообщения
+    # им и от них не отправляются
+    clients = [client for client in clients if client.sock is not None]
+    logged_in = {client.name for client in clients}
+    targets = {
+        name: [recipient for recipient in recipients if recipient in logged_in]
+        for name, recipients in targets.items()
+        if name in logged_in
+    }
+    targets = {
+        name: recipients for name, recipients in targets.items() if recipients
+    }
+
+    contact_errors = []
+
+    def sync(client):
+        try:
+            client.sync_contacts(targets.get(client.name, [])[:1])
+        except (OSError, ValueError) as error:
+            contact_errors.append(f"{client.name}: {error}")
+
+    started = perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        list(executor.map(sync, clients))
+    contacts_duration = perf_counter() - started
+
+    sent, delivered, latencies, duration, message_errors = run_messages(
+        clients, targets, args.messages, args.window, args.timeout
+    )
+
+    parent_connection.send("stop")
+    server_stats = parent_connection.recv()
+    for client in clients:
+        client.close()
+    server_process.join(timeout=10)
+
+    latencies.sort()
+    report = {
+        "storage": args.storage,
+        "pattern": args.pattern,
+        "clients": args.clients,
+        "senders": len(targets),
+        "messages_per_sender": args.messages,
+        "window": args.window,
+        "logins": len(clients),
+        "login_errors": len(login_errors),
+        "logins_per_sec": args.clients / login_duration,
+        "contact_syncs_per_sec": len(clients) / contacts_duration,
+        "contact_errors": len(contact_errors),
+        "messages_sent": sent,
+        "messages_delivered": delivered,
+        "messages_per_sec": delivered / duration if duration else None,
+        "message_errors": len(message_errors),
+        "latency_ms": {
+            name: (
+                percentile(latencies, fraction) * 1000 if latencies else None
+            )
+            for name, fraction in (
+                ("p50", 0.5),
+                ("p99", 0.99),
+                ("p999", 0.999),
+                ("max", 1.0),
+            )
+        },
+        "server": server_stats,
+        "errors": (login_errors + contact_errors + message_errors)[:20],
+    }
+    result = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(result)
+    print(result)
+    return 0 if delivered == sent and not login_errors else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,437 @@
+"""
+Микро-бенчмарк методов ServerStorage на синтетических базах данных.
+
+Для каждого масштаба создаётся временная база с заданным количеством
+пользователей, записей истории входов и контактов, после чего замеряется
+время публичных методов ServerStorage. Для каждого метода в отчёт
+попадают выполненные SQL запросы и их планы (EXPLAIN QUERY PLAN),
+полные сканирования таблиц перечисляются в поле full_scans.
+
+Запуск из каталога lesson_15:
+
+``python -m bench.storage_bench --scale small --scale medium``
+
+``python -m bench.storage_bench --users 5000 --history 200000``
+
+``python -m bench.storage_bench --profile durable``
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from time import perf_counter
+
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+
+from app_utils.settings import (
+    SERVER_DATABASE_PROFILE,
+    SERVER_DATABASE_PROFILES,
+)
+from log.server_log_config import LOGGER_NAME
+from server.server_database import ServerStorage, storage_pragmas
+
+# Масштабы синтетических баз:
+# (пользователей, записей истории входов, контактов на пользователя)
+SCALES = {
+    "small": (1_000, 100_000, 20),
+    "medium": (10_000, 1_000_000, 50),
+    "large": (100_000, 10_000_000, 100),
+}
+
+# Доля пользователей, находящихся в сети
+ACTIVE_USERS_FRACTION = 0.1
+
+# Размер пачки строк при генерации базы
+INSERT_CHUNK = 50_000
+
+# Формат хранения DateTime, используемый SQLAlchemy для SQLite
+SQLITE_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def arg_parser():
+    """Парсер аргументов командной строки бенчмарка."""
+    parser = argparse.ArgumentParser(description="ServerStorage benchmark")
+    parser.add_argument(
+        "--scale", action="append", choices=sorted(SCALES), default=[]
+    )
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--history", type=int)
+    parser.add_argument("--contacts", type=int, default=20)
+    parser.add_argument(
+        "--repeat", type=int, default=20, help="Calls per method"
+    )
+    parser.add_argument(
+        "--full-history-limit",
+        type=int,
+        default=1_000_000,
+        help="Skip login_history() without a user filter above this size",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--profile",
+        default=SERVER_DATABASE_PROFILE,
+        choices=sorted(SERVER_DATABASE_PROFILES),
+    )
+    parser.add_argument(
+        "--log-level",
+        default="WARNING",
+        help="Server logger level during the run",
+    )
+    parser.add_argument("--keep", action="store_true", help="Keep databases")
+    parser.add_argument("--output", help="Write JSON report to this file")
+    namespace = parser.parse_args()
+    if namespace.users or namespace.history:
+        if not (namespace.users and namespace.history):
+            parser.error("--users and --history must be used together")
+    elif not namespace.scale:
+        namespace.scale = ["small"]
+    return namespace
+
+
+def generate_database(path, users, history, contacts, rng, pragmas):
+    """
+    Функция создания синтетической базы: пользователи, история входов,
+    граф контактов, статистика и активные пользователи.
+    Данные вставляются напрямую через DBAPI соединение.
+    """
+
+    database = ServerStorage(path, pragmas=pragmas)
+    connection = database.engine.raw_connection()
+    cursor = connection.cursor()
+    now = datetime.utcnow()
+    year = 365 * 24 * 3600
+
+    def date_time(seconds_ago):
+        moment = now - timedelta(seconds=seconds_ago)
+        return moment.strftime(SQLITE_DATETIME_FORMAT)
+
+    def insert(sql, rows):
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == INSERT_CHUNK:
+                cursor.executemany(sql, chunk)
+                chunk.clear()
+        if chunk:
+            cursor.executemany(sql, chunk)
+        connection.commit()
+
+    insert(
+        "INSERT INTO user (id, name, last_login, passwd_hash)"
+        " VALUES (?, ?, ?, ?)",
+        (
+            (i, f"user_{i}", date_time(rng.randrange(year)), "x" * 128)
+            for i in range(1, users + 1)
+        ),
+    )
+    insert(
+        "INSERT INTO login_history (user_id, date_time, ip_address, port)"
+        " VALUES (?, ?, ?, ?)",
+        (
+            (
+                rng.randint(1, users),
+                date_time(rng.randrange(year)),
+                f"10.{rng.randrange(256)}.{rng.randrange(256)}.1",
+                rng.randint(1024, 65535),
+            )
+            for _ in range(history)
+        ),
+    )
+    insert(
+        "INSERT INTO user_contact (user_id, date_time, contact_id)"
+        " VALUES (?, ?, ?)",
+        (
+            (user_id, date_time(rng.randrange(year)), contact_id)
+            for user_id in range(1, users + 1)
+            for contact_id in rng.sample(
+                range(1, users + 1), min(contacts, users)
+            )
+            if contact_id != user_id
+        ),
+    )
+    insert(
+        "INSERT INTO user_statistic (user_id, sent_count, received_count)"
+        " VALUES (?, ?, ?)",
+        (
+            (i, rng.randrange(1000), rng.randrange(1000))
+            for i in range(1, users + 1)
+        ),
+    )
+    active = rng.sample(
+        range(1, users + 1), max(1, int(users * ACTIVE_USERS_FRACTION))
+    )
+    insert(
+        "INSERT INTO active_user (user_id, ip_address, port, login_time)"
+        " VALUES (?, ?, ?, ?)",
+        (
+            (user_id, "127.0.0.1", 7777, date_time(rng.randrange(3600)))
+            for user_id in active
+        ),
+    )
+    connection.close()
+    return database, set(active)
+
+
+class StatementCollector:
+    """
+    Класс - сборщик SQL запросов, выполняемых через движки SQLAlchemy.
+    """
+
+    def __init__(self, *engines):
+        self.engines = engines
+        self.statements = []
+        self.enabled = False
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self.collect)
+
+    def collect(self, conn, cursor, statement, parameters, context, many):
+        if self.enabled and not many:
+            self.statements.append((statement, parameters))
+
+    def __enter__(self):
+        self.statements = []
+        self.enabled = True
+        return self
+
+    def __exit__(self, *exc):
+        self.enabled = False
+
+
+def explain(engine, statements):
+    """
+    Функция возвращает планы выполнения запросов.
+    INSERT запросы пропускаются, их план не зависит от индексов.
+    """
+
+    result = []
+    seen = set()
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for statement, parameters in statements:
+            if statement in seen or statement.lstrip().upper().startswith(
+                "INSERT"
+            ):
+                continue
+            seen.add(statement)
+            cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            plan = [row[3] for row in cursor.fetchall()]
+            result.append(
+                {
+                    "sql": " ".join(statement.split()),
+                    "plan": plan,
+                    "full_scans": [
+                        step
+                        for step in plan
+                        if step.startswith("SCAN") and "USING" not in step
+                    ],
+                }
+            )
+    finally:
+        connection.close()
+    return result
+
+
+def measure(database, collector, calls):
+    """
+    Функция замеряет время вызовов calls (список функций без аргументов)
+    и собирает планы запросов первого вызова.
+    """
+
+    timings = []
+    errors = 0
+    statements = []
+    for number, call in enumerate(calls):
+        started = perf_counter()
+        if number == 0:
+            with collector:
+                try:
+                    call()
+                except (SQLAlchemyError, ValueError, AttributeError):
+                    errors += 1
+                    database.session.rollback()
+            statements = collector.statements
+        else:
+            try:
+                call()
+            except (SQLAlchemyError, ValueError, AttributeError):
+                errors += 1
+                database.session.rollback()
+        timings.append((perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "calls": len(timings),
+        "errors": errors,
+        "min_ms": timings[0],
+        "median_ms": statistics.median(timings),
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "max_ms": timings[-1],
+        "queries": explain(database.engine, statements),
+    }
+
+
+def run_scale(name, users, history, contacts, args, rng):
+    """Функция бенчмарка одного масштаба базы данных."""
+    temp_dir = tempfile.mkdtemp(prefix=f"storage_bench_{name}_")
+    path = os.path.join(temp_dir, "server_base.db3")
+    started = perf_counter()
+    database, active = generate_database(
+        path, users, history, contacts, rng, storage_pragmas(args.profile)
+    )
+    report = {
+        "scale": name,
+        "profile": args.profile,
+        "users": users,
+        "login_history_rows": history,
+        "contacts_per_user": contacts,
+        "generation_seconds": perf_counter() - started,
+        "db_size_bytes": os.path.getsize(path),
+        "methods": {},
+    }
+    collector = StatementCollector(database.engine, database.read_engine)
+    repeat = args.repeat
+
+    def user_name():
+        return f"user_{rng.randint(1, users)}"
+
+    offline = [
+        i
+        for i in rng.sample(range(1, users + 1), min(users, 4 * repeat))
+        if i not in active
+    ][:repeat]
+    online = list(active)[:repeat]
+    methods = report["methods"]
+
+    methods["user_login"] = measure(
+        database,
+        collector,
+        [
+            lambda i=i: database.user_login(f"user_{i}", "10.0.0.1", 1234)
+            for i in offline
+        ],
+    )
+    methods["user_logout"] = measure(
+        database,
+        collector,
+        [lambda i=i: database.user_logout(f"user_{i}") for i in online],
+    )
+    methods["get_user_contacts"] = measure(
+        database,
+        collector,
+        [
+            lambda name=user_name(): database.get_user_contacts(name)
+            for _ in range(repeat)
+        ],
+    )
+    methods["add_contact"] = measure(
+        database,
+        collector,
+        [
+            lambda a=user_name(), b=user_name(): database.add_contact(a, b)
+            for _ in range(repeat)
+        ],
+    )
+    methods["login_history(user)"] = measure(
+        database,
+        collector,
+        [
+            lambda name=user_name(): database.login_history(name)
+            for _ in range(repeat)
+        ],
+    )
+    if history <= args.full_history_limit:
+        methods["login_history()"] = measure(
+            database,
+            collector,
+            [database.login_history for _ in range(min(repeat, 3))],
+        )
+    else:
+        methods["login_history()"] = {"skipped": "table too large"}
+    methods["iter_login_history()"] = measure(
+        database,
+        collector,
+        [lambda: list(database.iter_login_history()) for _ in range(repeat)],
+    )
+    methods["iter_login_history(user)"] = measure(
+        database,
+        collector,
+        [
+            lambda name=user_name(): list(database.iter_login_history(name))
+            for _ in range(repeat)
+        ],
+    )
+    last = list(database.iter_login_history())[-1]
+    methods["iter_login_history(cursor)"] = measure(
+        database,
+        collector,
+        [
+            lambda: list(
+                database.iter_login_history(cursor=(last.date_time, last.id))
+            )
+            for _ in range(repeat)
+        ],
+    )
+    methods["get_user_statistic"] = measure(
+        database,
+        collector,
+        [database.get_user_statistic for _ in range(min(repeat, 3))],
+    )
+    methods["update_user_statistic"] = measure(
+        database,
+        collector,
+        [
+            lambda a=user_name(), b=user_name(): (
+                database.update_user_statistic(a, b)
+            )
+            for _ in range(repeat)
+        ],
+    )
+    methods["remove_user"] = measure(
+        database,
+        collector,
+        [
+            lambda i=i: database.remove_user(f"user_{i}")
+            for i in rng.sample(range(1, users + 1), min(repeat, users))
+        ],
+    )
+
+    database.session.remove()
+    database.engine.dispose()
+    database.read_engine.dispose()
+    if args.keep:
+        report["path"] = path
+    else:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return report
+
+
+def main():
+    args = arg_parser()
+    logging.getLogger(LOGGER_NAME).setLevel(args.log_level)
+    rng = random.Random(args.seed)
+    scales = [(name, *SCALES[name]) for name in args.scale]
+    if args.users:
+        scales.append(("custom", args.users, args.history, args.contacts))
+
+    reports = [
+        run_scale(name, users, history, contacts, args, rng)
+        for name, users, history, contacts in scales
+    ]
+    result = json.dumps(reports, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(result)
+    print(result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
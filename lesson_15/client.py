@@ -7,7 +7,7 @@ from PyQt5.QtWidgets import QApplication
 import log.client_log_config
 from app_utils.settings import DEFAULT_SERVER_ADDRESS, DEFAULT_SERVER_PORT
 from app_utils.utils import log
-from client.client_database import ClientDatabase
+from client.client_database import ClientDatabase, SearchIndexBuilder
 from client.main_window import ClientMainWindow
 from client.start_dialog import UserNameDialog
 from client.transport import ClientTransport
@@ -90,6 +90,8 @@ if __name__ == "__main__":
     else:
         transport.daemon = True
         transport.start()
+        # Индексируем для поиска историю, сохранённую до создания индекса
+        SearchIndexBuilder(database).start()
 
         # Создаём GUI
         main_window = ClientMainWindow(database=database, transport=transport)
@@ -102,3 +104,5 @@ if __name__ == "__main__":
         # Раз графическая оболочка закрылась, закрываем транспорт
         transport.transport_shutdown()
         transport.join()
+        # Дожидаемся записи сообщений в базу
+        database.close()
@@ -0,0 +1,228 @@
+import asyncio
+import inspect
+import json
+import logging
+
+from app_utils import settings
+from app_utils.utils import JsonFrameDecoder
+from client.core import ClientProtocol
+from log.client_log_config import LOGGER_NAME
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+class AsyncClientCore(ClientProtocol):
+    """
+    Класс - асинхронный (asyncio) клиент мессенджера без графического
+    интерфейса. После connect входящие сообщения читает фоновая задача:
+    чат-сообщения передаются в on_message (функция или корутина),
+    изменения присутствия контактов - в on_presence, уведомления
+    о получении и прочтении сообщений - в on_receipt, ответы
+    сервера - ожидающему запросу. В одном процессе может
+    работать множество таких клиентов.
+    """
+
+    def __init__(
+        self,
+        ip_address,
+        port,
+        username,
+        password,
+        on_message=None,
+        on_connection_lost=None,
+        on_presence=None,
+        on_receipt=None,
+    ):
+        super().__init__(username, password)
+        self.server_ip = ip_address
+        self.server_port = port
+        self.on_message = on_message
+        self.on_connection_lost = on_connection_lost
+        self.on_presence = on_presence
+        self.on_receipt = on_receipt
+        self.reader = None
+        self.writer = None
+        self.reader_task = None
+        self.responses = asyncio.Queue()
+        # Запросы выполняются по одному: ответы сервера не нумеруются
+        self.lock = asyncio.Lock()
+        self.decoder = JsonFrameDecoder()
+        self.frames = []
+        self.running = False
+
+    async def connect(self, timeout=3):
+        """Метод установки соединения с сервером и аутентификации."""
+        try:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.server_ip, self.server_port),
+                timeout,
+            )
+        except (OSError, asyncio.TimeoutError):
+            raise ConnectionError(
+                "Не удалось установить соединение с сервером"
+            )
+
+        self.send_data(self.create_presence())
+        answer = await asyncio.wait_for(self.receive_data(), timeout)
+        if answer and answer.get("response") == 401:
+            self.send_data(self.create_authenticate())
+            answer = await asyncio.wait_for(self.receive_data(), timeout)
+        self.check_response(answer)
+
+        self.running = True
+        self.reader_task = asyncio.create_task(self.read_loop())
+
+    def send_data(self, data):
+        """Функция отправки данных в сокет"""
+        self.writer.write(json.dumps(data).encode(settings.ENCODING_VAR))
+
+    async def receive_data(self):
+        """Получение одного сообщения, None - соединение закрыто."""
+        while not self.frames:
+            data = await self.reader.read(settings.MAX_DATA_LENGTH)
+            if not data:
+                return None
+            self.frames.extend(self.decoder.feed(data))
+        return self.frames.pop(0)
+
+    async def read_loop(self):
+        """Задача приёма сообщений с сервера."""
+        try:
+            while self.running:
+                message = await self.receive_data()
+                if message is None:
+                    break
+                if self.is_user_message(message):
+                    if self.on_message:
+                        result = self.on_message(message)
+                        if inspect.isawaitable(result):
+                            await result
+                elif self.is_presence(message):
+                    if self.on_presence:
+                        result = self.on_presence(message)
+                        if inspect.isawaitable(result):
+                            await result
+                elif self.is_receipt(message):
+                    if self.on_receipt:
+                        result = self.on_receipt(message)
+                        if inspect.isawaitable(result):
+                            await result
+                elif self.is_ack(message):
+                    # Ответ на сообщение с msg_id не является ответом
+                    # на запрос
+                    logger.debug("Response from server: %s", message)
+                elif self.lock.locked():
+                    await self.responses.put(message)
+                else:
+                    # Ответ вне запроса, например на сообщение
+                    # для неизвестного пользователя
+                    logger.error("Response from server: %s", message)
+        except (OSError, json.JSONDecodeError):
+            pass
+        if self.running:
+            logger.critical("Потеряно соединение с сервером.")
+            self.running = False
+            await self.responses.put(None)
+            if self.on_connection_lost:
+                self.on_connection_lost()
+
+    async def request(self, message, expected=200, timeout=5):
+        """Метод отправки запроса и ожидания ответа сервера."""
+        async with self.lock:
+            self.send_data(message)
+            await self.writer.drain()
+            answer = await asyncio.wait_for(self.responses.get(), timeout)
+        return self.check_response(answer, expected)
+
+    async def get_contacts(self):
+        """Метод получения списка контактов с сервера."""
+        answer = await self.request(self.create_contacts_request(), 202)
+        return answer["alert"]
+
+    async def get_contacts_since(self, version):
+        """Метод получения изменений списка контактов после version."""
+        return await self.request(
+            self.create_contacts_since_request(version), 202
+        )
+
+    async def get_history(
+        self, contact, cursor=None, limit=None, pages=1, timeout=5
+    ):
+        """
+        Метод получения истории переписки с контактом, хранимой
+        на сервере: список из не более pages страниц (см.
+        ClientCore.get_history).
+        """
+
+        pages_list = []
+        async with self.lock:
+            self.send_data(
+                self.create_history_request(contact, cursor, limit, pages)
+            )
+            await self.writer.drain()
+            while True:
+                answer = await asyncio.wait_for(self.responses.get(), timeout)
+                pages_list.append(self.check_response(answer, 202))
+                if answer.get("last", True):
+                    break
+        return pages_list
+
+    async def subscribe_presence(self, contacts=None):
+        """
+        Метод подписки на вход и выход контактов, возвращает список
+        подключённых контактов (см. ClientCore.subscribe_presence).
+        """
+
+        answer = await self.request(
+            self.create_presence_subscription(contacts), 202
+        )
+        return answer["online"]
+
+    async def add_contact(self, contact):
+        """Метод добавления пользователя в контакт лист на сервере"""
+        await self.request(self.create_contact_message("add_contact", contact))
+
+    async def delete_contact(self, contact):
+        """Метод удаления пользователя из списка контактов на сервере"""
+        await self.request(self.create_contact_message("del_contact", contact))
+
+    async def send_message(self, to_user, message):
+        """
+        Метод отправки чат-сообщения. Сервер отвечает только на
+        сообщения для неизвестных пользователей, такие ответы
+        записываются в лог.
+        """
+
+        self.send_data(self.create_user_message(message, to_user))
+        await self.writer.drain()
+
+    async def send_receipts(self, status, receipts):
+        """
+        Метод отправки уведомления о получении или прочтении
+        сообщений (см. ClientCore.send_receipts).
+        """
+
+        self.send_data(self.create_receipt(status, receipts))
+        await self.writer.drain()
+
+    async def close(self):
+        """Метод закрытия подключения клиента"""
+        self.running = False
+        if self.writer is None:
+            return
+        try:
+            self.send_data(self.create_quit_message())
+            await self.writer.drain()
+        except OSError:
+            pass
+        self.writer.close()
+        if self.reader_task:
+            self.reader_task.cancel()
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+
+
+if __name__ == "__main__":
+    pass
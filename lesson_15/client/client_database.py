@@ -1,22 +1,191 @@
+import logging
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
 from datetime import datetime
 
 from sqlalchemy import (
+    Boolean,
     Column,
     DateTime,
+    Index,
     Integer,
     String,
     Text,
+    and_,
+    case,
     create_engine,
+    event,
     func,
+    inspect,
+    or_,
+    select,
+    text,
+    tuple_,
+    union_all,
 )
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 # sys.path.append("../")  # noqa
-from app_utils.settings import CLIENT_DATABASE, MAX_HISTORY_MESSAGES_IN_CHAT
+from app_utils.settings import (
+    CLIENT_DATABASE,
+    CLIENT_DATABASE_PRAGMAS,
+    CLIENT_WRITE_BATCH,
+    CLIENT_WRITE_WINDOW,
+    MAX_HISTORY_MESSAGES_IN_CHAT,
+    RECEIPT_READ,
+    RECEIPT_RECEIVED,
+    SEARCH_INDEX_BATCH,
+)
+from log.client_log_config import LOGGER_NAME
+
+logger = logging.getLogger(LOGGER_NAME)
 
 Base = declarative_base()
 
+# Полнотекстовый индекс сообщений (SQLite FTS5) с внешним содержимым:
+# текст хранится только в таблице message, индекс обновляют триггеры.
+# Сообщения, сохранённые до создания индекса (id от position
+# до boundary таблицы message_fts_state), индексируются в фоне
+# методом build_search_index, триггеры удаления и изменения
+# не трогают ещё не проиндексированные строки.
+SEARCH_INDEX_SCHEMA = (
+    "CREATE VIRTUAL TABLE message_fts USING fts5(message,"
+    " content='message', content_rowid='id',"
+    " tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TABLE message_fts_state (id INTEGER PRIMARY KEY,"
+    " position INTEGER NOT NULL, boundary INTEGER NOT NULL)",
+    "INSERT INTO message_fts_state (id, position, boundary)"
+    " SELECT 1, 0, coalesce(max(id), 0) FROM message",
+    "CREATE TRIGGER message_fts_insert AFTER INSERT ON message BEGIN"
+    " INSERT INTO message_fts (rowid, message)"
+    " VALUES (new.id, new.message); END",
+    "CREATE TRIGGER message_fts_delete AFTER DELETE ON message"
+    " WHEN old.id <= (SELECT position FROM message_fts_state)"
+    " OR old.id > (SELECT boundary FROM message_fts_state) BEGIN"
+    " INSERT INTO message_fts (message_fts, rowid, message)"
+    " VALUES ('delete', old.id, old.message); END",
+    "CREATE TRIGGER message_fts_update AFTER UPDATE OF message ON message"
+    " WHEN old.id <= (SELECT position FROM message_fts_state)"
+    " OR old.id > (SELECT boundary FROM message_fts_state) BEGIN"
+    " INSERT INTO message_fts (message_fts, rowid, message)"
+    " VALUES ('delete', old.id, old.message);"
+    " INSERT INTO message_fts (rowid, message)"
+    " VALUES (new.id, new.message); END",
+)
+
+# Статусы исходящих сообщений: ожидает отправки, передано сервером,
+# не отправлено, получено и прочитано получателем (уведомления receipt).
+# Входящие сообщения: delivered - не прочитано, read - прочитано
+MESSAGE_PENDING = "pending"
+MESSAGE_DELIVERED = "delivered"
+MESSAGE_FAILED = "failed"
+MESSAGE_RECEIVED = RECEIPT_RECEIVED
+MESSAGE_READ = RECEIPT_READ
+
+# Статусы, которые заменяет уведомление со статусом - ключом словаря
+RECEIPT_REPLACES = {
+    MESSAGE_RECEIVED: (MESSAGE_PENDING, MESSAGE_FAILED, MESSAGE_DELIVERED),
+    MESSAGE_READ: (
+        MESSAGE_PENDING,
+        MESSAGE_FAILED,
+        MESSAGE_DELIVERED,
+        MESSAGE_RECEIVED,
+    ),
+}
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Функция настройки соединения SQLite: журнал WAL (читатели
+    не блокируют запись и видят последнюю зафиксированную версию)
+    и параметры из CLIENT_DATABASE_PRAGMAS.
+    """
+
+    cursor = dbapi_connection.cursor()
+    for name, value in CLIENT_DATABASE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+
+class BatchWriter(threading.Thread):
+    """
+    Класс - поток записи в базу данных клиента.
+
+    Задания (функции, принимающие сессию SQLAlchemy) выполняются
+    в отдельном соединении. Задания, поступившие в течение window
+    секунд после первого, выполняются в одной транзакции - одна
+    синхронизация с диском на пачку. Результат задания передаётся
+    через Future после фиксации транзакции. Если пачка завершилась
+    ошибкой, она откатывается и задания выполняются по одному.
+    """
+
+    def __init__(
+        self, engine, window=CLIENT_WRITE_WINDOW, max_batch=CLIENT_WRITE_BATCH
+    ):
+        super().__init__(daemon=True)
+        Session = sessionmaker(bind=engine, expire_on_commit=False)  # noqa
+        self.session = Session()
+        self.window = window
+        self.max_batch = max_batch
+        self.jobs = queue.Queue()
+
+    def submit(self, job):
+        """Метод постановки задания в очередь, возвращает Future."""
+        future = Future()
+        self.jobs.put((job, future))
+        return future
+
+    def run(self):
+        """Метод содержащий основной цикл потока записи."""
+        stopped = False
+        while not stopped:
+            item = self.jobs.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.jobs.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopped = True
+                    break
+                batch.append(item)
+            self.execute(batch)
+        self.session.close()
+
+    def execute(self, batch):
+        """Метод выполнения пачки заданий в одной транзакции."""
+        try:
+            results = [job(self.session) for job, _ in batch]
+            self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            if len(batch) > 1:
+                for item in batch:
+                    self.execute([item])
+                return
+            logger.error("Client database write error: %s", e)
+            batch[0][1].set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def stop(self):
+        """Метод остановки потока после записи поставленных заданий."""
+        self.jobs.put(None)
+        self.join()
+
 
 # Класс - база данных сервера.
 class ClientDatabase:
@@ -24,6 +193,11 @@ class ClientDatabase:
     Класс - оболочка для работы с базой данных клиента.
     Использует SQLite базу данных, реализован с помощью SQLAlchemy ORM
     и используется декларативный подход.
+
+    Чтение выполняется через сессию self.session, запись - через
+    поток BatchWriter: методы записи возвращают Future или ожидают
+    его результата, несколько записей подряд фиксируются одной
+    транзакцией.
     """
 
     class Message(Base):
@@ -41,6 +215,34 @@ class ClientDatabase:
         date_time = Column(
             DateTime, default=datetime.utcnow, server_default=func.now()
         )
+        # Статус доставки: pending, delivered, failed, received или read
+        status = Column(
+            String(16),
+            nullable=False,
+            default=MESSAGE_DELIVERED,
+            server_default=MESSAGE_DELIVERED,
+        )
+        # id сообщения в истории сервера (history_id), None - сообщение
+        # не сохранено на сервере или ещё не подтверждено
+        server_id = Column(Integer)
+        # id входящего сообщения у отправителя (msg_id) для уведомлений
+        # о прочтении, None - отправитель не ждёт уведомлений
+        remote_id = Column(Integer)
+
+        # Индексы постраничной выборки переписки с контактом
+        # и поиска сообщения истории сервера
+        __table_args__ = (
+            Index(
+                "ix_message_owner_from_date", "owner", "from_user", "date_time"
+            ),
+            Index("ix_message_owner_to_date", "owner", "to_user", "date_time"),
+            Index(
+                "ix_message_owner_server_id",
+                "owner",
+                "server_id",
+                unique=True,
+            ),
+        )
 
         def __str__(self):
             return f"{self.from_user} - {self.to_user} \n {self.message}"
@@ -58,9 +260,45 @@ class ClientDatabase:
         owner = Column(String(255), nullable=False)
         contact_name = Column(String(255), nullable=False)
 
+        __table_args__ = (
+            Index("ix_contact_owner_name", "owner", "contact_name"),
+        )
+
         def __str__(self):
             return f"{self.owner} - {self.contact}"
 
+    class ContactVersion(Base):
+        """
+        Класс - отображение для таблицы версий списка контактов:
+        версия списка на сервере, с которой синхронизирована
+        таблица контактов владельца.
+        """
+
+        __tablename__ = "contact_version"
+
+        owner = Column(String(255), primary_key=True)
+        version = Column(Integer, nullable=False, default=0)
+
+        def __str__(self):
+            return f"{self.owner} - {self.version}"
+
+    class HistorySync(Base):
+        """
+        Класс - отображение для таблицы состояния загрузки истории
+        переписки с сервера: курсор следующей (более ранней) страницы
+        и признак загрузки всей истории.
+        """
+
+        __tablename__ = "history_sync"
+
+        owner = Column(String(255), primary_key=True)
+        contact = Column(String(255), primary_key=True)
+        cursor = Column(String(64))
+        complete = Column(Boolean, nullable=False, default=False)
+
+        def __str__(self):
+            return f"{self.owner} - {self.contact}: {self.cursor}"
+
     # Конструктор класса:
     def __init__(self, owner):
         self.owner = owner
@@ -70,46 +308,493 @@ class ClientDatabase:
             pool_recycle=7200,
             connect_args={"check_same_thread": False},
         )
+        event.listen(self.engine, "connect", set_sqlite_pragmas)
 
         # Создаём объект MetaData
         Base.metadata.create_all(self.engine)
+        self.migrate()
+        # Полнотекстовый поиск недоступен, если SQLite собран без FTS5
+        self.search_enabled = self.create_search_index()
 
         # Создаём сессию
         Session = sessionmaker(bind=self.engine)  # noqa
         self.session = Session()
-        # Необходимо очистить таблицу контактов,
-        # т.к. при запуске они подгружаются с сервера.
-        self.session.query(self.Contact).filter_by(owner=self.owner).delete()
-        self.session.commit()
+
+        # Поток записи в базу
+        self.writer = BatchWriter(self.engine)
+        self.writer.start()
+
+    def close(self):
+        """Функция завершения работы: дожидается записи в базу."""
+        self.writer.stop()
+        self.session.close()
+
+    def migrate(self):
+        """
+        Функция обновления схемы базы, созданной предыдущими версиями:
+        добавляет колонки статуса доставки, id в истории сервера
+        и id у отправителя в таблицу сообщений, индексы постраничной
+        выборки переписки и поиска контактов.
+        """
+
+        columns = {
+            column["name"]
+            for column in inspect(self.engine).get_columns("message")
+        }
+        if "status" not in columns:
+            with self.engine.begin() as connection:
+                connection.execute(
+                    text(
+                        "ALTER TABLE message ADD COLUMN status VARCHAR(16)"
+                        f" NOT NULL DEFAULT '{MESSAGE_DELIVERED}'"
+                    )
+                )
+        if "server_id" not in columns:
+            with self.engine.begin() as connection:
+                connection.execute(
+                    text("ALTER TABLE message ADD COLUMN server_id INTEGER")
+                )
+        if "remote_id" not in columns:
+            with self.engine.begin() as connection:
+                connection.execute(
+                    text("ALTER TABLE message ADD COLUMN remote_id INTEGER")
+                )
+        for table in (self.Message.__table__, self.Contact.__table__):
+            for index in table.indexes:
+                index.create(self.engine, checkfirst=True)
+
+    def create_search_index(self):
+        """
+        Функция создания полнотекстового индекса сообщений,
+        возвращает False, если SQLite не поддерживает FTS5.
+        """
+
+        if inspect(self.engine).has_table("message_fts"):
+            return True
+        try:
+            with self.engine.begin() as connection:
+                for statement in SEARCH_INDEX_SCHEMA:
+                    connection.execute(text(statement))
+        except OperationalError as e:
+            logger.error("Full-text search unavailable: %s", e)
+            return False
+        return True
+
+    def build_search_index(self, batch_size=SEARCH_INDEX_BATCH):
+        """
+        Функция индексирования очередной пачки сообщений, сохранённых
+        до создания полнотекстового индекса.
+        Возвращает True, когда индексирование завершено.
+        """
+
+        if not self.search_enabled:
+            return True
+
+        def write(session):
+            position, boundary = session.execute(
+                text("SELECT position, boundary FROM message_fts_state")
+            ).one()
+            if position >= boundary:
+                return True
+            upto = min(position + batch_size, boundary)
+            session.execute(
+                text(
+                    "INSERT INTO message_fts (rowid, message)"
+                    " SELECT id, message FROM message"
+                    " WHERE id > :position AND id <= :upto"
+                ),
+                {"position": position, "upto": upto},
+            )
+            session.execute(
+                text("UPDATE message_fts_state SET position = :upto"),
+                {"upto": upto},
+            )
+            return upto >= boundary
+
+        return self.writer.submit(write).result()
+
+    def search_index_progress(self):
+        """
+        Функция возвращающая состояние индексирования: кортеж
+        (проиндексировано до id, последний id для индексирования).
+        """
+
+        if not self.search_enabled:
+            return 0, 0
+        return tuple(
+            self.session.execute(
+                text("SELECT position, boundary FROM message_fts_state")
+            ).one()
+        )
+
+    @staticmethod
+    def search_match(query):
+        """
+        Функция преобразования строки поиска в запрос FTS5:
+        каждое слово ищется как префикс, слова объединяются по И.
+        """
+
+        return " ".join(f'"{word}"*' for word in re.findall(r"\w+", query))
+
+    def search_messages(
+        self,
+        query,
+        contact=None,
+        limit=MAX_HISTORY_MESSAGES_IN_CHAT,
+        cursor=None,
+    ):
+        """
+        Функция полнотекстового поиска по истории сообщений.
+        Возвращает кортеж (строки, курсор следующей страницы или None).
+        Строки содержат поля id, from_user, to_user, date_time,
+        snippet (фрагмент с найденными словами в квадратных скобках)
+        и rank, отсортированы по релевантности (bm25).
+        Курсор - кортеж (rank, id) последней строки страницы.
+        """
+
+        match = self.search_match(query)
+        if not match:
+            return [], None
+        params = {"owner": self.owner, "limit": limit}
+        if self.search_enabled:
+            params["match"] = match
+            sql = (
+                "SELECT message.id, message.from_user, message.to_user,"
+                " message.date_time,"
+                " snippet(message_fts, 0, '[', ']', '…', 12) AS snippet,"
+                " message_fts.rank AS rank"
+                " FROM message_fts JOIN message"
+                " ON message.id = message_fts.rowid"
+                " WHERE message_fts MATCH :match"
+            )
+            rank = "message_fts.rank"
+        else:
+            # Без FTS5 - поиск подстроки полным просмотром таблицы
+            params["match"] = f"%{query}%"
+            sql = (
+                "SELECT message.id, message.from_user, message.to_user,"
+                " message.date_time, message.message AS snippet, 0 AS rank"
+                " FROM message WHERE message.message LIKE :match"
+            )
+            rank = "0"
+        sql += " AND message.owner = :owner"
+        if contact is not None:
+            params["contact"] = contact
+            sql += (
+                " AND (message.from_user = :contact"
+                " OR message.to_user = :contact)"
+            )
+        if cursor is not None:
+            params["rank"], params["id"] = cursor
+            sql += (
+                f" AND ({rank} > :rank"
+                f" OR ({rank} = :rank AND message.id > :id))"
+            )
+        sql += f" ORDER BY {rank}, message.id LIMIT :limit"
+        rows = self.session.execute(
+            text(sql).columns(date_time=DateTime), params
+        ).all()
+        next_cursor = None
+        if len(rows) == limit:
+            next_cursor = (rows[-1].rank, rows[-1].id)
+        return rows, next_cursor
 
     def add_contact(self, contact):
         """Функция добавления контакта"""
-        if (
-            not self.session.query(self.Contact)
-            .filter_by(owner=self.owner, contact_name=contact)
-            .first()
-        ):
-            new_contact = self.Contact(owner=self.owner, contact_name=contact)
-            self.session.add(new_contact)
-            self.session.commit()
+
+        def write(session):
+            if (
+                not session.query(self.Contact)
+                .filter_by(owner=self.owner, contact_name=contact)
+                .first()
+            ):
+                session.add(
+                    self.Contact(owner=self.owner, contact_name=contact)
+                )
+
+        self.writer.submit(write).result()
 
     def delete_contact(self, contact):
         """Функция удаления контакта"""
-        self.session.query(self.Contact).filter_by(
-            owner=self.owner, contact_name=contact
-        ).delete()
-        self.session.commit()
-
-    def save_message(self, from_user, to_user, message):
-        """Функция сохраняющая сообщения"""
-        new_message = self.Message(
-            owner=self.owner,
-            from_user=from_user,
-            to_user=to_user,
-            message=message,
+
+        def write(session):
+            session.query(self.Contact).filter_by(
+                owner=self.owner, contact_name=contact
+            ).delete()
+
+        self.writer.submit(write).result()
+
+    def get_contacts_version(self):
+        """
+        Функция возвращающая версию списка контактов, с которой
+        синхронизирована база, 0 - синхронизации не было.
+        """
+
+        version = self.session.get(self.ContactVersion, self.owner)
+        return version.version if version else 0
+
+    def apply_contacts_changes(self, added, deleted, version, full=False):
+        """
+        Функция применения изменений списка контактов, полученных
+        с сервера, одной транзакцией. При full список added заменяет
+        все контакты владельца.
+        """
+
+        table = self.Contact.__table__
+
+        def write(session):
+            query = table.delete().where(table.c.owner == self.owner)
+            if not full:
+                query = query.where(
+                    table.c.contact_name.in_(set(added) | set(deleted))
+                )
+            session.execute(query)
+            if added:
+                session.execute(
+                    table.insert(),
+                    [
+                        {"owner": self.owner, "contact_name": contact}
+                        for contact in set(added)
+                    ],
+                )
+            session.merge(
+                self.ContactVersion(owner=self.owner, version=version)
+            )
+
+        self.writer.submit(write).result()
+        # Сессия чтения не должна возвращать прежнюю версию
+        self.session.expire_all()
+
+    def save_message(
+        self,
+        from_user,
+        to_user,
+        message,
+        status=MESSAGE_DELIVERED,
+        server_id=None,
+        remote_id=None,
+    ):
+        """
+        Функция сохраняющая сообщения без ожидания записи,
+        возвращает Future с id сообщения. Сообщение с server_id,
+        уже загруженное из истории сервера, не сохраняется повторно.
+        remote_id - msg_id входящего сообщения у отправителя.
+        """
+
+        def write(session):
+            query = self.Message.__table__.insert().values(
+                owner=self.owner,
+                from_user=from_user,
+                to_user=to_user,
+                message=message,
+                status=status,
+                server_id=server_id,
+                remote_id=remote_id,
+            )
+            if server_id is not None:
+                query = query.prefix_with("OR IGNORE")
+            result = session.execute(query)
+            return result.inserted_primary_key[0]
+
+        return self.writer.submit(write)
+
+    def set_message_status(self, message_id, status, server_id=None):
+        """
+        Функция изменения статуса доставки сообщения без ожидания
+        записи, возвращает Future с получателем сообщения или None.
+        server_id - id сообщения в истории сервера из подтверждения.
+        Статус сообщения, полученного или прочитанного получателем,
+        не изменяется.
+        """
+
+        def write(session):
+            table = self.Message.__table__
+            values = {
+                "status": case(
+                    (
+                        table.c.status.in_((MESSAGE_RECEIVED, MESSAGE_READ)),
+                        table.c.status,
+                    ),
+                    else_=status,
+                )
+            }
+            if server_id is not None:
+                # Копия сообщения, загруженная из истории сервера
+                # до подтверждения
+                session.execute(
+                    table.delete().where(
+                        table.c.owner == self.owner,
+                        table.c.server_id == server_id,
+                        table.c.id != message_id,
+                    )
+                )
+                values["server_id"] = server_id
+            session.execute(
+                table.update().where(table.c.id == message_id).values(values)
+            )
+            return session.execute(
+                select(table.c.to_user).where(table.c.id == message_id)
+            ).scalar()
+
+        return self.writer.submit(write)
+
+    def set_receipts(self, contact, status, ranges):
+        """
+        Функция сохранения уведомления контакта о получении
+        или прочтении сообщений без ожидания записи: ranges -
+        диапазоны id [[первый, последний], ...] исходящих сообщений
+        контакту. Статус не понижается (прочитанное сообщение
+        не становится полученным). Возвращает Future со списком id
+        сообщений, статус которых изменён.
+        """
+
+        table = self.Message.__table__
+
+        def write(session):
+            criteria = and_(
+                table.c.owner == self.owner,
+                table.c.from_user == self.owner,
+                table.c.to_user == contact,
+                table.c.status.in_(RECEIPT_REPLACES[status]),
+                or_(
+                    *(
+                        table.c.id.between(first, last)
+                        for first, last in ranges
+                    )
+                ),
+            )
+            ids = (
+                session.execute(
+                    select(table.c.id).where(criteria).order_by(table.c.id)
+                )
+                .scalars()
+                .all()
+            )
+            if ids:
+                session.execute(
+                    table.update().where(criteria).values(status=status)
+                )
+            return ids
+
+        return self.writer.submit(write)
+
+    def mark_read(self, contact):
+        """
+        Функция отметки входящих сообщений контакта прочитанными
+        без ожидания записи, возвращает Future со списком msg_id
+        отправителя для уведомления о прочтении.
+        """
+
+        table = self.Message.__table__
+
+        def write(session):
+            criteria = and_(
+                table.c.owner == self.owner,
+                table.c.from_user == contact,
+                table.c.to_user == self.owner,
+                table.c.status != MESSAGE_READ,
+            )
+            remote_ids = (
+                session.execute(select(table.c.remote_id).where(criteria))
+                .scalars()
+                .all()
+            )
+            session.execute(
+                table.update().where(criteria).values(status=MESSAGE_READ)
+            )
+            return [
+                remote_id for remote_id in remote_ids if remote_id is not None
+            ]
+
+        return self.writer.submit(write)
+
+    def get_history_sync(self, contact):
+        """
+        Функция возвращающая состояние загрузки истории переписки
+        с контактом с сервера: кортеж (курсор, вся история загружена).
+        """
+
+        sync = self.session.get(self.HistorySync, (self.owner, contact))
+        if sync is None:
+            return None, False
+        return sync.cursor, sync.complete
+
+    def get_newest_server_id(self, contact):
+        """
+        Функция возвращающая наибольший id в истории сервера
+        сообщений переписки с контактом, None - таких сообщений нет.
+        """
+
+        message = self.Message
+        return self.session.execute(
+            select(func.max(message.server_id)).where(
+                message.owner == self.owner,
+                (message.from_user == contact) | (message.to_user == contact),
+            )
+        ).scalar()
+
+    def save_history(self, contact, messages, cursor=None, complete=None):
+        """
+        Функция сохранения страницы истории переписки с контактом,
+        полученной с сервера, одной транзакцией. Сообщения, уже
+        сохранённые в базе (по id в истории сервера), пропускаются.
+        Если complete не None, в той же транзакции сохраняется
+        состояние загрузки: курсор следующей страницы и признак
+        загрузки всей истории. Возвращает Future с количеством
+        добавленных сообщений.
+        """
+
+        table = self.Message.__table__
+
+        def write(session):
+            added = 0
+            if messages:
+                result = session.execute(
+                    table.insert().prefix_with("OR IGNORE"),
+                    [
+                        {
+                            "owner": self.owner,
+                            "from_user": message["from"],
+                            "to_user": message["to"],
+                            "message": message["message"],
+                            "date_time": datetime.utcfromtimestamp(
+                                message["time"]
+                            ),
+                            "status": MESSAGE_DELIVERED,
+                            "server_id": message["id"],
+                        }
+                        for message in messages
+                    ],
+                )
+                added = result.rowcount
+            if complete is not None:
+                session.merge(
+                    self.HistorySync(
+                        owner=self.owner,
+                        contact=contact,
+                        cursor=cursor,
+                        complete=complete,
+                    )
+                )
+            return added
+
+        return self.writer.submit(write)
+
+    def get_outbox(self):
+        """
+        Функция возвращающая неотправленные исходящие сообщения
+        (статусы pending и failed) в порядке создания.
+        """
+
+        query = (
+            self.session.query(
+                self.Message.id, self.Message.to_user, self.Message.message
+            )
+            .filter_by(owner=self.owner, from_user=self.owner)
+            .filter(self.Message.status.in_((MESSAGE_PENDING, MESSAGE_FAILED)))
+            .order_by(self.Message.id)
         )
-        self.session.add(new_message)
-        self.session.commit()
+        return query.all()
 
     def get_contacts(self):
         """Функция возвращающая контакты"""
@@ -148,8 +833,70 @@ class ClientDatabase:
             for history_row in query.all()
         ]
 
+    def get_chat_page(
+        self,
+        contact,
+        before=None,
+        after=None,
+        limit=MAX_HISTORY_MESSAGES_IN_CHAT,
+    ):
+        """
+        Функция возвращающая страницу переписки с контактом в порядке
+        отправки. Курсоры before и after - кортежи (date_time, id):
+        возвращается limit сообщений, предшествующих before или
+        следующих за after, без курсоров - limit последних сообщений.
+        Строки содержат поля id, from_user, to_user, message,
+        date_time и status.
+
+        Входящие и исходящие выбираются отдельными запросами по
+        индексам (owner, from_user, date_time) и (owner, to_user,
+        date_time), поэтому время выборки зависит от размера
+        страницы, а не от размера истории.
+        """
+
+        message = self.Message
+        key = tuple_(message.date_time, message.id)
+        if after is not None:
+            condition = key > tuple_(*after)
+            order = (message.date_time, message.id)
+        else:
+            condition = key < tuple_(*before) if before is not None else None
+            order = (message.date_time.desc(), message.id.desc())
+
+        def branch(*criteria):
+            query = select(
+                message.id,
+                message.from_user,
+                message.to_user,
+                message.message,
+                message.date_time,
+                message.status,
+            ).where(message.owner == self.owner, *criteria)
+            if condition is not None:
+                query = query.where(condition)
+            return query.order_by(*order).limit(limit).subquery().select()
+
+        pages = union_all(
+            branch(message.from_user == contact),
+            branch(
+                and_(message.to_user == contact, message.from_user != contact)
+            ),
+        ).subquery()
+        if after is not None:
+            page_order = (pages.c.date_time, pages.c.id)
+        else:
+            page_order = (pages.c.date_time.desc(), pages.c.id.desc())
+        rows = self.session.execute(
+            select(pages).order_by(*page_order).limit(limit)
+        ).all()
+        return rows if after is not None else rows[::-1]
+
     def get_messages_by_in_out(self, contact):
-        """Функция возвращающая историю переписки, входящие и исходящие"""
+        """
+        Функция возвращающая историю переписки, входящие и исходящие,
+        со статусом доставки сообщения.
+        """
+
         query = self.session.query(self.Message).filter(
             (self.Message.owner == self.owner)
         )
@@ -164,19 +911,49 @@ class ClientDatabase:
                 history_row.to_user,
                 history_row.message,
                 history_row.date_time,
+                history_row.status,
             ]
             for history_row in query.limit(MAX_HISTORY_MESSAGES_IN_CHAT).all()[
                 ::-1
             ]
         ]
         for message in messages:
+            status = message.pop()
             if message[0] == self.owner:
                 message.append("out")
             else:
                 message.append("in")
+            message.append(status)
 
         return messages
 
 
+class SearchIndexBuilder(threading.Thread):
+    """
+    Класс - поток фонового индексирования сообщений, сохранённых
+    до создания полнотекстового индекса. Индексирует пачками
+    через поток записи базы, между пачками делает паузу.
+    """
+
+    def __init__(self, database, pause=0.05):
+        super().__init__(daemon=True)
+        self.database = database
+        self.pause = pause
+        self.running = True
+
+    def run(self):
+        """Метод содержащий основной цикл потока индексирования."""
+        while self.running:
+            done = self.database.build_search_index()
+            if done:
+                logger.debug("Search index is up to date")
+                break
+            time.sleep(self.pause)
+
+    def stop(self):
+        """Метод остановки потока индексирования."""
+        self.running = False
+
+
 if __name__ == "__main__":
     pass
@@ -0,0 +1,571 @@
+import errno
+import json
+import logging
+import queue
+import socket
+import threading
+import time
+from json import JSONDecodeError
+
+import log.client_log_config  # noqa
+from app_utils import settings
+from app_utils.errors import ServerError
+from app_utils.utils import JsonFrameDecoder, id_ranges
+from log.client_log_config import LOGGER_NAME
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+class ClientProtocol:
+    """
+    Класс - сообщения протокола клиента и разбор ответов сервера.
+    Не выполняет ввода-вывода, используется блокирующим (ClientCore)
+    и асинхронным (AsyncClientCore) клиентами.
+    """
+
+    def __init__(self, username, password):
+        # Имя пользователя и пароль который подключается к серверу (owner)
+        self.username = username
+        self.password = password
+
+    def create_presence(self):
+        """Создание presence сообщения"""
+        msg = {
+            "action": "presence",
+            "time": time.time(),
+            "type": "status",
+            "user": {
+                "account_name": self.username,
+                "status": "Yep, I am here!",
+            },
+        }
+        logger.debug("Presence created: %s", msg)
+        return msg
+
+    def create_authenticate(self):
+        """Создание сообщения аутентификации"""
+        return {
+            "action": "authenticate",
+            "time": time.time(),
+            "user": {"account_name": self.username, "password": self.password},
+        }
+
+    def create_contacts_request(self):
+        """Создание запроса списка контактов"""
+        return {
+            "action": "get_contacts",
+            "time": time.time(),
+            "user_login": self.username,
+        }
+
+    def create_contacts_since_request(self, version):
+        """
+        Создание запроса изменений списка контактов после версии
+        version, 0 - запрос полного списка.
+        """
+
+        return {
+            "action": "get_contacts_since",
+            "time": time.time(),
+            "user_login": self.username,
+            "version": version,
+        }
+
+    def create_history_request(
+        self, contact, cursor=None, limit=None, pages=1
+    ):
+        """
+        Создание запроса истории переписки с контактом, хранимой
+        на сервере: pages страниц по limit сообщений, начиная
+        с курсора cursor (None - с последнего сообщения).
+        """
+
+        request = {
+            "action": "get_history",
+            "time": time.time(),
+            "user_login": self.username,
+            "contact": contact,
+            "pages": pages,
+        }
+        if cursor is not None:
+            request["cursor"] = cursor
+        if limit is not None:
+            request["limit"] = limit
+        return request
+
+    def create_presence_subscription(self, contacts=None):
+        """
+        Создание запроса подписки на вход и выход контактов,
+        contacts - список контактов (None - все контакты).
+        """
+
+        request = {
+            "action": "subscribe_presence",
+            "time": time.time(),
+            "user_login": self.username,
+        }
+        if contacts is not None:
+            request["contacts"] = list(contacts)
+        return request
+
+    def create_contact_message(self, action, contact):
+        """Создание запроса добавления или удаления контакта"""
+        return {
+            "action": action,
+            "time": time.time(),
+            "user_id": self.username,
+            "user_login": contact,
+        }
+
+    def create_user_message(self, message, to_user, msg_id=None):
+        """
+        Метод создания сообщения для отправки пользователю.
+        Если указан msg_id, сервер подтверждает доставку сообщения
+        ответом с этим идентификатором, а получатель отправляет
+        уведомления о получении и прочтении (receipt).
+        """
+
+        message_dict = {
+            "action": "msg",
+            "time": time.time(),
+            "from": self.username,
+            "message": message,
+            "to": to_user,
+        }
+        if msg_id is not None:
+            message_dict["msg_id"] = msg_id
+        logger.debug("Message dict created: %s", message_dict)
+        return message_dict
+
+    def create_receipt(self, status, receipts):
+        """
+        Создание уведомления о получении или прочтении сообщений,
+        receipts - {"отправитель": [msg_id, ...]}, id сворачиваются
+        в диапазоны.
+        """
+
+        return {
+            "action": "receipt",
+            "time": time.time(),
+            "user_login": self.username,
+            "status": status,
+            "receipts": {
+                sender: id_ranges(ids) for sender, ids in receipts.items()
+            },
+        }
+
+    def create_quit_message(self):  # noqa
+        """Метод создания сообщения для отключения от сервера"""
+        message_dict = {
+            "action": "quit",
+            "time": time.time(),
+        }
+        logger.debug("Message dict created: %s", message_dict)
+        return message_dict
+
+    def check_response(self, data, expected=200):
+        """
+        Метод проверки ответа сервера, при коде ответа отличном
+        от expected вызывает исключение ServerError.
+        """
+
+        if data and "response" in data:
+            if data["response"] == expected:
+                return data
+            raise ServerError(f"{data['response']}, {data.get('error')}")
+        raise ServerError(f"Can't decode server answer {data}")
+
+    def is_user_message(self, message):
+        """Метод проверяет, что сообщение - чат-сообщение для клиента."""
+        return (
+            "action" in message
+            and message["action"] == "msg"
+            and "from" in message
+            and "message" in message
+            and "to" in message
+            and message["to"] == self.username
+        )
+
+    def is_presence(self, message):
+        """
+        Метод проверяет, что сообщение - изменение присутствия
+        контактов (поля online и offline - списки имён).
+        """
+
+        return (
+            "action" in message
+            and message["action"] == "presence_update"
+            and "online" in message
+            and "offline" in message
+        )
+
+    def is_receipt(self, message):
+        """
+        Метод проверяет, что сообщение - уведомления о получении
+        и прочтении отправленных сообщений (поле receipts).
+        """
+
+        return (
+            "action" in message
+            and message["action"] == "receipt"
+            and "receipts" in message
+        )
+
+    def is_ack(self, message):
+        """Метод проверяет, что сообщение - ответ на сообщение с msg_id."""
+        return "response" in message and "msg_id" in message
+
+
+class ClientCore(ClientProtocol):
+    """
+    Класс - клиент мессенджера без графического интерфейса.
+    Блокирующий API: подключение и аутентификация, отправка сообщений,
+    работа с контактами. Входящие чат-сообщения передаются в функцию
+    on_message, потеря соединения - в функцию on_connection_lost,
+    ответы на сообщения с msg_id (подтверждения) - в функцию on_ack,
+    изменения присутствия контактов подписки (subscribe_presence) -
+    в функцию on_presence, уведомления о получении и прочтении
+    отправленных сообщений - в функцию on_receipt.
+
+    Метод run - цикл приёма, выполняемый в отдельном потоке: он
+    блокируется на чтении сокета и обрабатывает сообщения сразу
+    по приходу данных. Пока цикл приёма работает, ответы сервера
+    передаются ожидающему запросу через очередь responses. Ответы
+    на сообщения с msg_id в очередь responses не попадают.
+    """
+
+    # Время ожидания ответа сервера на запрос
+    response_timeout = 5
+
+    def __init__(
+        self,
+        ip_address,
+        port,
+        username,
+        password,
+        on_message=None,
+        on_connection_lost=None,
+        on_ack=None,
+        on_presence=None,
+        on_receipt=None,
+    ):
+        super().__init__(username, password)
+        self.server_ip = ip_address
+        self.server_port = port
+        self.on_message = on_message
+        self.on_connection_lost = on_connection_lost
+        self.on_ack = on_ack
+        self.on_presence = on_presence
+        self.on_receipt = on_receipt
+        # Сокет для работы с сервером
+        self.sock = None
+        self.decoder = JsonFrameDecoder()
+        self.frames = []
+        # Блокировка запросов: запрос и ответ не должны перемешиваться
+        self.lock = threading.RLock()
+        # Ответы сервера для ожидающего запроса, заполняет цикл приёма
+        self.responses = queue.Queue()
+        # Признак ожидания ответа на запрос
+        self.waiting = False
+        # Признак работы цикла приёма в отдельном потоке
+        self.reader_active = False
+        # Событие запуска цикла приёма: после него запросы из других
+        # потоков получают ответы через очередь responses
+        self.reader_started = threading.Event()
+        # Флаг продолжения работы цикла приёма сообщений
+        self.running = False
+
+    def connect(self):
+        """
+        Метод установки соединения с сервером и аутентификации.
+        При ошибке соединения вызывает ConnectionError,
+        при отказе сервера - ServerError.
+        """
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Таймаут необходим для освобождения сокета.
+        self.sock.settimeout(3)
+        try:
+            self.sock.connect((self.server_ip, self.server_port))
+        except OSError:
+            logger.critical("Не удалось установить соединение с сервером")
+            raise ConnectionError(
+                "Не удалось установить соединение с сервером"
+            )
+        logger.debug("Установлено соединение с сервером")
+
+        with self.lock:
+            msg = self.create_presence()
+            logger.debug("Sent data to server: %s", msg)
+            self.send_data(msg)
+            answer = self.receive_data()
+            if answer and answer.get("response") == 401:
+                logger.debug("Need authenticate")
+                self.send_data(self.create_authenticate())
+                answer = self.receive_data()
+            self.check_response(answer)
+            logger.debug("Authenticated successfully")
+        self.running = True
+
+    def send_data(self, data):
+        """Функция отправки данных в сокет"""
+        js_message = json.dumps(data)
+        self.sock.sendall(js_message.encode(settings.ENCODING_VAR))
+
+    def receive_data(self):
+        """
+        Получение одного сообщения из сокета.
+        Возвращает None, если сервер закрыл соединение.
+        """
+
+        while not self.frames:
+            data = self.sock.recv(settings.MAX_DATA_LENGTH)
+            if not data:
+                return None
+            self.frames.extend(self.decoder.feed(data))
+        return self.frames.pop(0)
+
+    def wait_response(self, timeout=None):
+        """
+        Метод ожидания ответа сервера. Если работает цикл приёма,
+        ответ берётся из очереди responses, иначе читается из сокета.
+        По истечении timeout вызывает socket.timeout.
+        """
+
+        if timeout is None:
+            timeout = self.response_timeout
+        if not self.reader_active:
+            while True:
+                answer = self.receive_data()
+                if answer is None or not self.is_ack(answer):
+                    return answer
+                self.handle_ack(answer)
+        try:
+            answer = self.responses.get(timeout=timeout)
+        except queue.Empty:
+            raise socket.timeout("timed out")
+        if answer is None:
+            raise ConnectionResetError(
+                errno.ECONNRESET, "Server closed connection"
+            )
+        return answer
+
+    def handle_ack(self, message):
+        """
+        Метод обработки ответа на сообщение с msg_id: ответ передаётся
+        в on_ack, ошибка без on_ack записывается в лог.
+        """
+
+        if self.on_ack:
+            self.on_ack(message)
+        elif message["response"] != 200:
+            logger.error("Response from server: %s", message)
+
+    def start_waiting(self):
+        """Метод подготовки к ожиданию ответа: сброс устаревших ответов."""
+        while not self.responses.empty():
+            self.responses.get_nowait()
+        self.waiting = True
+
+    def request(self, message, expected=200, timeout=None):
+        """Метод отправки запроса и получения ответа сервера."""
+        with self.lock:
+            logger.debug("Request to server %s", message)
+            self.start_waiting()
+            try:
+                self.send_data(message)
+                answer = self.wait_response(timeout)
+            finally:
+                self.waiting = False
+        logger.debug("Answer from server %s", answer)
+        return self.check_response(answer, expected)
+
+    def get_contacts(self):
+        """Метод получения списка контактов с сервера."""
+        answer = self.request(self.create_contacts_request(), 202)
+        return answer["alert"]
+
+    def get_contacts_since(self, version):
+        """
+        Метод получения изменений списка контактов после версии
+        version. Возвращает ответ сервера с полями version, full,
+        added и deleted.
+        """
+
+        return self.request(self.create_contacts_since_request(version), 202)
+
+    def get_history(self, contact, cursor=None, limit=None, pages=1):
+        """
+        Метод получения истории переписки с контактом, хранимой
+        на сервере. Сервер отправляет до pages страниц подряд,
+        метод возвращает их списком. Страница - ответ сервера
+        с полями messages (от новых сообщений к старым; id, from,
+        to, message, time) и cursor - курсор следующей страницы,
+        None - история закончилась.
+        """
+
+        pages_list = []
+        with self.lock:
+            logger.debug("History request for %s", contact)
+            self.start_waiting()
+            try:
+                self.send_data(
+                    self.create_history_request(contact, cursor, limit, pages)
+                )
+                while True:
+                    answer = self.check_response(self.wait_response(), 202)
+                    pages_list.append(answer)
+                    if answer.get("last", True):
+                        break
+            finally:
+                self.waiting = False
+        return pages_list
+
+    def subscribe_presence(self, contacts=None):
+        """
+        Метод подписки на вход и выход контактов (None - всех
+        контактов), повторный вызов заменяет подписку. Возвращает
+        список подключённых контактов, дальнейшие изменения
+        передаются в on_presence.
+        """
+
+        answer = self.request(self.create_presence_subscription(contacts), 202)
+        return answer["online"]
+
+    def add_contact(self, contact):
+        """Метод добавления пользователя в контакт лист на сервере"""
+        self.request(self.create_contact_message("add_contact", contact))
+
+    def delete_contact(self, contact):
+        """Метод удаления пользователя из списка контактов на сервере"""
+        self.request(self.create_contact_message("del_contact", contact))
+
+    def send_message(self, to_user, message, timeout=0, msg_id=None):
+        """
+        Метод отправки чат-сообщения пользователю.
+        Без msg_id сервер отвечает только на ошибку (например,
+        неизвестный пользователь), поэтому при timeout > 0 метод ждёт
+        ответ не дольше timeout секунд и вызывает socket.timeout,
+        если ошибки не было. Сообщение с msg_id отправляется без
+        ожидания, ответ сервера передаётся в on_ack.
+        """
+
+        with self.lock:
+            if not timeout or msg_id is not None:
+                self.send_data(
+                    self.create_user_message(message, to_user, msg_id)
+                )
+                return
+            self.start_waiting()
+            try:
+                self.send_data(self.create_user_message(message, to_user))
+                answer = self.wait_response(timeout)
+            finally:
+                self.waiting = False
+        if answer is None:
+            raise ConnectionResetError(
+                errno.ECONNRESET, "Server closed connection"
+            )
+        self.dispatch(answer)
+
+    def send_receipts(self, status, receipts):
+        """
+        Метод отправки уведомления о получении (RECEIPT_RECEIVED)
+        или прочтении (RECEIPT_READ) сообщений, receipts -
+        {"отправитель": [msg_id, ...]}. Сервер отвечает только
+        на ошибку.
+        """
+
+        with self.lock:
+            self.send_data(self.create_receipt(status, receipts))
+
+    def dispatch(self, message):
+        """
+        Метод обработки сообщения, полученного вне запроса.
+        Чат-сообщения передаются в on_message, ответы с ошибкой
+        вызывают ServerError.
+        """
+
+        logger.debug("Разбор сообщения от сервера: %s", message)
+        if self.is_user_message(message):
+            if self.on_message:
+                self.on_message(message)
+        elif self.is_presence(message):
+            if self.on_presence:
+                self.on_presence(message)
+        elif self.is_receipt(message):
+            if self.on_receipt:
+                self.on_receipt(message)
+        elif "response" in message and message["response"] == 200:
+            return
+        elif "response" in message and message["response"] == 400:
+            logger.error("Response from server: %s", message)
+            raise ServerError(f"Response from server: {message}")
+        else:
+            logger.error("Can't decode message from server %s", message)
+
+    def connection_lost(self):
+        """Метод обработки потери соединения."""
+        logger.critical("Потеряно соединение с сервером.")
+        self.running = False
+        if self.on_connection_lost:
+            self.on_connection_lost()
+
+    def run(self):
+        """
+        Метод содержащий основной цикл приёма сообщений с сервера.
+        Блокируется на чтении сокета, чат-сообщения передаются
+        в on_message сразу по получении.
+        """
+
+        logger.debug("Запущен процесс - приёмник сообщений с сервера.")
+        self.sock.settimeout(None)
+        self.reader_active = True
+        self.reader_started.set()
+        try:
+            while self.running:
+                try:
+                    message = self.receive_data()
+                except socket.timeout:
+                    continue
+                except (OSError, JSONDecodeError):
+                    message = None
+                if message is None:
+                    if self.running:
+                        self.connection_lost()
+                    break
+                logger.debug("Принято сообщение с сервера: %s", message)
+                if self.is_user_message(message):
+                    if self.on_message:
+                        self.on_message(message)
+                elif self.is_ack(message):
+                    self.handle_ack(message)
+                elif self.is_presence(message):
+                    if self.on_presence:
+                        self.on_presence(message)
+                elif self.is_receipt(message):
+                    if self.on_receipt:
+                        self.on_receipt(message)
+                elif self.waiting:
+                    self.responses.put(message)
+                else:
+                    try:
+                        self.dispatch(message)
+                    except ServerError:
+                        pass
+        finally:
+            self.reader_active = False
+            # Разблокируем запрос, ожидающий ответа
+            self.responses.put(None)
+
+    def close(self):
+        """Метод закрытия подключения клиента"""
+        self.running = False
+        with self.lock:
+            try:
+                self.send_data(self.create_quit_message())
+                # Прерываем блокирующее чтение в цикле приёма
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        logger.debug("Транспорт завершает работу.")
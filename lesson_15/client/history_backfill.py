@@ -0,0 +1,134 @@
+import logging
+import threading
+
+from app_utils import settings
+from app_utils.errors import ServerError
+from log.client_log_config import LOGGER_NAME
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+class HistoryBackfill(threading.Thread):
+    """
+    Класс - поток загрузки в базу клиента истории переписки
+    с контактами, хранимой на сервере (действие get_history).
+    Работает в фоне и не блокирует графический интерфейс.
+
+    История загружается от новых сообщений к старым, сервер
+    отправляет на каждый запрос до pages страниц подряд. Каждая
+    страница сохраняется одной транзакцией вместе с курсором
+    следующей страницы, поэтому прерванная загрузка продолжается
+    при следующем запуске. После полной загрузки при запуске
+    загружаются только сообщения новее последнего сохранённого.
+    Сообщения, уже сохранённые в базе, пропускаются по id
+    в истории сервера. После загрузки новых сообщений переписки
+    вызывается функция on_loaded с именем контакта.
+    """
+
+    # Время ожидания запуска цикла приёма клиента (секунды)
+    reader_timeout = 10
+
+    def __init__(
+        self,
+        core,
+        database,
+        database_lock,
+        on_loaded=None,
+        pages=settings.HISTORY_STREAM_PAGES,
+    ):
+        super().__init__(daemon=True)
+        # Клиент (ClientCore), через который запрашивается история
+        self.core = core
+        self.database = database
+        self.database_lock = database_lock
+        self.on_loaded = on_loaded
+        self.pages = pages
+        self.running = True
+
+    def run(self):
+        """Метод содержащий основной цикл потока загрузки."""
+        # Ответы сервера принимает цикл приёма клиента
+        if not self.core.reader_started.wait(self.reader_timeout):
+            return
+        with self.database_lock:
+            contacts = self.database.get_contacts()
+        for contact in contacts:
+            if not self.running:
+                break
+            try:
+                added = self.backfill(contact)
+            except ServerError as e:
+                # Сервер не хранит историю
+                logger.debug("History not available: %s", e)
+                break
+            except OSError as e:
+                logger.error("History backfill stopped: %s", e)
+                break
+            logger.debug("History of %s: %s messages loaded", contact, added)
+            if added and self.on_loaded:
+                self.on_loaded(contact)
+
+    def backfill(self, contact):
+        """
+        Метод загрузки истории переписки с контактом,
+        возвращает количество добавленных сообщений.
+        """
+
+        with self.database_lock:
+            cursor, complete = self.database.get_history_sync(contact)
+            newest = self.database.get_newest_server_id(contact)
+        added = 0
+        if complete or cursor is not None:
+            added += self.fetch_newer(contact, newest)
+        if not complete:
+            added += self.fetch_older(contact, cursor)
+        return added
+
+    def fetch_newer(self, contact, newest):
+        """
+        Метод загрузки сообщений новее сообщения newest (id в истории
+        сервера), None - загрузка всей истории.
+        """
+
+        added = 0
+        cursor = None
+        while self.running:
+            for page in self.core.get_history(
+                contact, cursor, pages=self.pages
+            ):
+                added += self.database.save_history(
+                    contact, page["messages"]
+                ).result()
+                cursor = page["cursor"]
+                if cursor is None or (
+                    newest is not None
+                    and any(item["id"] <= newest for item in page["messages"])
+                ):
+                    return added
+        return added
+
+    def fetch_older(self, contact, cursor):
+        """
+        Метод продолжения загрузки истории со страницы cursor
+        (None - с последнего сообщения) до начала переписки.
+        """
+
+        added = 0
+        while self.running:
+            for page in self.core.get_history(
+                contact, cursor, pages=self.pages
+            ):
+                cursor = page["cursor"]
+                added += self.database.save_history(
+                    contact,
+                    page["messages"],
+                    cursor=cursor,
+                    complete=cursor is None,
+                ).result()
+                if cursor is None:
+                    return added
+        return added
+
+    def stop(self):
+        """Метод остановки потока загрузки."""
+        self.running = False
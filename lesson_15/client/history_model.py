@@ -0,0 +1,284 @@
+from collections import deque
+
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt
+from PyQt5.QtGui import QBrush, QColor
+
+from app_utils.settings import (
+    HISTORY_MODEL_CAPACITY,
+    MAX_HISTORY_MESSAGES_IN_CHAT,
+)
+from app_utils.utils import datetime_from_utc_to_local
+from client.client_database import (
+    MESSAGE_DELIVERED,
+    MESSAGE_FAILED,
+    MESSAGE_PENDING,
+    MESSAGE_READ,
+    MESSAGE_RECEIVED,
+)
+
+# Подписи статусов доставки исходящих сообщений
+MESSAGE_STATUS_LABELS = {
+    MESSAGE_PENDING: " (отправляется)",
+    MESSAGE_DELIVERED: " (отправлено)",
+    MESSAGE_FAILED: " (не доставлено)",
+    MESSAGE_RECEIVED: " (доставлено)",
+    MESSAGE_READ: " (прочитано)",
+}
+
+# Цвета фона входящих и исходящих сообщений
+INCOMING_BRUSH = QBrush(QColor(255, 213, 213))
+OUTGOING_BRUSH = QBrush(QColor(204, 255, 204))
+
+
+class HistoryRow:
+    """Класс - сообщение переписки, подготовленное для отображения."""
+
+    __slots__ = (
+        "msg_id",
+        "incoming",
+        "cursor",
+        "date_time",
+        "message",
+        "roles",
+    )
+
+    def __init__(self, msg_id, incoming, date_time, message, status):
+        self.msg_id = msg_id
+        self.incoming = incoming
+        # Позиция сообщения для постраничной выборки (date_time, id)
+        self.cursor = (date_time, msg_id)
+        # Перевод времени в локальное выполняется один раз
+        self.date_time = datetime_from_utc_to_local(date_time)
+        self.message = message
+        self.set_status(status)
+
+    @property
+    def text(self):
+        return self.roles[Qt.DisplayRole]
+
+    def set_status(self, status):
+        """
+        Метод формирования данных для отображения с учётом статуса.
+        Данные всех ролей вычисляются заранее: представление
+        запрашивает их для каждой строки при каждой перерисовке.
+        """
+
+        if self.incoming:
+            self.roles = {
+                Qt.DisplayRole: (
+                    f"Входящее от {self.date_time}:\n {self.message}"
+                ),
+                Qt.BackgroundRole: INCOMING_BRUSH,
+                Qt.TextAlignmentRole: Qt.AlignLeft,
+            }
+        else:
+            self.roles = {
+                Qt.DisplayRole: (
+                    f"Исходящее от {self.date_time}"
+                    f"{MESSAGE_STATUS_LABELS.get(status, '')}:"
+                    f"\n {self.message}"
+                ),
+                Qt.BackgroundRole: OUTGOING_BRUSH,
+                Qt.TextAlignmentRole: Qt.AlignRight,
+            }
+
+
+class HistoryModel(QAbstractListModel):
+    """
+    Класс - модель истории переписки с текущим собеседником.
+
+    Сообщения хранятся в кольцевом буфере ёмкостью capacity:
+    новые сообщения добавляются в конец (beginInsertRows) без
+    перестроения модели, при переполнении удаляются самые старые.
+    Более старые страницы загружаются из базы методом fetch_older,
+    когда пользователь прокручивает историю вверх. После перехода
+    к найденному сообщению (show_message) загружается окно вокруг
+    него, более новые страницы подгружаются при прокрутке вниз.
+    """
+
+    def __init__(
+        self,
+        database,
+        database_lock,
+        page_size=MAX_HISTORY_MESSAGES_IN_CHAT,
+        capacity=HISTORY_MODEL_CAPACITY,
+        parent=None,
+    ):
+        super().__init__(parent)
+        self.database = database
+        self.database_lock = database_lock
+        self.page_size = page_size
+        self.capacity = capacity
+        self.contact = None
+        self.rows = deque()
+        # В базе есть сообщения старше или новее загруженных
+        self.has_older = False
+        self.has_newer = False
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.rows):
+            return None
+        return self.rows[index.row()].roles.get(role)
+
+    def make_rows(self, messages):
+        """Метод преобразования строк базы в строки модели."""
+        return [
+            HistoryRow(
+                msg_id=message.id,
+                incoming=message.from_user == self.contact,
+                date_time=message.date_time,
+                message=message.message,
+                status=message.status,
+            )
+            for message in messages
+        ]
+
+    def load_page(self, limit=None, **kwargs):
+        """Метод загрузки страницы переписки из базы."""
+        with self.database_lock:
+            return self.database.get_chat_page(
+                self.contact, limit=limit or self.page_size, **kwargs
+            )
+
+    def set_contact(self, contact):
+        """
+        Метод смены собеседника: загружает последнюю страницу
+        переписки, None - очищает модель.
+        """
+
+        self.beginResetModel()
+        self.contact = contact
+        self.rows.clear()
+        self.has_older = False
+        self.has_newer = False
+        if contact is not None:
+            messages = self.load_page()
+            self.rows.extend(self.make_rows(messages))
+            self.has_older = len(messages) == self.page_size
+        self.endResetModel()
+
+    def show_message(self, contact, cursor):
+        """
+        Метод перехода к сообщению с курсором (date_time, id):
+        загружает половину страницы до него и страницу начиная
+        с него. Возвращает номер строки сообщения или None.
+        """
+
+        date_time, msg_id = cursor
+        self.beginResetModel()
+        self.contact = contact
+        self.rows.clear()
+        half = max(1, self.page_size // 2)
+        older = self.load_page(before=cursor, limit=half)
+        newer = self.load_page(after=(date_time, msg_id - 1))
+        self.rows.extend(self.make_rows(older))
+        self.rows.extend(self.make_rows(newer))
+        self.has_older = len(older) == half
+        self.has_newer = len(newer) == self.page_size
+        self.endResetModel()
+        for position, row in enumerate(self.rows):
+            if row.msg_id == msg_id:
+                return position
+        return None
+
+    def fetch_newer(self, pages=None):
+        """
+        Метод добавления в конец модели сообщений, следующих за
+        последним загруженным: не более pages страниц, None - все.
+        Возвращает количество добавленных.
+        """
+
+        if self.contact is None:
+            return 0
+        added = 0
+        while pages is None or pages > 0:
+            if self.rows:
+                messages = self.load_page(after=self.rows[-1].cursor)
+            else:
+                messages = self.load_page()
+            rows = self.make_rows(messages)
+            self.has_newer = len(rows) == self.page_size
+            if rows:
+                first = len(self.rows)
+                self.beginInsertRows(
+                    QModelIndex(), first, first + len(rows) - 1
+                )
+                self.rows.extend(rows)
+                self.endInsertRows()
+                added += len(rows)
+            if not self.has_newer:
+                break
+            if pages is not None:
+                pages -= 1
+        self.trim(oldest=True)
+        return added
+
+    def trim(self, oldest):
+        """
+        Метод удаления сообщений сверх capacity: самых старых
+        (oldest) или самых новых.
+        """
+
+        extra = len(self.rows) - self.capacity
+        if extra <= 0:
+            return
+        if oldest:
+            self.beginRemoveRows(QModelIndex(), 0, extra - 1)
+            for _ in range(extra):
+                self.rows.popleft()
+            self.has_older = True
+        else:
+            last = len(self.rows) - 1
+            self.beginRemoveRows(QModelIndex(), last - extra + 1, last)
+            for _ in range(extra):
+                self.rows.pop()
+            self.has_newer = True
+        self.endRemoveRows()
+
+    def can_fetch_newer(self):
+        """Метод проверяет, есть ли в базе не загруженные новые."""
+        return self.contact is not None and self.has_newer
+
+    def can_fetch_older(self):
+        """Метод проверяет, есть ли в базе более старые сообщения."""
+        return self.contact is not None and self.has_older
+
+    def fetch_older(self):
+        """
+        Метод загрузки в начало модели предыдущей страницы переписки.
+        Возвращает количество добавленных сообщений.
+        """
+
+        if not self.can_fetch_older():
+            return 0
+        before = self.rows[0].cursor if self.rows else None
+        messages = self.load_page(before=before)
+        self.has_older = len(messages) == self.page_size
+        if not messages:
+            return 0
+        rows = self.make_rows(messages)
+        self.beginInsertRows(QModelIndex(), 0, len(rows) - 1)
+        self.rows.extendleft(reversed(rows))
+        self.endInsertRows()
+        self.trim(oldest=False)
+        return len(rows)
+
+    def update_status(self, msg_id, status):
+        """
+        Метод обновления статуса доставки сообщения. Поиск идёт
+        с конца: неподтверждённые сообщения обычно последние.
+        """
+
+        for position in range(len(self.rows) - 1, -1, -1):
+            row = self.rows[position]
+            if row.msg_id == msg_id:
+                row.set_status(status)
+                index = self.index(position)
+                self.dataChanged.emit(index, index, [Qt.DisplayRole])
+                return True
+        return False
@@ -1,16 +1,25 @@
 import logging
 
-from PyQt5.QtCore import Qt, pyqtSlot
-from PyQt5.QtGui import QBrush, QColor, QStandardItem, QStandardItemModel
-from PyQt5.QtWidgets import QMainWindow, QMessageBox, qApp
+from PyQt5.QtCore import Qt, QTimer, pyqtSlot
+from PyQt5.QtGui import QBrush, QStandardItem, QStandardItemModel
+from PyQt5.QtWidgets import (
+    QAbstractItemView,
+    QAction,
+    QLineEdit,
+    QMainWindow,
+    QMessageBox,
+    qApp,
+)
 
 from app_utils.errors import ServerError
-from app_utils.utils import datetime_from_utc_to_local
 
 # sys.path.append("../")
 from client.add_contact_dialog import AddContactDialog
 from client.del_contact import DelContactDialog
+from client.history_model import HistoryModel
 from client.main_window_conv import Ui_MainClientWindow
+from client.search_dialog import SearchDialog
+from client.transport import database_lock
 
 logger = logging.getLogger("client")
 
@@ -49,7 +58,6 @@ class ClientMainWindow(QMainWindow):
 
         # Дополнительные требующиеся атрибуты
         self.contacts_model = None
-        self.history_model = None
         self.messages = QMessageBox()
         self.current_chat = None
         self.ui.list_messages.setHorizontalScrollBarPolicy(
@@ -57,6 +65,26 @@ class ClientMainWindow(QMainWindow):
         )
         self.ui.list_messages.setWordWrap(True)
 
+        # Модель истории переписки, более старые сообщения
+        # подгружаются при прокрутке вверх
+        self.scroll_pending = False
+        self.history_model = HistoryModel(database, database_lock, parent=self)
+        self.ui.list_messages.setModel(self.history_model)
+        self.ui.list_messages.verticalScrollBar().valueChanged.connect(
+            self.history_scrolled
+        )
+
+        # Поле поиска по истории сообщений и пункт меню "Поиск"
+        self.search_dialog = None
+        self.search_box = QLineEdit(self)
+        self.search_box.setPlaceholderText("Поиск по истории")
+        self.search_box.returnPressed.connect(self.search_window)
+        self.addToolBar("Поиск").addWidget(self.search_box)
+        self.menu_search = QAction("Поиск", self)
+        self.menu_search.setShortcut("Ctrl+F")
+        self.menu_search.triggered.connect(self.search_box.setFocus)
+        self.ui.menu.insertAction(self.ui.menu_exit, self.menu_search)
+
         # Даблклик по листу контактов отправляется в обработчик
         self.ui.list_contacts.doubleClicked.connect(self.select_active_user)
 
@@ -73,8 +101,7 @@ class ClientMainWindow(QMainWindow):
             "Для выбора получателя дважды кликните на нем в окне контактов."
         )
         self.ui.text_message.clear()
-        if self.history_model:
-            self.history_model.clear()
+        self.history_model.set_contact(None)
 
         # Поле ввода и кнопка отправки неактивны до выбора получателя.
         self.ui.btn_clear.setDisabled(True)
@@ -82,48 +109,77 @@ class ClientMainWindow(QMainWindow):
         self.ui.text_message.setDisabled(True)
 
     # Заполняем историю сообщений.
-    def history_list_update(self):
+    def history_list_update(self, cursor=None):
         """
         Метод заполняющий соответствующий QListView
         историей переписки с текущим собеседником.
+        Если указан курсор (date_time, id) сообщения,
+        история открывается на этом сообщении.
         """
 
-        # Получаем историю, сортированную по дате
-        messages = self.database.get_messages_by_in_out(
-            contact=self.current_chat
-        )
+        if cursor is None:
+            self.history_model.set_contact(self.current_chat)
+            self.ui.list_messages.scrollToBottom()
+        else:
+            row = self.history_model.show_message(self.current_chat, cursor)
+            if row is not None:
+                index = self.history_model.index(row)
+                self.ui.list_messages.setCurrentIndex(index)
+                self.ui.list_messages.scrollTo(
+                    index, QAbstractItemView.PositionAtCenter
+                )
+        # Показанные входящие сообщения отмечаются прочитанными
+        if self.current_chat:
+            self.transport.mark_read(self.current_chat)
         logger.debug(
-            "history_list_update %s for user %s",
-            str(messages),
+            "history_list_update %s messages for user %s",
+            self.history_model.rowCount(),
             self.transport.username,
         )
-        # Если модель не создана, создадим.
-        if not self.history_model:
-            self.history_model = QStandardItemModel()
-            self.ui.list_messages.setModel(self.history_model)
-        # Очистим от старых записей
-        self.history_model.clear()
-        for message in messages:
-            if message[4] == "in":
-                mess = QStandardItem(
-                    f"Входящее от"
-                    f" {datetime_from_utc_to_local(message[3])}:\n {message[2]}"
-                )
-                mess.setEditable(False)
-                mess.setBackground(QBrush(QColor(255, 213, 213)))
-                mess.setTextAlignment(Qt.AlignLeft)
-                self.history_model.appendRow(mess)
-            else:
-                mess = QStandardItem(
-                    f"Исходящее от"
-                    f" {datetime_from_utc_to_local(message[3])}:\n {message[2]}"
-                )
-                mess.setEditable(False)
-                mess.setTextAlignment(Qt.AlignRight)
-                mess.setBackground(QBrush(QColor(204, 255, 204)))
-                self.history_model.appendRow(mess)
+
+    def history_append(self):
+        """
+        Метод добавляющий в историю новые сообщения
+        текущего собеседника без перестроения модели.
+        """
+
+        if self.history_model.can_fetch_newer():
+            # Открыта более ранняя часть переписки, новые сообщения
+            # подгрузятся при прокрутке вниз
+            return
+        if self.history_model.fetch_newer() and not self.scroll_pending:
+            # Прокрутка откладывается до возврата в цикл событий:
+            # пачка сообщений вызывает одну перекомпоновку списка
+            self.scroll_pending = True
+            QTimer.singleShot(0, self.history_scroll_to_bottom)
+
+    def history_scroll_to_bottom(self):
+        """Метод прокрутки истории к последнему сообщению."""
+        self.scroll_pending = False
         self.ui.list_messages.scrollToBottom()
 
+    def history_scrolled(self, value):
+        """
+        Метод обработчик прокрутки истории: при достижении начала
+        списка загружает предыдущую страницу переписки, при
+        достижении конца - следующую, если она не загружена.
+        """
+
+        scroll_bar = self.ui.list_messages.verticalScrollBar()
+        if value == scroll_bar.maximum() and value:
+            if self.history_model.can_fetch_newer():
+                self.history_model.fetch_newer(pages=1)
+            return
+        if value != 0 or not self.history_model.can_fetch_older():
+            return
+        added = self.history_model.fetch_older()
+        if added:
+            # Сохраняем позицию: первым виден прежний верхний элемент
+            self.ui.list_messages.scrollTo(
+                self.history_model.index(added),
+                QAbstractItemView.PositionAtTop,
+            )
+
     # Функция обработчик даблклика по контакту
     def select_active_user(self):
         """Метод обработчик события двойного клика по списку контактов."""
@@ -134,7 +190,7 @@ class ClientMainWindow(QMainWindow):
         self.set_active_user()
 
     # Функция устанавливающая активного собеседника
-    def set_active_user(self):
+    def set_active_user(self, cursor=None):
         """Метод активации чата с собеседником."""
         # Ставим надпись и активируем кнопки
         self.ui.label_new_message.setText(
@@ -145,7 +201,24 @@ class ClientMainWindow(QMainWindow):
         self.ui.text_message.setDisabled(False)
 
         # Заполняем окно историю сообщений по требуемому пользователю.
-        self.history_list_update()
+        self.history_list_update(cursor)
+
+    def search_window(self):
+        """Метод открывающий диалог поиска по истории сообщений."""
+        if not self.search_dialog:
+            self.search_dialog = SearchDialog(
+                self.database, database_lock, self
+            )
+            self.search_dialog.message_selected.connect(
+                self.show_history_message
+            )
+        self.search_dialog.start(self.search_box.text(), self.current_chat)
+
+    @pyqtSlot(str, object)
+    def show_history_message(self, contact, cursor):
+        """Слот перехода к найденному сообщению в переписке."""
+        self.current_chat = contact
+        self.set_active_user(cursor)
 
     # Функция обновляющая контакт лист
     def clients_list_update(self):
@@ -156,9 +229,23 @@ class ClientMainWindow(QMainWindow):
         for i in sorted(contacts_list):
             item = QStandardItem(i)
             item.setEditable(False)
+            self.set_contact_presence(item)
             self.contacts_model.appendRow(item)
         self.ui.list_contacts.setModel(self.contacts_model)
 
+    def set_contact_presence(self, item):
+        """
+        Метод отображения присутствия контакта: подключённые контакты
+        выделяются жирным шрифтом, отключённые - серым цветом.
+        """
+
+        online = item.text() in self.transport.online
+        font = item.font()
+        font.setBold(online)
+        item.setFont(font)
+        item.setForeground(QBrush() if online else QBrush(Qt.gray))
+        item.setToolTip("В сети" if online else "Не в сети")
+
     # Функция добавления контакта
     def add_contact_window(self):
         """Метод создающий окно - диалог добавления контакта"""
@@ -200,6 +287,7 @@ class ClientMainWindow(QMainWindow):
             self.database.add_contact(new_contact)
             new_contact = QStandardItem(new_contact)
             new_contact.setEditable(False)
+            self.set_contact_presence(new_contact)
             self.contacts_model.appendRow(new_contact)
             logger.info(f"Успешно добавлен контакт {new_contact}")
             self.messages.information(
@@ -260,50 +348,14 @@ class ClientMainWindow(QMainWindow):
         self.ui.text_message.clear()
         if not message_text:
             return
-        try:
-            self.transport.transport.settimeout(1)
-            self.transport.sent_message_to_user(
-                msg=message_text, to_user=self.current_chat
-            )
-        except OSError as err:
-            if err.errno:
-                self.messages.critical(
-                    self, "Ошибка", "Потеряно соединение с сервером!"
-                )
-                self.close()
-            else:
-                # Освобождаем сокет по Timeout,
-                # сервер не вернул ошибок значит все хорошо
-
-                self.database.save_message(
-                    from_user=self.transport.username,
-                    to_user=self.current_chat,
-                    message=message_text,
-                )
-                logger.debug(
-                    f"Отправлено сообщение для"
-                    f" {self.current_chat}: {message_text}"
-                )
-                self.history_list_update()
-
-        except (ConnectionResetError, ConnectionAbortedError):
-            self.messages.critical(
-                self, "Ошибка", "Потеряно соединение с сервером!"
-            )
-            self.close()
-        except ServerError as err:
-            self.messages.critical(self, "Ошибка", str(err))
-        else:
-            self.database.save_message(
-                from_user=self.transport.username,
-                to_user=self.current_chat,
-                message=message_text,
-            )
-            logger.debug(
-                f"Отправлено сообщение для"
-                f" {self.current_chat}: {message_text}"
-            )
-            self.history_list_update()
+        # Сообщение сохраняется со статусом "отправляется",
+        # отправку и подтверждение обрабатывает поток outbox
+        self.transport.outbox.send(self.current_chat, message_text)
+        logger.debug(
+            f"Сообщение для {self.current_chat} поставлено в очередь:"
+            f" {message_text}"
+        )
+        self.history_append()
 
     # Слот приёма нового сообщений
     @pyqtSlot(str)
@@ -315,7 +367,8 @@ class ClientMainWindow(QMainWindow):
         При необходимости меняет собеседника.
         """
         if sender == self.current_chat:
-            self.history_list_update()
+            self.history_append()
+            self.transport.mark_read(sender)
         else:
             # Проверим есть ли такой пользователь у нас в контактах:
             if self.database.check_contact(sender):
@@ -353,6 +406,29 @@ class ClientMainWindow(QMainWindow):
                     self.current_chat = sender
                     self.set_active_user()
 
+    # Слот смены статуса исходящего сообщения
+    @pyqtSlot(str, int, str)
+    def message_status(self, contact, msg_id, status):
+        """Слот обновления статуса доставки сообщения в истории."""
+        if contact == self.current_chat:
+            self.history_model.update_status(msg_id, status)
+
+    # Слот загрузки истории переписки с сервера
+    @pyqtSlot(str)
+    def history_loaded(self, contact):
+        """Слот обновления истории после загрузки переписки с сервера."""
+        if contact == self.current_chat:
+            self.history_list_update()
+
+    # Слот изменения присутствия контактов
+    @pyqtSlot()
+    def presence_changed(self):
+        """Слот обновления присутствия контактов в списке контактов."""
+        if self.contacts_model is None:
+            return
+        for row in range(self.contacts_model.rowCount()):
+            self.set_contact_presence(self.contacts_model.item(row))
+
     # Слот потери соединения
     # Выдаёт сообщение об ошибке и завершает работу приложения
     @pyqtSlot()
@@ -370,4 +446,7 @@ class ClientMainWindow(QMainWindow):
     def make_connection(self, trans_obj):
         """Метод обеспечивающий соединение сигналов и слотов."""
         trans_obj.new_message.connect(self.message)
+        trans_obj.message_status.connect(self.message_status)
+        trans_obj.history_loaded.connect(self.history_loaded)
+        trans_obj.presence_changed.connect(self.presence_changed)
         trans_obj.connection_lost.connect(self.connection_lost)
@@ -0,0 +1,277 @@
+import heapq
+import logging
+import threading
+import time
+
+from app_utils import settings
+from client.client_database import (
+    MESSAGE_DELIVERED,
+    MESSAGE_FAILED,
+    MESSAGE_PENDING,
+)
+from log.client_log_config import LOGGER_NAME
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+class Outbox(threading.Thread):
+    """
+    Класс - очередь исходящих сообщений клиента.
+
+    Сообщение сохраняется в базу со статусом pending и отправляется
+    фоновым потоком, поэтому отправка не блокирует графический
+    интерфейс. В качестве msg_id используется id строки в базе.
+    Подтверждение сервера (ответ 200 с msg_id) меняет статус
+    на delivered. Сообщение, отклонённое сервером или оставшееся без
+    подтверждения ack_timeout секунд, отправляется повторно через
+    retry_delay секунд (задержка удваивается с каждой попыткой),
+    после max_attempts попыток получает статус failed.
+    Сообщения со статусами pending и failed загружаются из базы
+    при запуске и отправляются заново.
+
+    Уведомления о получении и прочтении входящих сообщений (receipt)
+    накапливаются, пока поток занят отправкой, и уходят одним
+    сообщением на статус. Уведомления получателя о своих сообщениях
+    меняют статус на received или read.
+    """
+
+    def __init__(
+        self,
+        core,
+        database,
+        database_lock,
+        on_status=None,
+        ack_timeout=settings.OUTBOX_ACK_TIMEOUT,
+        retry_delay=settings.OUTBOX_RETRY_DELAY,
+        max_attempts=settings.OUTBOX_MAX_ATTEMPTS,
+    ):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        # Клиент (ClientCore), через который отправляются сообщения
+        self.core = core
+        self.database = database
+        self.database_lock = database_lock
+        # Функция, вызываемая при смене статуса сообщения
+        # с аргументами получатель, msg_id и статус
+        self.on_status = on_status
+        self.ack_timeout = ack_timeout
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+
+        self.condition = threading.Condition()
+        # Неподтверждённые сообщения {msg_id: [получатель, текст, попытки]}
+        self.items = {}
+        # Очередь отправки - куча из (время отправки, msg_id)
+        self.schedule = []
+        # Отправленные сообщения {msg_id: срок ожидания подтверждения}
+        self.in_flight = {}
+        # Уведомления к отправке {статус: {"отправитель": [msg_id, ...]}}
+        self.receipts = {}
+        self.running = True
+
+    def load(self):
+        """Метод загрузки неотправленных сообщений из базы."""
+        with self.database_lock:
+            outbox = self.database.get_outbox()
+        now = time.monotonic()
+        with self.condition:
+            for msg_id, to_user, message in outbox:
+                self.items[msg_id] = [to_user, message, 0]
+                heapq.heappush(self.schedule, (now, msg_id))
+            self.condition.notify()
+        logger.debug("Outbox loaded, %s messages", len(outbox))
+
+    def send(self, to_user, message):
+        """
+        Метод постановки сообщения в очередь отправки.
+        Сообщение сохраняется в базу со статусом pending,
+        возвращает msg_id.
+        """
+
+        msg_id = self.database.save_message(
+            from_user=self.core.username,
+            to_user=to_user,
+            message=message,
+            status=MESSAGE_PENDING,
+        ).result()
+        with self.condition:
+            self.items[msg_id] = [to_user, message, 0]
+            heapq.heappush(self.schedule, (time.monotonic(), msg_id))
+            self.condition.notify()
+        return msg_id
+
+    def ack(self, message):
+        """
+        Метод обработки ответа сервера на сообщение с msg_id.
+        Вызывается из потока приёма сообщений.
+        """
+
+        msg_id = message["msg_id"]
+        with self.condition:
+            if self.in_flight.pop(msg_id, None) is None:
+                # Повторное или устаревшее подтверждение
+                return
+            if message["response"] == 200:
+                status = MESSAGE_DELIVERED
+                del self.items[msg_id]
+            else:
+                logger.debug("Message %s rejected: %s", msg_id, message)
+                status = self.retry(msg_id)
+            self.condition.notify()
+        if status:
+            self.set_status(msg_id, status, message.get("history_id"))
+
+    def receipt(self, status, sender, msg_ids):
+        """
+        Метод постановки в очередь уведомления о получении
+        или прочтении входящих сообщений отправителя sender.
+        """
+
+        if not msg_ids:
+            return
+        with self.condition:
+            senders = self.receipts.setdefault(status, {})
+            senders.setdefault(sender, []).extend(msg_ids)
+            self.condition.notify()
+
+    def receipts_received(self, message):
+        """
+        Метод обработки уведомлений сервера о получении и прочтении
+        отправленных сообщений. Вызывается из потока приёма сообщений.
+        Сообщение, полученное до подтверждения сервера, повторно
+        не отправляется.
+        """
+
+        for status, recipients in message["receipts"].items():
+            if status not in settings.RECEIPT_STATUSES:
+                continue
+            for to_user, ranges in recipients.items():
+                with self.condition:
+                    for msg_id in list(self.items):
+                        if self.items[msg_id][0] == to_user and any(
+                            first <= msg_id <= last for first, last in ranges
+                        ):
+                            del self.items[msg_id]
+                            self.in_flight.pop(msg_id, None)
+                self.set_receipts(to_user, status, ranges)
+
+    def set_receipts(self, to_user, status, ranges):
+        """
+        Метод сохранения уведомления в базу без ожидания записи,
+        on_status вызывается для каждого сообщения после записи.
+        """
+
+        def saved(future):
+            if future.exception():
+                return
+            for msg_id in future.result():
+                logger.debug("Message %s status: %s", msg_id, status)
+                if self.on_status:
+                    self.on_status(to_user, msg_id, status)
+
+        self.database.set_receipts(to_user, status, ranges).add_done_callback(
+            saved
+        )
+
+    def retry(self, msg_id):
+        """
+        Метод планирования повторной отправки, вызывается под
+        self.condition. Возвращает MESSAGE_FAILED, если попытки
+        исчерпаны, иначе None.
+        """
+
+        attempts = self.items[msg_id][2]
+        if attempts >= self.max_attempts:
+            del self.items[msg_id]
+            return MESSAGE_FAILED
+        delay = self.retry_delay * 2 ** (attempts - 1)
+        heapq.heappush(self.schedule, (time.monotonic() + delay, msg_id))
+        return None
+
+    def set_status(self, msg_id, status, server_id=None):
+        """
+        Метод сохранения статуса сообщения в базу без ожидания записи,
+        on_status вызывается после записи. server_id - id сообщения
+        в истории сервера из подтверждения.
+        """
+
+        def saved(future):
+            if future.exception():
+                return
+            to_user = future.result()
+            logger.debug("Message %s status: %s", msg_id, status)
+            if to_user and self.on_status:
+                self.on_status(to_user, msg_id, status)
+
+        self.database.set_message_status(
+            msg_id, status, server_id
+        ).add_done_callback(saved)
+
+    def next_messages(self):
+        """
+        Метод ожидания сообщений к отправке, вызывается под
+        self.condition. Сообщения без подтверждения планируются
+        к повторной отправке. Возвращает список msg_id к отправке
+        и список msg_id недоставленных сообщений.
+        """
+
+        while self.running:
+            now = time.monotonic()
+            failed = []
+            for msg_id, deadline in list(self.in_flight.items()):
+                if deadline <= now:
+                    del self.in_flight[msg_id]
+                    logger.debug("Message %s ack timeout", msg_id)
+                    if self.retry(msg_id):
+                        failed.append(msg_id)
+            due = []
+            while self.schedule and self.schedule[0][0] <= now:
+                due.append(heapq.heappop(self.schedule)[1])
+            if due or failed or self.receipts:
+                return due, failed
+            wakeups = list(self.in_flight.values())
+            if self.schedule:
+                wakeups.append(self.schedule[0][0])
+            self.condition.wait(min(wakeups) - now if wakeups else None)
+        return [], []
+
+    def run(self):
+        """Метод содержащий основной цикл потока отправки."""
+        logger.debug("Запущен поток отправки сообщений.")
+        while self.running:
+            with self.condition:
+                due, failed = self.next_messages()
+                messages = []
+                for msg_id in due:
+                    item = self.items[msg_id]
+                    item[2] += 1
+                    self.in_flight[msg_id] = (
+                        time.monotonic() + self.ack_timeout
+                    )
+                    messages.append((msg_id, item[0], item[1]))
+                receipts, self.receipts = self.receipts, {}
+            for msg_id in failed:
+                self.set_status(msg_id, MESSAGE_FAILED)
+            for msg_id, to_user, message in messages:
+                try:
+                    self.core.send_message(to_user, message, msg_id=msg_id)
+                except OSError as err:
+                    # Сообщения остаются в базе со статусом pending
+                    # и будут отправлены при следующем запуске
+                    logger.error("Outbox send error: %s", err)
+                    self.running = False
+                    break
+                logger.debug("Message %s sent to %s", msg_id, to_user)
+            for status, senders in receipts.items():
+                try:
+                    self.core.send_receipts(status, senders)
+                except OSError as err:
+                    logger.error("Outbox receipt error: %s", err)
+                    self.running = False
+                    break
+
+    def stop(self):
+        """Метод остановки потока отправки."""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
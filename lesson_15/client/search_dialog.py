@@ -0,0 +1,115 @@
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtWidgets import (
+    QCheckBox,
+    QDialog,
+    QHBoxLayout,
+    QLabel,
+    QLineEdit,
+    QListWidget,
+    QListWidgetItem,
+    QPushButton,
+    QVBoxLayout,
+)
+
+from app_utils.utils import datetime_from_utc_to_local
+
+
+# Диалог поиска по истории сообщений
+class SearchDialog(QDialog):
+    """
+    Диалог полнотекстового поиска по локальной истории сообщений.
+    Результаты отсортированы по релевантности и загружаются
+    страницами, двойной клик по результату открывает переписку
+    на найденном сообщении (сигнал message_selected).
+    """
+
+    # Сигнал выбора результата: собеседник и курсор (date_time, id)
+    message_selected = pyqtSignal(str, object)
+
+    def __init__(self, database, database_lock, parent=None):
+        super().__init__(parent)
+        self.database = database
+        self.database_lock = database_lock
+        self.contact = None
+        # Курсор следующей страницы результатов
+        self.cursor = None
+
+        self.setWindowTitle("Поиск по истории")
+        self.resize(500, 400)
+
+        self.query = QLineEdit(self)
+        self.query.setPlaceholderText("Слова для поиска")
+        self.query.returnPressed.connect(self.search)
+        self.btn_search = QPushButton("Найти", self)
+        self.btn_search.clicked.connect(self.search)
+        self.only_contact = QCheckBox("Только текущий чат", self)
+        self.status = QLabel(self)
+        self.results = QListWidget(self)
+        self.results.setWordWrap(True)
+        self.results.itemDoubleClicked.connect(self.select)
+        self.btn_more = QPushButton("Ещё", self)
+        self.btn_more.clicked.connect(self.load_more)
+
+        search_row = QHBoxLayout()
+        search_row.addWidget(self.query)
+        search_row.addWidget(self.btn_search)
+        layout = QVBoxLayout(self)
+        layout.addLayout(search_row)
+        layout.addWidget(self.only_contact)
+        layout.addWidget(self.status)
+        layout.addWidget(self.results)
+        layout.addWidget(self.btn_more)
+
+    def start(self, query, contact=None):
+        """Метод открытия диалога и поиска строки query."""
+        self.contact = contact
+        self.only_contact.setEnabled(contact is not None)
+        self.only_contact.setText(
+            f"Только чат с {contact}" if contact else "Только текущий чат"
+        )
+        self.query.setText(query)
+        self.show()
+        self.raise_()
+        self.search()
+
+    def search(self):
+        """Метод поиска с первой страницы результатов."""
+        self.results.clear()
+        self.cursor = None
+        self.load_more()
+
+    def load_more(self):
+        """Метод загрузки следующей страницы результатов."""
+        contact = self.contact if self.only_contact.isChecked() else None
+        with self.database_lock:
+            rows, self.cursor = self.database.search_messages(
+                self.query.text(), contact=contact, cursor=self.cursor
+            )
+            position, boundary = self.database.search_index_progress()
+        for row in rows:
+            if row.from_user == self.database.owner:
+                chat = row.to_user
+            else:
+                chat = row.from_user
+            item = QListWidgetItem(
+                f"{row.from_user} → {row.to_user},"
+                f" {datetime_from_utc_to_local(row.date_time)}:\n"
+                f" {row.snippet}"
+            )
+            item.setData(Qt.UserRole, (chat, (row.date_time, row.id)))
+            self.results.addItem(item)
+        self.btn_more.setEnabled(self.cursor is not None)
+        status = f"Найдено: {self.results.count()}"
+        if self.cursor is not None:
+            status += "+"
+        if position < boundary:
+            status += (
+                f". Индексирование истории:"
+                f" {position * 100 // boundary}%, результаты неполные"
+            )
+        self.status.setText(status)
+
+    def select(self, item):
+        """Метод обработчик выбора результата поиска."""
+        chat, cursor = item.data(Qt.UserRole)
+        self.message_selected.emit(chat, cursor)
@@ -2,8 +2,17 @@ import logging
 import sys
 from os import path
 
+from app_utils.settings import (
+    LOG_CONSOLE_LEVEL,
+    LOG_FILE_LEVEL,
+    LOG_QUEUE_SIZE,
+)
+from log.queue_logging import setup_queue_logging
+
 LOGGER_NAME = "client"
-PATH_TO_LOG = path.join("log", path.join("logs", "client.log"))
+PATH_TO_LOG = path.join(
+    path.dirname(path.abspath(__file__)), "logs", "client.log"
+)
 
 # Создаем объект-логер:
 logger = logging.getLogger(LOGGER_NAME)
@@ -15,18 +24,19 @@ formatter = logging.Formatter(
 
 # Создать файловый обработчик логирования (можно задать кодировку):
 fh = logging.FileHandler(PATH_TO_LOG, encoding="utf-8")
-fh.setLevel(logging.DEBUG)
+fh.setLevel(LOG_FILE_LEVEL)
 fh.setFormatter(formatter)
 
 # Создать обработчик вывода в консоль:
 console = logging.StreamHandler(sys.stderr)
 console.setFormatter(formatter)
-console.setLevel(logging.DEBUG)
+console.setLevel(LOG_CONSOLE_LEVEL)
 
-# Добавить в логгер новый обработчик и установить уровень логирования
-logger.addHandler(fh)
-logger.addHandler(console)
-logger.setLevel(logging.DEBUG)
+# Обработчики работают в отдельном потоке через очередь,
+# логгер только ставит записи в очередь
+queue_handler, listener = setup_queue_logging(
+    logger, (fh, console), LOG_QUEUE_SIZE
+)
 
 
 if __name__ == "__main__":
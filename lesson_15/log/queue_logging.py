@@ -0,0 +1,76 @@
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from queue import Full, Queue
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Обработчик, передающий записи лога в ограниченную очередь.
+    Запись в файл и консоль выполняет поток QueueListener,
+    поэтому вызов logger.debug не ждёт дискового или терминального
+    ввода-вывода. При переполнении очереди запись отбрасывается,
+    а количество отброшенных записей хранится в атрибуте dropped.
+    """
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        # Вызывается из Handler.handle под блокировкой обработчика
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+
+class DropReportingListener(QueueListener):
+    """
+    Слушатель очереди логов. Перед обработкой очередной записи
+    сообщает в свои обработчики о записях, отброшенных
+    при переполнении очереди.
+    """
+
+    def __init__(self, queue, queue_handler, *handlers):
+        super().__init__(queue, *handlers, respect_handler_level=True)
+        self.queue_handler = queue_handler
+        self.reported = 0
+
+    def handle(self, record):
+        dropped = self.queue_handler.dropped
+        if dropped != self.reported:
+            warning = logging.LogRecord(
+                record.name,
+                logging.WARNING,
+                __file__,
+                0,
+                "Log queue overflow, records dropped: %s",
+                (dropped - self.reported,),
+                None,
+            )
+            self.reported = dropped
+            super().handle(warning)
+        super().handle(record)
+
+
+def setup_queue_logging(logger, handlers, queue_size):
+    """
+    Функция подключает обработчики к логгеру через пару
+    QueueHandler/QueueListener с очередью размером queue_size.
+    Уровень логгера выставляется по самому подробному обработчику,
+    чтобы лишние записи не попадали в очередь.
+    Возвращает кортеж (queue_handler, listener).
+    """
+
+    log_queue = Queue(maxsize=queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    listener = DropReportingListener(log_queue, queue_handler, *handlers)
+
+    logger.addHandler(queue_handler)
+    logger.setLevel(min(handler.level for handler in handlers))
+
+    listener.start()
+    # Дописываем оставшиеся в очереди записи при завершении программы
+    atexit.register(listener.stop)
+    return queue_handler, listener
@@ -1,10 +1,27 @@
+import configparser
 import logging
 import sys
 from logging.handlers import TimedRotatingFileHandler
 from os import path
 
+from app_utils.settings import (
+    LOG_CONSOLE_LEVEL,
+    LOG_FILE_LEVEL,
+    LOG_QUEUE_SIZE,
+    SERVER_CONFIG_FILE_NAME,
+)
+from log.queue_logging import setup_queue_logging
+
 LOGGER_NAME = "server"
-PATH_TO_LOG = path.join("log", path.join("logs", "server.log"))
+LOG_DIR = path.dirname(path.abspath(__file__))
+PATH_TO_LOG = path.join(LOG_DIR, "logs", "server.log")
+
+# Уровни логирования и размер очереди читаем из секции LOGGING server.ini
+config = configparser.ConfigParser()
+config.read(path.join(LOG_DIR, "..", SERVER_CONFIG_FILE_NAME))
+if "LOGGING" not in config:
+    config["LOGGING"] = {}
+log_settings = config["LOGGING"]
 
 # Создаем объект-логгер:
 logger = logging.getLogger(LOGGER_NAME)
@@ -19,18 +36,22 @@ formatter = logging.Formatter(
 frh = TimedRotatingFileHandler(
     PATH_TO_LOG, when="D", interval=1, backupCount=7, encoding="utf-8"
 )
-frh.setLevel(logging.DEBUG)
+frh.setLevel(log_settings.get("File_level", LOG_FILE_LEVEL).upper())
 frh.setFormatter(formatter)
 
 # Создать обработчик вывода в консоль:
 console = logging.StreamHandler(sys.stderr)
 console.setFormatter(formatter)
-console.setLevel(logging.DEBUG)
-
-# Добавить в логгер новый обработчик и установить уровень логирования
-logger.addHandler(frh)
-logger.addHandler(console)
-logger.setLevel(logging.DEBUG)
+console.setLevel(log_settings.get("Console_level", LOG_CONSOLE_LEVEL).upper())
+
+# Обработчики работают в отдельном потоке, логгер только ставит
+# записи в очередь, поэтому запись в файл и консоль
+# не задерживает обработку сообщений
+queue_handler, listener = setup_queue_logging(
+    logger,
+    (frh, console),
+    log_settings.getint("Queue_size", LOG_QUEUE_SIZE),
+)
 
 
 if __name__ == "__main__":
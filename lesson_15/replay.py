@@ -0,0 +1,239 @@
+import argparse
+import json
+import socket
+import sys
+import time
+from time import perf_counter
+
+from app_utils.settings import (
+    DEFAULT_SERVER_ADDRESS,
+    DEFAULT_SERVER_PORT,
+    MAX_DATA_LENGTH,
+)
+from app_utils.utils import JsonFrameDecoder, percentile
+from server.traffic_recorder import (
+    DIRECTION_CLOSE,
+    DIRECTION_IN,
+    DIRECTION_OUT,
+    read_capture,
+)
+
+# Количество сохраняемых в отчёте примеров расхождений
+MAX_DIVERGENCE_EXAMPLES = 20
+
+
+def arg_parser():
+    """
+    Парсер аргументов командной строки.
+    Скорость воспроизведения: 1 - как при записи, N - в N раз быстрее,
+    max - без пауз между кадрами.
+    """
+
+    parser = argparse.ArgumentParser(
+        description="Replay recorded traffic against a test server"
+    )
+    parser.add_argument(
+        "captures",
+        nargs="+",
+        help="Capture files, oldest first (traffic.cap.2 traffic.cap.1 ...)",
+    )
+    parser.add_argument("-a", dest="addr", default=DEFAULT_SERVER_ADDRESS)
+    parser.add_argument(
+        "-p", dest="port", default=int(DEFAULT_SERVER_PORT), type=int
+    )
+    parser.add_argument("--speed", default="1", help="1, N or max")
+    parser.add_argument(
+        "--timeout",
+        default=2.0,
+        type=float,
+        help="Seconds to wait for each expected response",
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="Print report as JSON"
+    )
+    namespace = parser.parse_args()
+    if namespace.speed == "max":
+        namespace.speed = 0.0
+    else:
+        try:
+            namespace.speed = float(namespace.speed)
+        except ValueError:
+            parser.error("--speed must be a number or 'max'")
+        if namespace.speed <= 0:
+            parser.error("--speed must be positive")
+    return namespace
+
+
+def normalize(frame):
+    """
+    Функция удаляет из сообщения изменяющиеся от запуска к запуску поля
+    (время), чтобы сравнивать ответы сервера по содержанию.
+    """
+
+    if isinstance(frame, dict):
+        return {
+            key: normalize(value)
+            for key, value in frame.items()
+            if key != "time"
+        }
+    if isinstance(frame, list):
+        return [normalize(value) for value in frame]
+    return frame
+
+
+class ReplayConnection:
+    """Класс - соединение с тестовым сервером для записанного соединения."""
+
+    def __init__(self, address, timeout):
+        self.sock = socket.create_connection(address, timeout=timeout)
+        self.decoder = JsonFrameDecoder()
+        self.frames = []
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def receive_frame(self):
+        """Метод получения одного сообщения, None - по таймауту."""
+        while not self.frames:
+            try:
+                data = self.sock.recv(MAX_DATA_LENGTH)
+            except socket.timeout:
+                return None
+            if not data:
+                return None
+            self.frames.extend(self.decoder.feed(data))
+        return self.frames.pop(0)
+
+    def close(self):
+        self.sock.close()
+
+
+def replay(captures, address, speed, timeout):
+    """
+    Функция воспроизведения записанного трафика.
+    Для каждого записанного соединения открывается своё соединение
+    с сервером, кадры клиентов отправляются в исходном порядке
+    с учётом скорости, а на каждый записанный ответ сервера ожидается
+    ответ тестового сервера. Задержка считается от отправки последнего
+    кадра клиента до получения ответа. Возвращает словарь - отчёт.
+    """
+
+    connections = {}
+    skipped_connections = set()
+    latencies = []
+    divergences = []
+    report = {
+        "connections": 0,
+        "frames_sent": 0,
+        "responses_expected": 0,
+        "responses_received": 0,
+        "divergences": 0,
+    }
+    first_timestamp = None
+    started = perf_counter()
+    last_sent = started
+
+    for timestamp, conn_id, direction, data in read_capture(captures):
+        if first_timestamp is None:
+            first_timestamp = timestamp
+
+        if direction == DIRECTION_IN:
+            if conn_id in skipped_connections:
+                continue
+            if speed:
+                delay = (
+                    started
+                    + (timestamp - first_timestamp) / speed
+                    - perf_counter()
+                )
+                if delay > 0:
+                    time.sleep(delay)
+            connection = connections.get(conn_id)
+            if connection is None:
+                connection = ReplayConnection(address, timeout)
+                connections[conn_id] = connection
+                report["connections"] += 1
+            connection.send(data)
+            last_sent = perf_counter()
+            report["frames_sent"] += 1
+
+        elif direction == DIRECTION_OUT:
+            connection = connections.get(conn_id)
+            if connection is None:
+                # Соединение открыто до начала записи, воспроизвести
+                # его корректно нельзя
+                skipped_connections.add(conn_id)
+                continue
+            report["responses_expected"] += 1
+            expected = json.loads(data)
+            actual = connection.receive_frame()
+            if actual is not None:
+                latencies.append(perf_counter() - last_sent)
+                report["responses_received"] += 1
+            if actual is None or normalize(actual) != normalize(expected):
+                report["divergences"] += 1
+                if len(divergences) < MAX_DIVERGENCE_EXAMPLES:
+                    divergences.append(
+                        {
+                            "connection": conn_id,
+                            "expected": expected,
+                            "actual": actual,
+                        }
+                    )
+
+        elif direction == DIRECTION_CLOSE:
+            connection = connections.pop(conn_id, None)
+            if connection:
+                connection.close()
+
+    for connection in connections.values():
+        connection.close()
+
+    latencies.sort()
+    report["duration"] = perf_counter() - started
+    report["latency_ms"] = {
+        name: (percentile(latencies, fraction) * 1000 if latencies else None)
+        for name, fraction in (
+            ("p50", 0.5),
+            ("p90", 0.9),
+            ("p99", 0.99),
+            ("max", 1.0),
+        )
+    }
+    report["divergence_examples"] = divergences
+    return report
+
+
+def print_report(report):
+    """Функция вывода отчёта в читаемом виде."""
+    print(f"Соединений: {report['connections']}")
+    print(f"Отправлено кадров: {report['frames_sent']}")
+    print(
+        f"Ответов получено: {report['responses_received']}"
+        f" из {report['responses_expected']}"
+    )
+    print(f"Длительность: {report['duration']:.3f} с")
+    for name, value in report["latency_ms"].items():
+        if value is not None:
+            print(f"Задержка {name}: {value:.3f} мс")
+    print(f"Расхождений в ответах: {report['divergences']}")
+    for example in report["divergence_examples"]:
+        print(
+            f"  соединение {example['connection']}:"
+            f" ожидалось {example['expected']}, получено {example['actual']}"
+        )
+
+
+if __name__ == "__main__":
+    args = arg_parser()
+    try:
+        result = replay(
+            args.captures, (args.addr, args.port), args.speed, args.timeout
+        )
+    except (OSError, ValueError) as error:
+        print(error)
+        sys.exit(1)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, default=str))
+    else:
+        print_report(result)
@@ -0,0 +1,306 @@
+import argparse
+import logging
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime
+from itertools import count
+
+from sqlalchemy import select
+
+from log.server_log_config import LOGGER_NAME
+from server.server_database import ServerStorage
+from server.sharded_storage import (
+    DIRECTORY_FILE,
+    STUB_PASSWD_HASH,
+    ShardedStorage,
+    shard_for_name,
+    user_shard_table,
+)
+
+# Размер пачки строк при копировании
+COPY_CHUNK = 10_000
+
+
+def arg_parser():
+    """
+    Парсер аргументов командной строки. Источник - файл базы
+    сервера или каталог хранилища backend = sharded.
+    """
+
+    parser = argparse.ArgumentParser(
+        description="Copy server storage into a new sharded storage"
+    )
+    parser.add_argument("source", help="server_base.db3 or shards directory")
+    parser.add_argument("destination", help="New shards directory")
+    parser.add_argument("--shards", type=int, required=True)
+    parser.add_argument(
+        "--log-level",
+        default="WARNING",
+        help="Server logger level during the copy",
+    )
+    namespace = parser.parse_args()
+    if namespace.shards < 1:
+        parser.error("--shards must be positive")
+    if os.path.exists(os.path.join(namespace.destination, DIRECTORY_FILE)):
+        parser.error(f"{namespace.destination} already contains a storage")
+    if not os.path.exists(namespace.source):
+        parser.error(f"{namespace.source} not found")
+    return namespace
+
+
+def open_source(path):
+    """
+    Функция открытия источника. Возвращает хранилище и список пар
+    (база ServerStorage, функция проверки, что пользователь этой
+    базы не копия контакта из другого сегмента).
+    """
+
+    if os.path.isdir(path):
+        storage = ShardedStorage(path)
+        return storage, [
+            (shard, lambda name, index=index: storage.is_home(index, name))
+            for index, shard in enumerate(storage.shards)
+        ]
+    storage = ServerStorage(path)
+    return storage, [(storage, lambda name: True)]
+
+
+class Resharder:
+    """
+    Класс копирования данных в новое хранилище ShardedStorage.
+    Строки вставляются пачками с новыми идентификаторами,
+    пользователь попадает в сегмент shard_for_name.
+    """
+
+    def __init__(self, destination):
+        self.destination = destination
+        shards = len(destination.shards)
+        self.ids = [count(1) for _ in range(shards)]
+        # Новые (сегмент, id) пользователей и копий контактов
+        self.users = {}
+        self.stubs = {}
+        self.copied = defaultdict(int)
+
+    def insert(self, index, model, rows):
+        """Метод вставки строк rows в таблицу model сегмента index."""
+        if not rows:
+            return
+        shard = self.destination.shards[index]
+        with shard.engine.begin() as connection:
+            connection.execute(model.__table__.insert(), rows)
+        self.copied[model.__tablename__] += len(rows)
+
+    def insert_grouped(self, model, rows):
+        """Метод вставки пар (сегмент, строка) по сегментам."""
+        groups = defaultdict(list)
+        for index, row in rows:
+            groups[index].append(row)
+        for index, group in groups.items():
+            self.insert(index, model, group)
+
+    def copy_users(self, source, is_home):
+        """
+        Метод копирования пользователей источника без копий контактов
+        в сегменты нового хранилища и в его каталог пользователей.
+        """
+
+        user = source.User
+        rows = []
+        added = []
+        with source.ReadSession() as session:
+            for row in session.execute(select(user.__table__)):
+                if not is_home(row.name):
+                    continue
+                index = shard_for_name(row.name, len(self.ids))
+                new_id = next(self.ids[index])
+                self.users[row.name] = (index, new_id)
+                added.append({"name": row.name, "shard": index})
+                rows.append(
+                    (
+                        index,
+                        {
+                            "id": new_id,
+                            "name": row.name,
+                            "last_login": row.last_login,
+                            "passwd_hash": row.passwd_hash,
+                            "contacts_version": row.contacts_version,
+                        },
+                    )
+                )
+        self.insert_grouped(user, rows)
+        if not added:
+            return
+        with self.destination.directory.begin() as connection:
+            connection.execute(user_shard_table.insert(), added)
+        self.destination.user_shards.update(
+            {row["name"]: row["shard"] for row in added}
+        )
+
+    def source_users(self, source):
+        """Метод имён пользователей источника по id."""
+        with source.ReadSession() as session:
+            return dict(
+                session.execute(select(source.User.id, source.User.name)).all()
+            )
+
+    def contact_id(self, index, name):
+        """
+        Метод id контакта name в сегменте index: id пользователя или
+        копии контакта из другого сегмента.
+        """
+
+        home_index, user_id = self.users[name]
+        if home_index == index:
+            return user_id
+        if (index, name) not in self.stubs:
+            stub_id = next(self.ids[index])
+            self.stubs[(index, name)] = stub_id
+            self.insert(
+                index,
+                ServerStorage.User,
+                [
+                    {
+                        "id": stub_id,
+                        "name": name,
+                        "last_login": datetime.utcnow(),
+                        "passwd_hash": STUB_PASSWD_HASH,
+                        "contacts_version": 0,
+                    }
+                ],
+            )
+        return self.stubs[(index, name)]
+
+    def copy_table(self, source, owners, model, convert):
+        """
+        Метод копирования таблицы model пачками по COPY_CHUNK строк.
+        owners - имена владельцев строк по id, convert(строка, сегмент,
+        id) возвращает новую строку или None.
+        """
+
+        with source.ReadSession() as session:
+            result = session.execute(
+                select(model.__table__).execution_options(yield_per=COPY_CHUNK)
+            )
+            for chunk in result.partitions():
+                rows = []
+                for row in chunk:
+                    name = owners.get(row.user_id)
+                    if name not in self.users:
+                        continue
+                    index, user_id = self.users[name]
+                    new_row = convert(row, index, user_id)
+                    if new_row is not None:
+                        rows.append((index, new_row))
+                self.insert_grouped(model, rows)
+
+    def copy_source(self, source, is_home):
+        """Метод копирования данных одной базы источника."""
+        names = self.source_users(source)
+        # Строки копий контактов из других сегментов не копируются
+        owners = {
+            user_id: name for user_id, name in names.items() if is_home(name)
+        }
+        self.copy_table(
+            source,
+            owners,
+            source.LoginHistory,
+            lambda row, index, user_id: {
+                "user_id": user_id,
+                "date_time": row.date_time,
+                "ip_address": row.ip_address,
+                "port": row.port,
+            },
+        )
+        self.copy_table(
+            source,
+            owners,
+            source.LoginDaily,
+            lambda row, index, user_id: {
+                "user_id": user_id,
+                "day": row.day,
+                "logins": row.logins,
+                "distinct_ips": row.distinct_ips,
+                "first_seen": row.first_seen,
+                "last_seen": row.last_seen,
+            },
+        )
+        self.copy_table(
+            source,
+            owners,
+            source.LoginDailyIp,
+            lambda row, index, user_id: {
+                "user_id": user_id,
+                "day": row.day,
+                "ip_address": row.ip_address,
+            },
+        )
+        self.copy_table(
+            source,
+            owners,
+            source.UserStatistic,
+            lambda row, index, user_id: {
+                "user_id": user_id,
+                "sent_count": row.sent_count,
+                "received_count": row.received_count,
+            },
+        )
+        self.copy_table(
+            source,
+            owners,
+            source.ContactChange,
+            lambda row, index, user_id: {
+                "user_id": user_id,
+                "contact_name": row.contact_name,
+                "version": row.version,
+                "deleted": row.deleted,
+            },
+        )
+        self.copy_table(
+            source,
+            owners,
+            source.UserContact,
+            lambda row, index, user_id: (
+                {
+                    "user_id": user_id,
+                    "date_time": row.date_time,
+                    "contact_id": self.contact_id(
+                        index, names[row.contact_id]
+                    ),
+                }
+                if names.get(row.contact_id) in self.users
+                else None
+            ),
+        )
+
+
+def main():
+    args = arg_parser()
+    logging.getLogger(LOGGER_NAME).setLevel(args.log_level)
+    source, databases = open_source(args.source)
+    destination = ShardedStorage(args.destination, shards=args.shards)
+    resharder = Resharder(destination)
+    # Сначала все пользователи: контакты ссылаются на пользователей
+    # любых баз источника
+    for database, is_home in databases:
+        resharder.copy_users(database, is_home)
+    for database, is_home in databases:
+        resharder.copy_source(database, is_home)
+
+    shard_users = defaultdict(int)
+    for index, _ in resharder.users.values():
+        shard_users[index] += 1
+    print(f"Users: {len(resharder.users)}, contact copies: ", end="")
+    print(len(resharder.stubs))
+    for index in range(args.shards):
+        print(f"  shard {index}: {shard_users[index]} users")
+    for table, rows in sorted(resharder.copied.items()):
+        print(f"  {table}: {rows} rows")
+    destination.close()
+    if isinstance(source, ShardedStorage):
+        source.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
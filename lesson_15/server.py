@@ -9,15 +9,40 @@ from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import QApplication
 
 import log.server_log_config  # noqa
+from app_utils.settings import (
+    EVENT_LOG_COMPACT_INTERVAL,
+    SERVER_DATABASE_PROFILE,
+    SERVER_DATABASE_SHARDS,
+)
 from app_utils.utils import FunctionLog
 from log.server_log_config import LOGGER_NAME
 from server.core import ServerCore
+from server.event_log import EventLogCompaction, EventLogStorage
 from server.main_window import MainWindow
+from server.memory_storage import MemorySnapshot, MemoryStorage
+from server.message_store import MessageStore
 from server.server_console_interface import run_server_console_interface
-from server.server_database import ServerStorage
+from server.server_database import (
+    LoginHistoryRetention,
+    ServerStorage,
+    storage_pragmas,
+)
+from server.sharded_storage import ShardedStorage
+from server.traffic_recorder import TrafficRecorder
 
 logger = logging.getLogger(LOGGER_NAME)
 
+# Параметры секции [STORAGE], не относящиеся к соединениям SQLite
+STORAGE_OPTIONS = (
+    "backend",
+    "snapshot_path",
+    "snapshot_interval",
+    "shards",
+    "shard_path",
+    "login_log",
+    "login_log_interval",
+)
+
 
 @FunctionLog(logger)
 def get_params(default_port, default_address):
@@ -63,7 +88,87 @@ def config_load():
         raise Exception("Can't read config file server.ini")
 
 
+def config_storage_pragmas(config):
+    """
+    Функция чтения параметров соединений базы данных из секции
+    [STORAGE]: профиль и заменяющие его параметры (пустое значение -
+    значение профиля).
+    """
+
+    if "STORAGE" not in config:
+        return storage_pragmas()
+    storage = dict(config["STORAGE"])
+    for option in STORAGE_OPTIONS:
+        storage.pop(option, None)
+    profile = storage.pop("profile", "") or SERVER_DATABASE_PROFILE
+    return storage_pragmas(profile, **storage)
+
+
+def config_storage(config):
+    """
+    Функция создания хранилища сервера по секции [STORAGE]:
+    backend = sqlite - база SQLite (ServerStorage), memory - хранилище
+    в памяти (MemoryStorage) со снимками в snapshot_path, sharded -
+    пользователи распределены по shards базам SQLite каталога shard_path
+    (ShardedStorage). Непустой login_log (только для sqlite) - каталог
+    журнала входов EventLogStorage.
+    """
+
+    storage = config["STORAGE"] if "STORAGE" in config else {}
+    backend = storage.get("Backend", "") or "sqlite"
+    login_log = storage.get("Login_log", "")
+    if login_log and backend != "sqlite":
+        raise ValueError(f"login_log is not supported by {backend} backend")
+    if backend == "memory":
+        return MemoryStorage(storage.get("Snapshot_path", "") or None)
+    if backend == "sharded":
+        return ShardedStorage(
+            os.path.join(
+                config["SETTINGS"]["Database_path"],
+                storage.get("Shard_path", "") or "shards",
+            ),
+            shards=int(storage.get("Shards", "") or SERVER_DATABASE_SHARDS),
+            pragmas=config_storage_pragmas(config),
+        )
+    if backend != "sqlite":
+        raise ValueError(f"Unknown storage backend: {backend}")
+    path = os.path.join(
+        config["SETTINGS"]["Database_path"],
+        config["SETTINGS"]["Database_file"],
+    )
+    if login_log:
+        return EventLogStorage(
+            path,
+            os.path.join(config["SETTINGS"]["Database_path"], login_log),
+            pragmas=config_storage_pragmas(config),
+        )
+    return ServerStorage(path, pragmas=config_storage_pragmas(config))
+
+
 @FunctionLog(logger)
+def shutdown(
+    database, retention, snapshot, compaction, recorder, message_store
+):
+    """
+    Функция остановки фоновых потоков сервера: сохраняет снимок
+    хранилища в памяти, сбрасывает журнал входов и закрывает
+    запись трафика и хранилище сообщений.
+    """
+
+    if retention:
+        retention.stop()
+    if snapshot:
+        snapshot.stop()
+        database.save_snapshot()
+    if compaction:
+        compaction.stop()
+        database.close()
+    if recorder:
+        recorder.close()
+    if message_store:
+        message_store.close()
+
+
 def main():
     """
     run server with python3 server.py -h
@@ -73,21 +178,91 @@ def main():
     # Загрузка файла конфигурации сервера
     config = config_load()
 
+    # Хранилище и параметры соединений базы данных
+    try:
+        database = config_storage(config)
+    except ValueError as e:
+        logger.critical("Wrong [STORAGE] section of server.ini: %s", e)
+        exit(1)
+
+    # Периодическое сохранение снимков хранилища в памяти
+    snapshot = None
+    if isinstance(database, MemoryStorage) and database.snapshot_path:
+        snapshot = MemorySnapshot(
+            database,
+            interval=config["STORAGE"].getint("Snapshot_interval", 60),
+        )
+        snapshot.start()
+        logger.info("Memory storage snapshots to %s", database.snapshot_path)
+
+    # Сброс журнала входов на диск и его сжатие
+    compaction = None
+    if isinstance(database, EventLogStorage):
+        compaction = EventLogCompaction(
+            database,
+            interval=config["STORAGE"].getint(
+                "Login_log_interval", EVENT_LOG_COMPACT_INTERVAL
+            ),
+        )
+        compaction.start()
+        logger.info("Login history in %s", database.event_log.path)
+
     # Загрузка параметров командной строки,
     # если нет параметров, то задаём значения по умолчанию.
-    database = ServerStorage(
-        os.path.join(
-            config["SETTINGS"]["Database_path"],
-            config["SETTINGS"]["Database_file"],
-        )
-    )
 
     server_port, server_ip = get_params(
         config["SETTINGS"]["Default_port"],
         config["SETTINGS"]["Listen_Address"],
     )
+
+    # Запись трафика для последующего воспроизведения (replay.py)
+    recorder = None
+    if "RECORDER" in config and config["RECORDER"].getboolean("Enabled"):
+        recorder = TrafficRecorder(
+            path=config["RECORDER"]["Path"],
+            max_bytes=config["RECORDER"].getint("Max_bytes", 0),
+            backup_count=config["RECORDER"].getint("Backup_count", 5),
+        )
+        logger.info("Traffic recording to %s", recorder.path)
+
+    # Архивирование истории входов старше login_history_days дней
+    retention = None
+    if "RETENTION" in config and config["RETENTION"].getint(
+        "Login_history_days", 0
+    ):
+        retention = LoginHistoryRetention(
+            database,
+            max_age_days=config["RETENTION"].getint("Login_history_days"),
+            archive_path=config["RETENTION"].get("Archive_path", "archive"),
+            interval=config["RETENTION"].getint("Interval", 3600),
+            batch_size=config["RETENTION"].getint("Batch_size", 1000),
+        )
+        retention.start()
+        logger.info("Login history retention: %s days", retention.max_age.days)
+
+    # История переписки для запросов get_history клиентов
+    message_store = None
+    if "HISTORY" in config and config["HISTORY"].getboolean("Enabled"):
+        try:
+            pragmas = config_storage_pragmas(config)
+        except ValueError as e:
+            logger.critical("Wrong [STORAGE] section of server.ini: %s", e)
+            exit(1)
+        message_store = MessageStore(
+            os.path.join(
+                config["SETTINGS"]["Database_path"],
+                config["HISTORY"].get("Path", "") or "messages",
+            ),
+            pragmas=pragmas,
+        )
+        logger.info("Message history in %s", message_store.path)
+
     server = ServerCore(
-        server_port=server_port, server_ip=server_ip, database=database
+        server_port=server_port,
+        server_ip=server_ip,
+        database=database,
+        recorder=recorder,
+        message_store=message_store,
     )
     server.run()
 
@@ -100,6 +275,9 @@ def main():
     choice = input("Run server GUI? y/n: ")
     if choice.lower().find("y") == -1:
         run_server_console_interface(server=server, database=database)
+        shutdown(
+            database, retention, snapshot, compaction, recorder, message_store
+        )
         exit(0)
 
     server_app = QApplication(sys.argv)
@@ -113,6 +291,9 @@ def main():
 
     # По закрытию окон останавливаем обработчик сообщений
     server.running = False
+    shutdown(
+        database, retention, snapshot, compaction, recorder, message_store
+    )
 
 
 if __name__ == "__main__":
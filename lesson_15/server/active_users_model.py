@@ -0,0 +1,115 @@
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
+
+from app_utils.utils import datetime_from_utc_to_local
+
+# Количество событий, начиная с которого модель перестраивается целиком,
+# а не построчно (например, при массовом подключении клиентов)
+RESET_EVENTS_THRESHOLD = 500
+
+
+class ActiveUsersModel(QAbstractTableModel):
+    """
+    Класс - модель таблицы подключённых пользователей.
+
+    Заполняется снимком подключённых пользователей и обновляется
+    событиями входа и выхода ServerCore (метод apply_events):
+    строки добавляются и удаляются без перестроения модели.
+    Последние подключившиеся пользователи отображаются первыми.
+    """
+
+    headers = ("Имя Клиента", "IP Адрес", "Порт", "Время подключения")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # Строки таблицы: [имя, ip, порт, время подключения]
+        self.rows = []
+        # Строки по имени пользователя
+        self.users = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        return self.rows[index.row()][index.column()]
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return super().headerData(section, orientation, role)
+
+    @staticmethod
+    def make_row(username, ip, port, login_time):
+        """Метод формирования строки таблицы."""
+        return [
+            username,
+            ip,
+            str(port),
+            # Дата Время в часовом поясе пользователя
+            str(datetime_from_utc_to_local(login_time)),
+        ]
+
+    def set_users(self, snapshot):
+        """
+        Метод заполнения модели снимком подключённых пользователей
+        {"имя": (ip, порт, время входа)}.
+        """
+
+        self.beginResetModel()
+        self.users = {
+            username: self.make_row(username, *session)
+            for username, session in sorted(
+                snapshot.items(), key=lambda item: item[1][2], reverse=True
+            )
+        }
+        self.rows = list(self.users.values())
+        self.endResetModel()
+
+    def apply_events(self, events):
+        """
+        Метод применения событий входа и выхода пользователей.
+        Большая пачка событий применяется перестроением модели.
+        """
+
+        if len(events) >= RESET_EVENTS_THRESHOLD:
+            self.beginResetModel()
+            for event in events:
+                self.apply_event(event, notify=False)
+            self.endResetModel()
+            return
+        for event in events:
+            self.apply_event(event)
+
+    def apply_event(self, event, notify=True):
+        """Метод применения одного события входа или выхода."""
+        if event[0] == "login":
+            username = event[1]
+            if username in self.users:
+                self.remove_user(username, notify)
+            row = self.make_row(*event[1:])
+            if notify:
+                self.beginInsertRows(QModelIndex(), 0, 0)
+            self.rows.insert(0, row)
+            self.users[username] = row
+            if notify:
+                self.endInsertRows()
+        elif event[0] == "logout" and event[1] in self.users:
+            self.remove_user(event[1], notify)
+
+    def remove_user(self, username, notify=True):
+        """Метод удаления строки пользователя."""
+        row = self.users.pop(username)
+        position = self.rows.index(row)
+        if notify:
+            self.beginRemoveRows(QModelIndex(), position, position)
+        del self.rows[position]
+        if notify:
+            self.endRemoveRows()
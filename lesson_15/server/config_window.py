@@ -2,6 +2,7 @@ import os
 
 from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import (
+    QComboBox,
     QDialog,
     QFileDialog,
     QLabel,
@@ -10,7 +11,22 @@ from PyQt5.QtWidgets import (
     QPushButton,
 )
 
-from app_utils.settings import SERVER_CONFIG_FILE_NAME
+from app_utils.settings import (
+    SERVER_CONFIG_FILE_NAME,
+    SERVER_DATABASE_PROFILE,
+    SERVER_DATABASE_PROFILES,
+)
+from server.server_database import storage_pragmas
+
+# Параметры соединений базы данных в секции [STORAGE]: (параметр, подпись)
+STORAGE_FIELDS = (
+    ("journal_mode", "Режим журнала:"),
+    ("synchronous", "Синхронизация с диском:"),
+    ("cache_size", "Размер кэша (страниц, <0 - КиБ):"),
+    ("mmap_size", "Размер mmap (байт):"),
+    ("temp_store", "Временные данные:"),
+    ("busy_timeout", "Ожидание блокировки (мс):"),
+)
 
 
 class ConfigWindow(QDialog):
@@ -25,7 +41,7 @@ class ConfigWindow(QDialog):
 
     def initUI(self):
         """Настройки окна"""
-        self.setFixedSize(365, 260)
+        self.setFixedSize(365, 500)
         self.setWindowTitle("Настройки сервера")
         self.setAttribute(Qt.WA_DeleteOnClose)
         self.setModal(True)
@@ -84,13 +100,43 @@ class ConfigWindow(QDialog):
         self.ip.move(200, 148)
         self.ip.setFixedSize(150, 20)
 
+        # Профиль параметров соединений базы данных
+        self.profile_label = QLabel("Профиль базы данных:", self)
+        self.profile_label.move(10, 210)
+        self.profile_label.setFixedSize(180, 15)
+
+        self.profile = QComboBox(self)
+        self.profile.move(200, 208)
+        self.profile.setFixedSize(150, 20)
+        self.profile.addItems(SERVER_DATABASE_PROFILES)
+
+        # Метка с напоминанием о пустых полях параметров
+        self.profile_note = QLabel(
+            " пустое поле - значение профиля, параметры\n"
+            " применяются после перезапуска сервера.",
+            self,
+        )
+        self.profile_note.move(10, 232)
+        self.profile_note.setFixedSize(340, 30)
+
+        # Поля параметров, заменяющих значения профиля
+        self.storage_fields = {}
+        for row, (name, title) in enumerate(STORAGE_FIELDS):
+            label = QLabel(title, self)
+            label.move(10, 272 + row * 30)
+            label.setFixedSize(185, 15)
+            field = QLineEdit(self)
+            field.move(200, 270 + row * 30)
+            field.setFixedSize(150, 20)
+            self.storage_fields[name] = field
+
         # Кнопка сохранения настроек
         self.save_btn = QPushButton("Сохранить", self)
-        self.save_btn.move(190, 220)
+        self.save_btn.move(190, 460)
 
         # Кнопка закрытия окна
         self.close_button = QPushButton("Закрыть", self)
-        self.close_button.move(275, 220)
+        self.close_button.move(275, 460)
         self.close_button.clicked.connect(self.close)
 
         self.db_path_select.clicked.connect(self.open_file_dialog)
@@ -101,8 +147,30 @@ class ConfigWindow(QDialog):
         self.db_file.insert(self.config["SETTINGS"]["Database_file"])
         self.port.insert(self.config["SETTINGS"]["Default_port"])
         self.ip.insert(self.config["SETTINGS"]["Listen_Address"])
+        if "STORAGE" in self.config:
+            storage = self.config["STORAGE"]
+            self.profile.setCurrentText(
+                storage.get("Profile", "") or SERVER_DATABASE_PROFILE
+            )
+            for name, field in self.storage_fields.items():
+                field.insert(storage.get(name, ""))
+        else:
+            self.profile.setCurrentText(SERVER_DATABASE_PROFILE)
+        self.show_profile_values(self.profile.currentText())
+        self.profile.currentTextChanged.connect(self.show_profile_values)
         self.save_btn.clicked.connect(self.save_server_config)
 
+    def show_profile_values(self, profile):
+        """
+        Метод отображения значений параметров профиля
+        в подсказках пустых полей.
+        """
+
+        for name, field in self.storage_fields.items():
+            field.setPlaceholderText(
+                str(SERVER_DATABASE_PROFILES[profile][name])
+            )
+
     def open_file_dialog(self):
         """Метод обработчик открытия окна выбора папки."""
 
@@ -122,6 +190,20 @@ class ConfigWindow(QDialog):
 
         global config_window
         message = QMessageBox()
+        storage = {
+            name: field.text().strip()
+            for name, field in self.storage_fields.items()
+        }
+        try:
+            storage_pragmas(self.profile.currentText(), **storage)
+        except ValueError as e:
+            message.warning(self, "Ошибка", f"Параметры базы данных: {e}")
+            return
+        if "STORAGE" not in self.config:
+            self.config.add_section("STORAGE")
+        self.config["STORAGE"]["Profile"] = self.profile.currentText()
+        for name, value in storage.items():
+            self.config["STORAGE"][name] = value
         self.config["SETTINGS"]["Database_path"] = self.db_path.text()
         self.config["SETTINGS"]["Database_file"] = self.db_file.text()
         try:
@@ -3,10 +3,13 @@ import hashlib
 import hmac
 import json
 import logging
+import queue
 import select
 import socket
 import threading
 import time
+from datetime import datetime, timezone
+from weakref import WeakKeyDictionary
 
 from sqlalchemy.exc import SQLAlchemyError
 
@@ -15,12 +18,31 @@ from app_utils.descriptors import Port
 from app_utils.errors import InternalException
 from app_utils.settings import (
     ENCODING_VAR,
+    HISTORY_PAGE_BYTES,
+    HISTORY_PAGE_SIZE,
+    HISTORY_STREAM_PAGES,
     MAX_CONNECTIONS,
     MAX_DATA_LENGTH,
+    PRESENCE_COALESCE,
+    RECEIPT_STATUSES,
     SERVER_TIMEOUT,
 )
-from app_utils.utils import FunctionLog, login_required
+from app_utils.utils import (
+    FunctionLog,
+    JsonFrameDecoder,
+    add_to_ranges,
+    intersect_ranges,
+    is_id,
+    login_required,
+    merge_ranges,
+)
 from log.server_log_config import LOGGER_NAME
+from server.message_store import decode_cursor, encode_cursor
+from server.traffic_recorder import (
+    DIRECTION_CLOSE,
+    DIRECTION_IN,
+    DIRECTION_OUT,
+)
 
 logger = logging.getLogger(LOGGER_NAME)
 
@@ -34,11 +56,23 @@ class ServerCore:
 
     port = Port()
 
-    def __init__(self, server_port, server_ip, database):
+    def __init__(
+        self,
+        server_port,
+        server_ip,
+        database,
+        recorder=None,
+        message_store=None,
+    ):
         self.port = server_port
         self.ip = server_ip
         self.server_socket = None
         self.database = database
+        # Запись трафика (TrafficRecorder), None - запись отключена
+        self.recorder = recorder
+        # Хранилище переданных сообщений (MessageStore) для выдачи
+        # истории переписки, None - история не сохраняется
+        self.message_store = message_store
 
         # Все клиенты
         self.clients = []
@@ -52,6 +86,35 @@ class ServerCore:
         # "message": "сообщение" ,"to": "имя пользователя"}, ]
         self.messages_list = []
 
+        # Разбор потока байт клиентов на сообщения: один recv может
+        # вернуть несколько склеенных сообщений, неразобранные
+        # сообщения хранятся до следующего вызова receive_data
+        self.decoders = WeakKeyDictionary()
+        self.frames = WeakKeyDictionary()
+
+        # Подключённые пользователи {"имя": (ip, порт, время входа)}
+        # и очереди подписчиков на события входа и выхода (окно сервера)
+        self.active_sessions = {}
+        self.subscribers = []
+        self.events_lock = threading.Lock()
+
+        # Подписки клиентов на присутствие контактов: {"имя": {контакты}}
+        # и обратный индекс {"контакт": {имена подписчиков}}
+        self.presence_subscriptions = {}
+        self.presence_watchers = {}
+        # Входы и выходы за окно объединения {"имя": был ли в сети
+        # до начала окна} и время отправки (time.monotonic)
+        self.presence_changes = {}
+        self.presence_deadline = None
+
+        # Уведомления о получении и прочтении за цикл сервера:
+        # {"отправитель": {"статус": {"получатель": [[первый, последний]]}}}
+        self.receipts = {}
+        # Диапазоны msg_id, переданных получателям за время подключения
+        # отправителя: {"отправитель": {"получатель": [[первый, последний]]}},
+        # уведомления принимаются только о переданных сообщениях
+        self.routed = {}
+
         # Поток сервера
         self.thread = None
         # Флаг продолжения работы
@@ -75,8 +138,13 @@ class ServerCore:
                 )
                 self.clients.append(conn)
             finally:
-                # Проверить наличие событий ввода вывода
+                # Проверить наличие событий ввода вывода, не дольше
+                # окна объединения изменений присутствия
                 wait = 1
+                if self.presence_deadline is not None:
+                    wait = max(
+                        0, min(wait, self.presence_deadline - time.monotonic())
+                    )
                 ready_to_read_clients = []
                 ready_to_write_clients = []
                 try:
@@ -98,6 +166,8 @@ class ServerCore:
                     self.process_requests(ready_to_read_clients)
                 if self.messages_list and ready_to_write_clients:
                     self.write_responses()
+                self.send_receipts()
+                self.send_presence()
 
     @FunctionLog(logger)
     def run(self):
@@ -113,6 +183,138 @@ class ServerCore:
         self.server_socket.shutdown(socket.SHUT_RDWR)
         self.server_socket.close()
 
+    def subscribe(self):
+        """
+        Метод подписки на события входа и выхода пользователей.
+        Возвращает снимок подключённых пользователей
+        {"имя": (ip, порт, время входа)} и очередь событий после
+        снимка: ("login", имя, ip, порт, время входа)
+        и ("logout", имя).
+        """
+
+        events = queue.SimpleQueue()
+        with self.events_lock:
+            snapshot = dict(self.active_sessions)
+            self.subscribers.append(events)
+        return snapshot, events
+
+    def unsubscribe(self, events):
+        """Метод отмены подписки очереди events на события."""
+        with self.events_lock:
+            if events in self.subscribers:
+                self.subscribers.remove(events)
+
+    def publish_login(self, username, ip, port):
+        """Метод оповещения подписчиков о входе пользователя."""
+        login_time = datetime.utcnow()
+        with self.events_lock:
+            self.active_sessions[username] = (ip, port, login_time)
+            for events in self.subscribers:
+                events.put(("login", username, ip, port, login_time))
+        self.presence_changed(username, was_online=False)
+
+    def publish_logout(self, username):
+        """Метод оповещения подписчиков о выходе пользователя."""
+        with self.events_lock:
+            self.active_sessions.pop(username, None)
+            for events in self.subscribers:
+                events.put(("logout", username))
+        self.unsubscribe_presence(username)
+        self.presence_changed(username, was_online=True)
+        self.routed.pop(username, None)
+
+    def subscribe_presence(self, sock, message):
+        """
+        Метод подписки пользователя на вход и выход контактов:
+        всех контактов или контактов из списка contacts запроса.
+        Повторный запрос заменяет подписку. Отвечает списком
+        подключённых контактов подписки.
+        """
+
+        username = message["user_login"]
+        contacts = set(self.database.get_user_contacts(username))
+        if "contacts" in message:
+            contacts &= set(message["contacts"])
+        self.unsubscribe_presence(username)
+        self.presence_subscriptions[username] = contacts
+        for contact in contacts:
+            self.presence_watchers.setdefault(contact, set()).add(username)
+        self.send_data(
+            sock,
+            {
+                "response": 202,
+                "online": sorted(
+                    contact
+                    for contact in contacts
+                    if contact in self.user_names
+                ),
+            },
+        )
+
+    def unsubscribe_presence(self, username):
+        """Метод отмены подписки пользователя на присутствие контактов."""
+        for contact in self.presence_subscriptions.pop(username, ()):
+            watchers = self.presence_watchers[contact]
+            watchers.discard(username)
+            if not watchers:
+                del self.presence_watchers[contact]
+
+    def presence_changed(self, username, was_online):
+        """
+        Метод учёта входа или выхода пользователя: изменение
+        отправляется подписчикам по окончании окна объединения.
+        """
+
+        self.presence_changes.setdefault(username, was_online)
+        if self.presence_deadline is None:
+            self.presence_deadline = time.monotonic() + PRESENCE_COALESCE
+
+    def send_presence(self):
+        """
+        Метод отправки изменений присутствия после окна объединения:
+        каждый подключённый подписчик получает одно сообщение
+        presence_update со списками вошедших (online) и вышедших
+        (offline) контактов. Пользователь, состояние которого к концу
+        окна не изменилось (повторный вход), не отправляется.
+        """
+
+        if (
+            self.presence_deadline is None
+            or time.monotonic() < self.presence_deadline
+        ):
+            return
+        frames = {}
+        for username, was_online in self.presence_changes.items():
+            online = username in self.user_names
+            if online == was_online:
+                continue
+            for subscriber in self.presence_watchers.get(username, ()):
+                frame = frames.setdefault(
+                    subscriber, {"online": [], "offline": []}
+                )
+                frame["online" if online else "offline"].append(username)
+        self.presence_changes = {}
+        self.presence_deadline = None
+        for subscriber, frame in frames.items():
+            sock = self.user_names.get(subscriber)
+            if sock is None:
+                continue
+            try:
+                self.send_data(
+                    sock,
+                    {
+                        "action": "presence_update",
+                        "time": time.time(),
+                        **frame,
+                    },
+                )
+            except OSError:
+                logger.debug(
+                    "Client disconnected: %s. Removed from activ client list",
+                    self.get_client_description(sock),
+                )
+                self.client_close(sock)
+
     def client_close(self, sock):
         """
         Метод обработчик клиента с которым прервана связь.
@@ -124,7 +326,10 @@ class ServerCore:
             if conn == sock:
                 self.user_names.pop(user, None)
                 self.database.user_logout(username=user)
+                self.publish_logout(user)
                 break
+        if self.recorder:
+            self.recorder.record(sock, DIRECTION_CLOSE, b"")
         sock.close()
 
     def get_client_description(self, sock):
@@ -151,14 +356,15 @@ class ServerCore:
         for sock in r_clients:
             try:
                 data = self.receive_data(sock)
-
-                if data:
+                while data:
                     self.process_client_message(sock, data)
                     logger.debug(
                         "Get request from %s, data: %s",
                         self.get_client_description(sock),
                         data,
                     )
+                    # Сообщения, полученные тем же recv
+                    data = self.buffered_frame(sock)
             except (
                 OSError,
                 json.JSONDecodeError,
@@ -213,27 +419,33 @@ class ServerCore:
             and "message" in message
             and "from" in message
             and "to" in message
+            # Отправитель - пользователь, авторизованный на этом сокете
+            and self.user_names.get(message["from"]) == sock
         ):
             if message["to"] in self.user_names:
                 # new message add to message list
-                self.messages_list.append(
-                    {
-                        "from": message["from"],
-                        "message": message["message"],
-                        "to": message["to"],
-                    }
-                )
+                routed = {
+                    "from": message["from"],
+                    "message": message["message"],
+                    "to": message["to"],
+                    # Сокет отправителя для подтверждения доставки
+                    "sock": sock,
+                }
+                # Идентификатор сообщения клиента для подтверждения
+                if "msg_id" in message:
+                    routed["msg_id"] = message["msg_id"]
+                self.messages_list.append(routed)
                 return
             else:
                 # no user in activ user
-                self.send_data(
-                    sock,
-                    {
-                        "response": 400,
-                        "time": time.time(),
-                        "error": "Wrong user name",
-                    },
-                )
+                response = {
+                    "response": 400,
+                    "time": time.time(),
+                    "error": "Wrong user name",
+                }
+                if "msg_id" in message:
+                    response["msg_id"] = message["msg_id"]
+                self.send_data(sock, response)
                 return
 
         # client quit
@@ -261,6 +473,67 @@ class ServerCore:
             self.send_data(sock, {"response": 202, "alert": contact_list})
             return
 
+        # contact list changes since version
+        if (
+            "action" in message
+            and message["action"] == "get_contacts_since"
+            and "time" in message
+            and "user_login" in message
+            and self.user_names[message["user_login"]] == sock
+            and "version" in message
+        ):
+            changes = self.database.get_contacts_since(
+                message["user_login"], int(message["version"])
+            )
+            self.send_data(sock, {"response": 202, **changes})
+            return
+
+        # conversation history pages
+        if (
+            "action" in message
+            and message["action"] == "get_history"
+            and "time" in message
+            and "user_login" in message
+            and self.user_names[message["user_login"]] == sock
+            and "contact" in message
+        ):
+            self.send_history(sock, message)
+            return
+
+        # presence subscription
+        if (
+            "action" in message
+            and message["action"] == "subscribe_presence"
+            and "time" in message
+            and "user_login" in message
+            and self.user_names[message["user_login"]] == sock
+        ):
+            self.subscribe_presence(sock, message)
+            return
+
+        # delivery and read receipts
+        if (
+            "action" in message
+            and message["action"] == "receipt"
+            and "time" in message
+            and "user_login" in message
+            and self.user_names[message["user_login"]] == sock
+            and message.get("status") in RECEIPT_STATUSES
+            and isinstance(message.get("receipts"), dict)
+        ):
+            try:
+                self.queue_receipts(message)
+            except (TypeError, ValueError):
+                self.send_data(
+                    sock,
+                    {
+                        "response": 400,
+                        "time": time.time(),
+                        "error": "Bad receipt ranges.",
+                    },
+                )
+            return
+
         # add contact
         if (
             "action" in message
@@ -380,6 +653,9 @@ class ServerCore:
                         ip_address=ip,
                         port=port,
                     )
+                    self.publish_login(
+                        message["user"]["account_name"], ip, port
+                    )
                     self.send_data(
                         sock, {"response": 200, "time": time.time()}
                     )
@@ -407,9 +683,106 @@ class ServerCore:
                 self.clients.remove(sock)
                 sock.close()
 
+    def send_history(self, sock, message):
+        """
+        Метод отправки истории переписки пользователя с контактом
+        страницами от новых сообщений к старым. На один запрос
+        отправляется до pages страниц подряд, каждая - ответ 202
+        с сообщениями, курсором следующей страницы (None - история
+        закончилась) и признаком last последней страницы ответа.
+        Размер страницы ограничен HISTORY_PAGE_BYTES байтами.
+        """
+
+        if self.message_store is None:
+            self.send_data(
+                sock,
+                {
+                    "response": 400,
+                    "time": time.time(),
+                    "error": "History not available",
+                },
+            )
+            return
+        try:
+            limit = min(
+                max(int(message.get("limit") or HISTORY_PAGE_SIZE), 1),
+                HISTORY_PAGE_SIZE,
+            )
+            pages = min(
+                max(int(message.get("pages") or 1), 1), HISTORY_STREAM_PAGES
+            )
+            cursor = message.get("cursor")
+            if cursor is not None:
+                decode_cursor(cursor)
+        except ValueError as e:
+            self.send_data(
+                sock,
+                {"response": 400, "time": time.time(), "error": str(e)},
+            )
+            return
+
+        for page in range(pages):
+            rows, next_cursor = self.message_store.get_history(
+                message["user_login"],
+                message["contact"],
+                cursor=cursor,
+                limit=limit,
+            )
+            messages = []
+            size = 0
+            for row in rows:
+                item = {
+                    "id": row.id,
+                    "from": row.from_user,
+                    "to": row.to_user,
+                    "message": row.message,
+                    "time": row.date_time.replace(
+                        tzinfo=timezone.utc
+                    ).timestamp(),
+                }
+                size += len(json.dumps(item))
+                if messages and size > HISTORY_PAGE_BYTES:
+                    next_cursor = encode_cursor(messages[-1]["id"])
+                    break
+                messages.append(item)
+            cursor = next_cursor
+            self.send_data(
+                sock,
+                {
+                    "response": 202,
+                    "contact": message["contact"],
+                    "messages": messages,
+                    "cursor": cursor,
+                    "last": cursor is None or page == pages - 1,
+                },
+            )
+            if cursor is None:
+                break
+
+    def store_messages(self):
+        """
+        Метод сохранения сообщений к отправке в хранилище сообщений
+        одной транзакцией, сообщение получает id в истории history_id.
+        """
+
+        messages = [
+            message
+            for message in self.messages_list
+            if message["to"] in self.user_names
+        ]
+        try:
+            ids = self.message_store.append(messages)
+        except SQLAlchemyError as e:
+            logger.error("Messages not stored in history: %s", e)
+            return
+        for message, history_id in zip(messages, ids):
+            message["history_id"] = history_id
+
     @FunctionLog(logger)
     def write_responses(self):
         """Метод отправки чат-сообщения клиенту"""
+        if self.message_store is not None:
+            self.store_messages()
         for message in self.messages_list:
             message_dict = {
                 "action": "msg",
@@ -418,7 +791,19 @@ class ServerCore:
                 "message": message["message"],
                 "to": message["to"],
             }
-            destination_socket = self.user_names[message["to"]]
+            if "history_id" in message:
+                message_dict["history_id"] = message["history_id"]
+            # Идентификатор сообщения отправителя для уведомлений
+            # о получении и прочтении
+            if "msg_id" in message:
+                message_dict["msg_id"] = message["msg_id"]
+            destination_socket = self.user_names.get(message["to"])
+            if destination_socket is None:
+                # Получатель отключился после постановки сообщения в очередь
+                logger.debug(
+                    "Client %s disconnected, message dropped", message["to"]
+                )
+                continue
             try:
                 self.send_data(destination_socket, message_dict)
                 logger.debug(
@@ -439,25 +824,163 @@ class ServerCore:
                 self.database.update_user_statistic(
                     message["from"], message["to"]
                 )
+                if "msg_id" in message:
+                    self.send_ack(message)
+                    # Диапазоны учитываются по логину сокета отправителя
+                    if is_id(message["msg_id"]) and (
+                        self.user_names.get(message["from"]) == message["sock"]
+                    ):
+                        recipients = self.routed.setdefault(
+                            message["from"], {}
+                        )
+                        add_to_ranges(
+                            recipients.setdefault(message["to"], []),
+                            message["msg_id"],
+                        )
+
+    def send_ack(self, message):
+        """
+        Метод отправки отправителю подтверждения доставки сообщения
+        получателю. Подтверждение содержит идентификатор сообщения
+        msg_id, присвоенный клиентом, и id сообщения в истории
+        сервера history_id, если сообщение сохранено. Подтверждение
+        отправляется только в сокет, из которого получено сообщение.
+        """
+
+        sender_socket = message["sock"]
+        if sender_socket not in self.clients:
+            return
+        ack = {
+            "response": 200,
+            "time": time.time(),
+            "msg_id": message["msg_id"],
+        }
+        if "history_id" in message:
+            ack["history_id"] = message["history_id"]
+        try:
+            self.send_data(sender_socket, ack)
+        except OSError:
+            logger.debug(
+                "Client disconnected: %s. Removed from activ client list",
+                self.get_client_description(sender_socket),
+            )
+            self.client_close(sender_socket)
+
+    def queue_receipts(self, message):
+        """
+        Метод учёта уведомлений получателя user_login со статусом status:
+        receipts - {"отправитель": [[первый, последний], ...]} диапазоны
+        msg_id сообщений отправителя. Принимаются только диапазоны
+        сообщений, переданных сервером этому получателю. Уведомления
+        подключённым отправителям отправляются в конце цикла сервера,
+        уведомления отключённым отправителям не сохраняются.
+        """
+
+        recipient = message["user_login"]
+        receipts = {
+            sender: merge_ranges(ranges)
+            for sender, ranges in message["receipts"].items()
+        }
+        for sender, ranges in receipts.items():
+            if sender not in self.user_names:
+                continue
+            ranges = intersect_ranges(
+                ranges, self.routed.get(sender, {}).get(recipient, [])
+            )
+            if not ranges:
+                continue
+            statuses = self.receipts.setdefault(sender, {})
+            recipients = statuses.setdefault(message["status"], {})
+            recipients.setdefault(recipient, []).extend(ranges)
+
+    def send_receipts(self):
+        """
+        Метод отправки уведомлений, принятых за цикл сервера: каждый
+        отправитель получает одно сообщение
+        {"action": "receipt", "receipts": {"статус": {"получатель":
+        [[первый, последний], ...]}}} с объединёнными диапазонами msg_id.
+        """
+
+        if not self.receipts:
+            return
+        receipts, self.receipts = self.receipts, {}
+        for sender, statuses in receipts.items():
+            sock = self.user_names.get(sender)
+            if sock is None:
+                continue
+            frame = {
+                "action": "receipt",
+                "time": time.time(),
+                "receipts": {
+                    status: {
+                        recipient: merge_ranges(ranges)
+                        for recipient, ranges in recipients.items()
+                    }
+                    for status, recipients in statuses.items()
+                },
+            }
+            try:
+                self.send_data(sock, frame)
+            except OSError:
+                logger.debug(
+                    "Client disconnected: %s. Removed from activ client list",
+                    self.get_client_description(sock),
+                )
+                self.client_close(sock)
 
     @FunctionLog(logger)
     def send_data(self, sock, data):
         """Отправка данных в сокет"""
         js_message = json.dumps(data)
         message = js_message.encode(ENCODING_VAR)
-        sock.send(message)
+        if self.recorder:
+            self.recorder.record(sock, DIRECTION_OUT, message)
+        # Страница истории может не поместиться в буфер сокета
+        sock.sendall(message)
 
     @FunctionLog(logger)
     def receive_data(self, sock):
-        """Получение данных из сокета"""
-        data = None
+        """
+        Получение одного сообщения из сокета.
+        Если предыдущий recv вернул несколько сообщений, возвращается
+        следующее из них без чтения сокета. Если сообщение получено
+        не полностью, возвращается None. При закрытии соединения
+        клиентом вызывает ConnectionResetError.
+        """
+
+        data = self.buffered_frame(sock)
+        if data is not None:
+            return data
+        data = sock.recv(MAX_DATA_LENGTH)
+        if not data:
+            raise ConnectionResetError("Client closed connection")
+        if self.recorder:
+            self.recorder.record(sock, DIRECTION_IN, data)
+        decoder = self.decoders.get(sock)
+        if decoder is None:
+            decoder = self.decoders[sock] = JsonFrameDecoder()
         try:
-            data = sock.recv(MAX_DATA_LENGTH)
-            json_data = json.loads(data.decode(ENCODING_VAR))
-        except json.JSONDecodeError:
-            logger.critical("NonJsonMessage: %str", data)
-            return "NonJsonMessage"
-        return json_data
+            frames = decoder.feed(data)
+        except (json.JSONDecodeError, UnicodeDecodeError) as error:
+            logger.critical("NonJsonMessage: %s", data)
+            self.decoders.pop(sock, None)
+            # Сообщения, полученные до ошибки, обрабатываются первыми
+            frames = getattr(error, "frames", []) + ["NonJsonMessage"]
+        if not frames:
+            return None
+        self.frames[sock] = frames[1:]
+        return frames[0]
+
+    def buffered_frame(self, sock):
+        """
+        Метод возвращает следующее уже полученное сообщение клиента
+        или None, если таких сообщений нет.
+        """
+
+        frames = self.frames.get(sock)
+        if frames:
+            return frames.pop(0)
+        return None
 
     def init_server_socket(self):
         """Метод инициализатор сокета."""
@@ -0,0 +1,777 @@
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import (
+    Column,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    bindparam,
+    select,
+    update,
+)
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import IntegrityError, NoResultFound, SQLAlchemyError
+
+import log.server_log_config  # noqa
+from app_utils.settings import (
+    EVENT_LOG_COMPACT_INTERVAL,
+    EVENT_LOG_INDEX_INTERVAL,
+    EVENT_LOG_SEGMENT_RECORDS,
+    LOGIN_HISTORY_PAGE,
+    RETENTION_BATCH,
+    SERVER_DATABASE_PRAGMAS,
+)
+from log.server_log_config import LOGGER_NAME
+from server.memory_storage import ArchiveRow, LoginRow
+from server.server_database import ServerStorage
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# Наибольшая длина адреса в байтах (IPv6 с адресом IPv4 - 45 символов)
+ADDRESS_SIZE = 46
+# Запись журнала фиксированной длины: id, время в микросекундах
+# от EPOCH, id пользователя, порт и адрес (UTF-8, дополнен нулями)
+RECORD = struct.Struct(f"<QqIH{ADDRESS_SIZE}s")
+# Начало записи: id и время, по ним ищутся границы выборки
+RECORD_KEY = struct.Struct("<Qq")
+# Время записей отсчитывается от начала эпохи, UTC без часового пояса
+EPOCH = datetime(1970, 1, 1)
+
+# Файлы сегментов называются по id первой записи сегмента
+SEGMENT_FILE = "segment-{:020d}.log"
+SEGMENT_PATTERN = re.compile(r"^segment-(\d{20})\.log$")
+STATE_FILE = "state.json"
+
+# Запись журнала после разбора
+EventRecord = namedtuple("EventRecord", "id date_time user_id ip_address port")
+
+event_log_metadata = MetaData()
+
+# Состояние журнала в базе сервера: граница архивирования (trimmed)
+# фиксируется одной транзакцией с дневной статистикой входов
+event_log_state = Table(
+    "event_log_state",
+    event_log_metadata,
+    Column("name", String(64), primary_key=True),
+    Column("value", Integer, nullable=False),
+)
+
+
+def to_micros(date_time):
+    """Функция перевода datetime (UTC) в микросекунды от EPOCH."""
+    return (date_time - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(value):
+    """Функция перевода микросекунд от EPOCH в datetime (UTC)."""
+    return EPOCH + timedelta(microseconds=value)
+
+
+class EventSegment:
+    """
+    Класс - сегмент журнала: файл из capacity записей фиксированной
+    длины, отображённый в память (mmap). Записи занимают начало
+    файла, свободное место заполнено нулями (id 0), поэтому количество
+    записей после перезапуска находится двоичным поиском.
+
+    Время и id записей возрастают, разреженный индекс (время, id)
+    каждой index_interval-й записи находится в памяти и сужает
+    двоичный поиск по файлу до одного блока индекса.
+    """
+
+    def __init__(self, path, index_interval, capacity=None):
+        self.path = path
+        self.first_id = int(
+            SEGMENT_PATTERN.match(os.path.basename(path)).group(1)
+        )
+        self.index_interval = index_interval
+        # capacity задаётся при создании нового сегмента
+        self.file = open(path, "w+b" if capacity else "r+b")
+        if capacity:
+            self.file.truncate(capacity * RECORD.size)
+        self.capacity = os.fstat(self.file.fileno()).st_size // RECORD.size
+        self.map = mmap.mmap(self.file.fileno(), self.capacity * RECORD.size)
+        # Поиск количества записей без индекса: первая запись с id 0
+        self.count = 0
+        self.index = []
+        self.count = self.search(lambda key: not key[1], high=self.capacity)
+        self.index = [
+            self.key(position)
+            for position in range(0, self.count, index_interval)
+        ]
+
+    def key(self, position):
+        """Метод чтения ключа (время, id) записи по её номеру."""
+        record_id, timestamp = RECORD_KEY.unpack_from(
+            self.map, position * RECORD.size
+        )
+        return timestamp, record_id
+
+    def search(self, test, low=0, high=None):
+        """
+        Метод поиска первой записи из [low, high), ключ (время, id)
+        которой удовлетворяет условию test, high - если таких нет.
+        Условие должно быть монотонным: ложно до искомой записи
+        и истинно после неё.
+        """
+
+        high = self.count if high is None else high
+        step = self.index_interval
+        start, end = low, high
+        if self.count:
+            # Блок индекса, в котором условие становится истинным
+            first, last = 0, len(self.index)
+            while first < last:
+                middle = (first + last) // 2
+                if test(self.index[middle]):
+                    last = middle
+                else:
+                    first = middle + 1
+            if first:
+                start = max(start, (first - 1) * step + 1)
+            if first < len(self.index):
+                end = min(end, first * step)
+        while start < end:
+            middle = (start + end) // 2
+            if test(self.key(middle)):
+                end = middle
+            else:
+                start = middle + 1
+        return min(max(start, low), high)
+
+    def records(self, start, end):
+        """
+        Метод чтения записей [start, end): записи разбираются прямо
+        из отображённой памяти через memoryview, без копирования.
+        """
+
+        offsets = slice(start * RECORD.size, end * RECORD.size)
+        view = memoryview(self.map)[offsets]
+        try:
+            return list(RECORD.iter_unpack(view))
+        finally:
+            view.release()
+
+    def append(self, record):
+        """Метод добавления записи (кортеж полей RECORD) в конец."""
+        RECORD.pack_into(self.map, self.count * RECORD.size, *record)
+        if not self.count % self.index_interval:
+            self.index.append((record[1], record[0]))
+        self.count += 1
+
+    def flush(self):
+        """Метод сброса изменённых страниц сегмента на диск."""
+        self.map.flush()
+
+    def close(self):
+        """Метод закрытия отображения и файла сегмента."""
+        self.map.close()
+        self.file.close()
+
+
+class EventLog:
+    """
+    Класс - журнал событий входа: записи фиксированной длины
+    дописываются в сегменты - файлы по segment_records записей,
+    отображённые в память. Запись события - копирование записи
+    в память без транзакции и системных вызовов, данные сбрасываются
+    на диск методом flush (поток EventLogCompaction), при сбое
+    питания теряются события после последнего сброса.
+
+    Время записей не убывает (при переводе часов назад запись
+    получает время предыдущей), поэтому порядок (время, id) совпадает
+    с порядком записи и выборки по времени и курсору находятся
+    двоичным поиском. Старые записи отбрасываются границей trim,
+    записи удалённых пользователей - отметками delete_user, сами
+    данные удаляются из файлов методом compact. Граница и отметки
+    хранятся в файле state.json каталога журнала.
+    """
+
+    def __init__(
+        self,
+        path,
+        segment_records=EVENT_LOG_SEGMENT_RECORDS,
+        index_interval=EVENT_LOG_INDEX_INTERVAL,
+    ):
+        self.path = path
+        self.segment_records = segment_records
+        self.index_interval = index_interval
+        os.makedirs(path, exist_ok=True)
+        self.lock = threading.RLock()
+        # Записи с id не больше trimmed архивированы
+        self.trimmed = 0
+        # Отметки удаления {id пользователя: наибольший id его записей}
+        self.deleted = {}
+        self.load_state()
+        self.segments = []
+        for name in sorted(os.listdir(path)):
+            file_path = os.path.join(path, name)
+            if name.endswith(".tmp"):
+                # Незавершённое сжатие сегмента
+                os.remove(file_path)
+            elif SEGMENT_PATTERN.match(name):
+                if os.path.getsize(file_path) < RECORD.size:
+                    os.remove(file_path)
+                    continue
+                self.segments.append(EventSegment(file_path, index_interval))
+        self.next_id = max([self.trimmed, *self.deleted.values()]) + 1
+        self.last_time = 0
+        for segment in reversed(self.segments):
+            if segment.count:
+                self.last_time, last_id = segment.key(segment.count - 1)
+                self.next_id = max(self.next_id, last_id + 1)
+                break
+        logger.debug(
+            "Event log %s: %s segments, next id %s",
+            path,
+            len(self.segments),
+            self.next_id,
+        )
+
+    def load_state(self):
+        """Метод загрузки границы архивирования и отметок удаления."""
+        try:
+            with open(os.path.join(self.path, STATE_FILE)) as file:
+                state = json.load(file)
+        except FileNotFoundError:
+            return
+        self.trimmed = state["trimmed"]
+        self.deleted = {
+            int(user_id): up_to for user_id, up_to in state["deleted"].items()
+        }
+
+    def save_state(self):
+        """Метод атомарной записи состояния журнала в state.json."""
+        path = os.path.join(self.path, STATE_FILE)
+        with open(f"{path}.tmp", "w") as file:
+            json.dump({"trimmed": self.trimmed, "deleted": self.deleted}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(f"{path}.tmp", path)
+
+    def is_live(self, record):
+        """Метод проверки, что запись не архивирована и не удалена."""
+        return record[0] > self.trimmed and record[0] > self.deleted.get(
+            record[2], 0
+        )
+
+    @staticmethod
+    def event_record(record):
+        """Метод разбора записи сегмента в EventRecord."""
+        record_id, timestamp, user_id, port, address = record
+        return EventRecord(
+            record_id,
+            from_micros(timestamp),
+            user_id,
+            address.rstrip(b"\0").decode(),
+            port,
+        )
+
+    def append(self, user_id, ip_address, port, date_time=None):
+        """Метод добавления события входа, возвращает id записи."""
+        address = ip_address.encode()
+        if len(address) > ADDRESS_SIZE:
+            raise ValueError(f"Address too long: {ip_address!r}")
+        timestamp = to_micros(date_time or datetime.utcnow())
+        with self.lock:
+            timestamp = max(timestamp, self.last_time)
+            if (
+                not self.segments
+                or self.segments[-1].count == self.segments[-1].capacity
+            ):
+                self.segments.append(
+                    EventSegment(
+                        os.path.join(
+                            self.path, SEGMENT_FILE.format(self.next_id)
+                        ),
+                        self.index_interval,
+                        capacity=self.segment_records,
+                    )
+                )
+            record_id = self.next_id
+            self.segments[-1].append(
+                (record_id, timestamp, user_id, port, address)
+            )
+            self.next_id += 1
+            self.last_time = timestamp
+        return record_id
+
+    def read(self, users=None, before=None, since=None, limit=None):
+        """
+        Метод выборки записей от новых к старым. users - id
+        пользователей (None - все), before - ключ (date_time, id),
+        записи меньше которого выбираются, since - наименьшее время
+        записей, limit - наибольшее количество записей.
+        Возвращает список EventRecord.
+        """
+
+        before_key = None
+        if before is not None:
+            before_key = (to_micros(before[0]), before[1])
+        since_time = to_micros(since) if since is not None else None
+        rows = []
+        with self.lock:
+            for segment in reversed(self.segments):
+                end = segment.count
+                if before_key is not None:
+                    end = segment.search(lambda key: key >= before_key)
+                start = segment.search(lambda key: key[1] > self.trimmed)
+                if since_time is not None:
+                    start = segment.search(
+                        lambda key: key[0] >= since_time, start
+                    )
+                for high in range(end, start, -self.index_interval):
+                    low = max(start, high - self.index_interval)
+                    for record in reversed(segment.records(low, high)):
+                        if not self.is_live(record) or (
+                            users is not None and record[2] not in users
+                        ):
+                            continue
+                        rows.append(self.event_record(record))
+                        if limit is not None and len(rows) >= limit:
+                            return rows
+                if start:
+                    # Более ранние сегменты архивированы или старше since
+                    break
+        return rows
+
+    def scan(self, before, limit):
+        """
+        Метод выборки не более limit записей старше before
+        (datetime) от старых к новым. Возвращает список EventRecord.
+        """
+
+        before_time = to_micros(before)
+        rows = []
+        with self.lock:
+            for segment in self.segments:
+                start = segment.search(lambda key: key[1] > self.trimmed)
+                end = segment.search(lambda key: key[0] >= before_time, start)
+                for low in range(start, end, self.index_interval):
+                    high = min(end, low + self.index_interval)
+                    for record in segment.records(low, high):
+                        if self.is_live(record):
+                            rows.append(self.event_record(record))
+                            if len(rows) >= limit:
+                                return rows
+                if end < segment.count:
+                    break
+        return rows
+
+    def trim(self, record_id):
+        """Метод отбрасывания записей с id не больше record_id."""
+        with self.lock:
+            if record_id > self.trimmed:
+                self.trimmed = record_id
+                self.save_state()
+
+    def delete_user(self, user_id):
+        """Метод отбрасывания всех записанных событий пользователя."""
+        with self.lock:
+            if self.next_id > 1:
+                self.deleted[user_id] = self.next_id - 1
+                self.save_state()
+
+    def compact(self):
+        """
+        Метод сжатия журнала: заполненные сегменты, все записи которых
+        отброшены, удаляются, остальные заполненные сегменты с записями
+        удалённых пользователей переписываются без них. Отметки
+        удаления, не относящиеся больше ни к одной записи, удаляются.
+        Возвращает количество удалённых и переписанных сегментов.
+        """
+
+        changed = 0
+        with self.lock:
+            if not self.segments:
+                return 0
+            for position, segment in list(enumerate(self.segments))[:-1]:
+                last_id = segment.key(segment.count - 1)[1]
+                live = None
+                if last_id > self.trimmed and any(
+                    up_to >= segment.first_id
+                    for up_to in self.deleted.values()
+                ):
+                    live = [
+                        record
+                        for record in segment.records(0, segment.count)
+                        if self.is_live(record)
+                    ]
+                    if len(live) == segment.count:
+                        continue
+                elif last_id > self.trimmed:
+                    continue
+                if live:
+                    with open(f"{segment.path}.tmp", "wb") as file:
+                        file.write(
+                            b"".join(RECORD.pack(*record) for record in live)
+                        )
+                        file.flush()
+                        os.fsync(file.fileno())
+                    os.replace(f"{segment.path}.tmp", segment.path)
+                    self.segments[position] = EventSegment(
+                        segment.path, self.index_interval
+                    )
+                else:
+                    os.remove(segment.path)
+                    self.segments[position] = None
+                segment.close()
+                changed += 1
+            self.segments = [
+                segment for segment in self.segments if segment is not None
+            ]
+            # Заполненные сегменты не содержат удалённых записей
+            active_id = self.segments[-1].first_id
+            deleted = {
+                user_id: up_to
+                for user_id, up_to in self.deleted.items()
+                if up_to >= active_id and up_to > self.trimmed
+            }
+            if deleted != self.deleted:
+                self.deleted = deleted
+                self.save_state()
+        if changed:
+            logger.debug("Event log compacted: %s segments", changed)
+        return changed
+
+    def flush(self):
+        """Метод сброса записей всех сегментов на диск."""
+        with self.lock:
+            for segment in self.segments:
+                segment.flush()
+
+    def close(self):
+        """Метод сброса на диск и закрытия сегментов журнала."""
+        with self.lock:
+            for segment in self.segments:
+                segment.flush()
+                segment.close()
+            self.segments = []
+
+
+class EventLogStorage(ServerStorage):
+    """
+    Класс - база сервера SQLite, история входов которой хранится
+    в журнале EventLog (каталог log_path) вместо таблицы login_history.
+
+    Вход пользователя не обращается к базе: событие дописывается
+    в журнал, подключённые пользователи хранятся в памяти, время
+    последнего входа записывается в базу пачкой методом flush_logins.
+    История входов читается из журнала, имена пользователей - из базы.
+    Архивирование (archive_login_history) сворачивает записи журнала
+    в дневную статистику базы и сдвигает границу журнала, граница
+    сохраняется в базе той же транзакцией.
+
+    Записи таблицы login_history существующей базы переносятся
+    в журнал при первом запуске.
+    """
+
+    def __init__(
+        self,
+        path,
+        log_path,
+        pragmas=SERVER_DATABASE_PRAGMAS,
+        segment_records=EVENT_LOG_SEGMENT_RECORDS,
+        index_interval=EVENT_LOG_INDEX_INTERVAL,
+    ):
+        super().__init__(path, pragmas)
+        event_log_metadata.create_all(self.engine)
+        self.event_log = EventLog(log_path, segment_records, index_interval)
+        self.lock = threading.RLock()
+        # Кэш id пользователей по имени
+        self.user_ids = {}
+        # Подключённые пользователи {id: (имя, адрес, порт, время входа)}
+        self.active = {}
+        # Время последнего входа, не записанное в базу {имя: время}
+        self.last_logins = {}
+        with self.engine.connect() as connection:
+            trimmed = connection.execute(
+                select(event_log_state.c.value).where(
+                    event_log_state.c.name == "trimmed"
+                )
+            ).scalar()
+        if trimmed:
+            self.event_log.trim(trimmed)
+        if self.event_log.next_id == 1:
+            self.import_login_history()
+
+    def import_login_history(self):
+        """Метод переноса истории входов из базы в журнал."""
+        history = self.LoginHistory
+        with self.Session() as session, session.begin():
+            rows = session.execute(
+                select(
+                    history.user_id,
+                    history.date_time,
+                    history.ip_address,
+                    history.port,
+                ).order_by(history.date_time, history.id)
+            ).all()
+            if not rows:
+                return 0
+            for row in rows:
+                self.event_log.append(
+                    row.user_id, row.ip_address, row.port, row.date_time
+                )
+            self.event_log.flush()
+            session.execute(history.__table__.delete())
+        logger.info("Login history moved to event log: %s rows", len(rows))
+        return len(rows)
+
+    def get_user_id(self, username):
+        """Метод получения id пользователя по имени из кэша или базы."""
+        user_id = self.user_ids.get(username)
+        if user_id is None:
+            with self.ReadSession() as session:
+                user_id = session.execute(
+                    select(self.User.id).where(self.User.name == username)
+                ).scalar()
+            if user_id is None:
+                raise ValueError(f"User not exist {username}")
+            self.user_ids[username] = user_id
+        return user_id
+
+    def user_names(self):
+        """Метод получения словаря имён пользователей по id."""
+        with self.ReadSession() as session:
+            return dict(
+                session.execute(select(self.User.id, self.User.name)).all()
+            )
+
+    @staticmethod
+    def user_filter(names, username):
+        """
+        Метод выбора id пользователей для чтения журнала: все
+        существующие пользователи или пользователь username.
+        """
+
+        if not username:
+            return names
+        return {user_id for user_id, name in names.items() if name == username}
+
+    def user_login(self, username, ip_address, port):
+        """
+        Метод выполняющийся при входе пользователя,
+        записывает факт входа в журнал.
+        """
+
+        with self.lock:
+            user_id = self.get_user_id(username)
+            if user_id in self.active:
+                raise IntegrityError(
+                    "INSERT INTO active_user",
+                    (user_id,),
+                    Exception("UNIQUE constraint failed: active_user.user_id"),
+                )
+            now = datetime.utcnow()
+            self.event_log.append(user_id, ip_address, port, now)
+            self.active[user_id] = (username, ip_address, port, now)
+            self.last_logins[username] = now
+
+    def user_logout(self, username):
+        """Метод фиксирующий отключения пользователя."""
+        with self.lock:
+            if self.active.pop(self.user_ids.get(username), None) is None:
+                raise NoResultFound("Active user not found")
+
+    def remove_user(self, name):
+        """Метод удаляющий пользователя из базы и его историю входов."""
+        with self.lock:
+            with self.ReadSession() as session:
+                user_id = session.execute(
+                    select(self.User.id).where(self.User.name == name)
+                ).scalar_one()
+            self.event_log.delete_user(user_id)
+            super().remove_user(name)
+            self.user_ids.pop(name, None)
+            self.active.pop(user_id, None)
+            self.last_logins.pop(name, None)
+
+    def user_list(self):
+        """Метод получения списка пользователя"""
+        rows = super().user_list()
+        with self.lock:
+            for row in rows:
+                row["last_login"] = self.last_logins.get(
+                    row["name"], row["last_login"]
+                )
+        return rows
+
+    def active_users_list(self):
+        """Метод получения активных пользователей"""
+        with self.lock:
+            rows = [
+                {
+                    "name": name,
+                    "ip_address": ip_address,
+                    "port": port,
+                    "login_time": login_time,
+                }
+                for name, ip_address, port, login_time in self.active.values()
+            ]
+        return sorted(rows, key=lambda row: row["login_time"], reverse=True)
+
+    def login_history(self, username=None):
+        """
+        Функция возвращающая историю входов
+        по пользователю или всем пользователям
+        """
+
+        names = self.user_names()
+        rows = [
+            {
+                "name": names[record.user_id],
+                "date_time": record.date_time,
+                "ip_address": record.ip_address,
+                "port": record.port,
+            }
+            for record in self.event_log.read(
+                self.user_filter(names, username)
+            )
+        ]
+        rows.sort(key=lambda row: row["name"])
+        rows.sort(key=lambda row: row["date_time"], reverse=True)
+        return rows
+
+    def iter_login_history(
+        self,
+        username=None,
+        since=None,
+        until=None,
+        cursor=None,
+        limit=LOGIN_HISTORY_PAGE,
+    ):
+        """
+        Метод постраничного чтения истории входов из журнала,
+        параметры как у ServerStorage.iter_login_history.
+        """
+
+        names = self.user_names()
+        users = self.user_filter(names, username)
+        before = tuple(cursor) if cursor is not None else None
+        if until is not None and (before is None or (until, 0) < before):
+            before = (until, 0)
+        return iter(
+            LoginRow(
+                record.id,
+                names[record.user_id],
+                record.date_time,
+                record.ip_address,
+                record.port,
+            )
+            for record in self.event_log.read(users, before, since, limit)
+        )
+
+    def archive_login_history(
+        self, before, archive_path, batch_size=RETENTION_BATCH
+    ):
+        """
+        Метод архивирования одной пачки истории входов журнала старше
+        before, как ServerStorage.archive_login_history. Граница журнала
+        сохраняется в базе одной транзакцией с дневной статистикой
+        и сдвигается в журнале после её фиксации.
+        Возвращает количество обработанных записей.
+        """
+
+        records = self.event_log.scan(before, batch_size)
+        if not records:
+            return 0
+        names = self.user_names()
+        rows = [
+            ArchiveRow(
+                record.id,
+                record.user_id,
+                names[record.user_id],
+                record.date_time,
+                record.ip_address,
+                record.port,
+            )
+            for record in records
+            if record.user_id in names
+        ]
+        self.write_login_archive(rows, archive_path)
+        statement = insert(event_log_state)
+        with self.Session() as session, session.begin():
+            if rows:
+                self.rollup_login_history(session, rows)
+            session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[event_log_state.c.name],
+                    set_={"value": statement.excluded.value},
+                ),
+                {"name": "trimmed", "value": records[-1].id},
+            )
+        self.event_log.trim(records[-1].id)
+        logger.debug("Login history archived: %s rows", len(records))
+        return len(records)
+
+    def flush_logins(self):
+        """
+        Метод записи в базу времени последнего входа пользователей
+        одной транзакцией, возвращает количество пользователей.
+        """
+
+        with self.lock:
+            pending, self.last_logins = self.last_logins, {}
+        if not pending:
+            return 0
+        user = self.User.__table__
+        try:
+            with self.Session() as session, session.begin():
+                session.execute(
+                    update(user)
+                    .where(user.c.name == bindparam("user_name"))
+                    .values(last_login=bindparam("login")),
+                    [
+                        {"user_name": name, "login": login}
+                        for name, login in pending.items()
+                    ],
+                )
+        except SQLAlchemyError:
+            with self.lock:
+                for name, login in pending.items():
+                    self.last_logins.setdefault(name, login)
+            raise
+        return len(pending)
+
+    def close(self):
+        """Метод сохранения отложенных данных и закрытия журнала."""
+        self.flush_logins()
+        self.event_log.close()
+
+
+class EventLogCompaction(threading.Thread):
+    """
+    Класс - поток обслуживания EventLogStorage: каждые interval
+    секунд записывает в базу время последнего входа, сбрасывает
+    журнал входов на диск и сжимает его.
+    """
+
+    def __init__(self, database, interval=EVENT_LOG_COMPACT_INTERVAL):
+        super().__init__(daemon=True)
+        self.database = database
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        """Метод содержащий основной цикл потока обслуживания."""
+        while not self.stopped.wait(self.interval):
+            try:
+                self.database.flush_logins()
+                self.database.event_log.flush()
+                self.database.event_log.compact()
+            except (SQLAlchemyError, OSError) as e:
+                logger.error("Event log maintenance error: %s", e)
+
+    def stop(self):
+        """Метод остановки потока обслуживания."""
+        self.stopped.set()
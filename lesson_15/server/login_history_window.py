@@ -1,10 +1,94 @@
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QStandardItem, QStandardItemModel
-from PyQt5.QtWidgets import QDialog, QPushButton, QTableView
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
+from PyQt5.QtWidgets import QDialog, QLineEdit, QPushButton, QTableView
 
+from app_utils.settings import LOGIN_HISTORY_PAGE
 from app_utils.utils import datetime_from_utc_to_local
 
 
+class LoginHistoryModel(QAbstractTableModel):
+    """
+    Класс - модель таблицы истории подключений.
+    Записи загружаются из базы страницами по page_size: следующую
+    страницу представление запрашивает (canFetchMore, fetchMore),
+    когда пользователь прокручивает таблицу до конца.
+    """
+
+    headers = ("Имя Клиента", "Дата и Время подключения", "IP Адрес", "Порт")
+
+    def __init__(self, database, page_size=LOGIN_HISTORY_PAGE, parent=None):
+        super().__init__(parent)
+        self.database = database
+        self.page_size = page_size
+        self.username = None
+        self.rows = []
+        # Курсор последней загруженной записи (date_time, id)
+        self.cursor = None
+        self.has_more = True
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        return self.rows[index.row()][index.column()]
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return super().headerData(section, orientation, role)
+
+    def set_username(self, username):
+        """
+        Метод смены фильтра по имени пользователя, пустое имя -
+        история всех пользователей. Загружает первую страницу.
+        """
+
+        self.beginResetModel()
+        self.username = username or None
+        self.rows = []
+        self.cursor = None
+        self.has_more = True
+        self.endResetModel()
+        self.fetchMore()
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.has_more
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or not self.has_more:
+            return
+        rows = [
+            (
+                row.name,
+                # Дата Время в часовом поясе пользователя
+                str(datetime_from_utc_to_local(row.date_time)),
+                row.ip_address,
+                str(row.port),
+                (row.date_time, row.id),
+            )
+            for row in self.database.iter_login_history(
+                self.username, cursor=self.cursor, limit=self.page_size
+            )
+        ]
+        self.has_more = len(rows) == self.page_size
+        if not rows:
+            return
+        self.beginInsertRows(
+            QModelIndex(), len(self.rows), len(self.rows) + len(rows) - 1
+        )
+        self.rows.extend(rows)
+        self.endInsertRows()
+        self.cursor = rows[-1][-1]
+
+
 class LoginHistoryWindow(QDialog):
     """
     Класс окна история подключений пользователей
@@ -27,37 +111,29 @@ class LoginHistoryWindow(QDialog):
         self.close_button.move(250, 650)
         self.close_button.clicked.connect(self.close)
 
+        # Фильтр по имени пользователя
+        self.user_filter = QLineEdit(self)
+        self.user_filter.move(10, 10)
+        self.user_filter.setFixedSize(580, 25)
+        self.user_filter.setPlaceholderText(
+            "Имя пользователя, Enter - показать историю всех пользователей"
+        )
+        self.user_filter.returnPressed.connect(self.create_login_history_model)
+
         # Лист с собственно историей
         self.history_table = QTableView(self)
-        self.history_table.move(10, 10)
-        self.history_table.setFixedSize(580, 620)
+        self.history_table.move(10, 45)
+        self.history_table.setFixedSize(580, 585)
+        self.history_model = LoginHistoryModel(self.database, parent=self)
+        self.history_table.setModel(self.history_model)
 
         self.create_login_history_model()
 
     def create_login_history_model(self):
-        """Метод заполнения таблицы 'история подключений'"""
-        # Список записей из базы
-        login_history = self.database.login_history()
-
-        # Объект модели данных:
-        list = QStandardItemModel()
-        list.setHorizontalHeaderLabels(
-            ["Имя Клиента", "Дата и Время подключения", "IP Адрес", "Порт"]
-        )
-        for row in login_history:
-            user = QStandardItem(row["name"])
-            user.setEditable(False)
-            # Дата Время в часовом поясе пользователя
-            date_time = QStandardItem(
-                str(datetime_from_utc_to_local(row["date_time"]))
-            )
-            date_time.setEditable(False)
-            ip = QStandardItem(row["ip_address"])
-            ip.setEditable(False)
-            port = QStandardItem(str(row["port"]))
-            port.setEditable(False)
-            list.appendRow([user, date_time, ip, port])
-
-        self.history_table.setModel(list)
+        """
+        Метод заполнения таблицы 'история подключений': загружает
+        первую страницу истории, остальные загружаются при прокрутке.
+        """
+
+        self.history_model.set_username(self.user_filter.text().strip())
         self.history_table.resizeColumnsToContents()
-        self.history_table.resizeRowsToContents()
@@ -1,9 +1,9 @@
+import queue
+
 from PyQt5.QtCore import QTimer
-from PyQt5.QtGui import QStandardItem, QStandardItemModel
 from PyQt5.QtWidgets import QAction, QLabel, QMainWindow, QTableView, qApp
-from sqlalchemy.exc import SQLAlchemyError
 
-from app_utils.utils import datetime_from_utc_to_local
+from server.active_users_model import ActiveUsersModel
 from server.add_user_window import RegisterUser
 from server.config_window import ConfigWindow
 from server.login_history_window import LoginHistoryWindow
@@ -74,11 +74,16 @@ class MainWindow(QMainWindow):
         self.active_clients_table = QTableView(self)
         self.active_clients_table.move(10, 45)
         self.active_clients_table.setFixedSize(780, 400)
+        self.users_model = ActiveUsersModel(self)
+        self.active_clients_table.setModel(self.users_model)
+        # Очередь событий входа и выхода пользователей от сервера
+        self.user_events = None
+        self.create_users_model()
 
-        # Таймер, обновляющий список клиентов 1 раз в секунду
+        # Таймер, переносящий в таблицу события входа и выхода
         self.timer = QTimer()
-        self.timer.timeout.connect(self.create_users_model)
-        self.timer.start(1000)
+        self.timer.timeout.connect(self.process_user_events)
+        self.timer.start(200)
 
         # Связываем кнопки с процедурами
         self.refresh_button.triggered.connect(self.create_users_model)
@@ -95,34 +100,28 @@ class MainWindow(QMainWindow):
         self.show()
 
     def create_users_model(self):
-        """Метод заполняющий таблицу активных пользователей."""
+        """
+        Метод заполняющий таблицу активных пользователей: подписывается
+        на события входа и выхода сервера и загружает снимок
+        подключённых пользователей.
+        """
+
+        if self.user_events is not None:
+            self.server_thread.unsubscribe(self.user_events)
+        snapshot, self.user_events = self.server_thread.subscribe()
+        self.users_model.set_users(snapshot)
+        self.active_clients_table.resizeColumnsToContents()
+
+    def process_user_events(self):
+        """Метод переноса в таблицу накопившихся событий сервера."""
+        events = []
         try:
-            list_users = self.database.active_users_list()
-        except SQLAlchemyError:
-            # One session for two thread
+            while True:
+                events.append(self.user_events.get_nowait())
+        except queue.Empty:
             pass
-        else:
-            list = QStandardItemModel()
-            list.setHorizontalHeaderLabels(
-                ["Имя Клиента", "IP Адрес", "Порт", "Время подключения"]
-            )
-            for row in list_users:
-                user = QStandardItem(row["name"])
-                user.setEditable(False)
-                ip = QStandardItem(row["ip_address"])
-                ip.setEditable(False)
-                port = QStandardItem(str(row["port"]))
-                port.setEditable(False)
-                # Дата Время в часовом поясе пользователя
-                time = QStandardItem(
-                    str(datetime_from_utc_to_local(row["login_time"]))
-                )
-                time.setEditable(False)
-                list.appendRow([user, ip, port, time])
-
-            self.active_clients_table.setModel(list)
-            self.active_clients_table.resizeColumnsToContents()
-            self.active_clients_table.resizeRowsToContents()
+        if events:
+            self.users_model.apply_events(events)
 
     def show_statistics(self):
         """Метод создающий окно со статистикой клиентов."""
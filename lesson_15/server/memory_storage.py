@@ -0,0 +1,582 @@
+import logging
+import os
+import pickle
+import threading
+from bisect import bisect_left, insort
+from collections import namedtuple
+from datetime import datetime
+from itertools import count
+
+from sqlalchemy.exc import IntegrityError, NoResultFound, SQLAlchemyError
+
+import log.server_log_config  # noqa
+from app_utils.settings import LOGIN_HISTORY_PAGE, RETENTION_BATCH
+from log.server_log_config import LOGGER_NAME
+from server.server_database import ServerStorage
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# Запись истории входов, порядок полей задаёт сортировку (date_time, id)
+HistoryRecord = namedtuple(
+    "HistoryRecord", "date_time id user_id ip_address port"
+)
+# Строка истории входов, как строка запроса ServerStorage
+LoginRow = namedtuple("LoginRow", "id name date_time ip_address port")
+# Строка архива истории входов (ServerStorage.write_login_archive)
+ArchiveRow = namedtuple(
+    "ArchiveRow", "id user_id name date_time ip_address port"
+)
+
+
+class MemoryStorage:
+    """
+    Класс - хранилище сервера в памяти с тем же интерфейсом, что
+    и ServerStorage: словари пользователей, подключений, контактов
+    и статистики, история входов в списках, отсортированных по
+    (date_time, id). Используется в тестах и нагрузочных запусках,
+    где время работы с SQLite не нужно.
+
+    Ошибки совпадают с ServerStorage: ValueError при входе
+    неизвестного пользователя, IntegrityError при повторном входе,
+    NoResultFound если пользователь не найден, SQLAlchemyError
+    при ошибках добавления контакта. При ошибке данные не меняются.
+
+    Если задан snapshot_path, данные загружаются из снимка при
+    создании и сохраняются методом save_snapshot (поток MemorySnapshot).
+    Все методы выполняются под общей блокировкой.
+    """
+
+    # Данные, сохраняемые в снимке, остальные поля строятся по ним
+    SNAPSHOT_FIELDS = (
+        "users",
+        "history",
+        "daily",
+        "daily_ips",
+        "contacts",
+        "contact_changes",
+        "statistic",
+    )
+
+    def __init__(self, snapshot_path=None):
+        self.snapshot_path = snapshot_path
+        self.lock = threading.RLock()
+        # Пользователи {"имя": {"id", "name", "last_login",
+        # "passwd_hash", "contacts_version"}} и имена по id
+        self.users = {}
+        self.names = {}
+        # Подключённые пользователи {id: (ip, порт, время входа)}
+        self.active = {}
+        # История входов всех пользователей и по id пользователя
+        self.history = []
+        self.user_history = {}
+        # Дневная статистика {(id, день): [входы, первый, последний]}
+        # и адреса входов {(id, день): {адреса}}
+        self.daily = {}
+        self.daily_ips = {}
+        # Контакты {id: {id контакта: время добавления}}
+        # и владельцы контакта {id контакта: {id}}
+        self.contacts = {}
+        self.contact_owners = {}
+        # Журнал изменений контактов {id: {"имя": (версия, удалён)}}
+        self.contact_changes = {}
+        # Статистика сообщений {id: [отправлено, получено]}
+        self.statistic = {}
+        self.user_ids = count(1)
+        self.history_ids = count(1)
+        # Номер изменения данных и номер, сохранённый в снимке
+        self.changes = 0
+        self.saved_changes = 0
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.load_snapshot()
+
+    def load_snapshot(self):
+        """
+        Метод загрузки данных из снимка snapshot_path. Подключённые
+        пользователи не восстанавливаются, как и в ServerStorage.
+        """
+
+        with open(self.snapshot_path, "rb") as file:
+            state = pickle.load(file)
+        with self.lock:
+            for field in self.SNAPSHOT_FIELDS:
+                setattr(self, field, state[field])
+            self.names = {
+                user["id"]: name for name, user in self.users.items()
+            }
+            self.user_history = {}
+            for record in self.history:
+                self.user_history.setdefault(record.user_id, []).append(record)
+            self.contact_owners = {}
+            for user_id, contacts in self.contacts.items():
+                for contact_id in contacts:
+                    self.contact_owners.setdefault(contact_id, set()).add(
+                        user_id
+                    )
+            self.user_ids = count(state["next_user_id"])
+            self.history_ids = count(state["next_history_id"])
+        logger.info(
+            "Memory storage loaded from %s: %s users, %s logins",
+            self.snapshot_path,
+            len(self.users),
+            len(self.history),
+        )
+
+    def save_snapshot(self):
+        """
+        Метод сохранения снимка данных в snapshot_path, если данные
+        изменились после предыдущего снимка. Снимок записывается
+        во временный файл и заменяет предыдущий после сброса на диск.
+        Возвращает True, если снимок сохранён.
+        """
+
+        if not self.snapshot_path:
+            return False
+        with self.lock:
+            if self.changes == self.saved_changes:
+                return False
+            changes = self.changes
+            state = {
+                field: getattr(self, field) for field in self.SNAPSHOT_FIELDS
+            }
+            state["next_user_id"] = max(self.names, default=0) + 1
+            state["next_history_id"] = (
+                max((record.id for record in self.history), default=0) + 1
+            )
+            # Сериализация под блокировкой: снимок согласован
+            data = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.snapshot_path}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        self.saved_changes = changes
+        logger.debug("Memory storage snapshot saved: %s", self.snapshot_path)
+        return True
+
+    def changed(self):
+        """Метод отметки изменения данных для снимка."""
+        self.changes += 1
+
+    def get_user(self, username):
+        """
+        Метод поиска пользователя по имени, если пользователь
+        не найден - NoResultFound (как Query.one() ServerStorage).
+        """
+
+        user = self.users.get(username)
+        if user is None:
+            raise NoResultFound("No row was found when one was required")
+        return user
+
+    def user_login(self, username, ip_address, port):
+        """
+        Метод выполняющийся при входе пользователя,
+        записывает факт входа.
+        """
+
+        with self.lock:
+            user = self.users.get(username)
+            if not user:
+                raise ValueError(f"User not exist {username}")
+            if user["id"] in self.active:
+                raise IntegrityError(
+                    "INSERT INTO active_user",
+                    (user["id"],),
+                    Exception("UNIQUE constraint failed: active_user.user_id"),
+                )
+            now = datetime.utcnow()
+            user["last_login"] = now
+            self.active[user["id"]] = (ip_address, port, now)
+            record = HistoryRecord(
+                now, next(self.history_ids), user["id"], ip_address, port
+            )
+            insort(self.history, record)
+            insort(self.user_history.setdefault(user["id"], []), record)
+            self.changed()
+
+    def add_update_user(self, username, passwd_hash):
+        """
+        Метод добавления пользователя или обновления ему пароля,
+        функция администратора
+        """
+
+        with self.lock:
+            user = self.users.get(username)
+            if user:
+                user["passwd_hash"] = passwd_hash
+            else:
+                user_id = next(self.user_ids)
+                self.users[username] = {
+                    "id": user_id,
+                    "name": username,
+                    "last_login": datetime.utcnow(),
+                    "passwd_hash": passwd_hash,
+                    "contacts_version": 0,
+                }
+                self.names[user_id] = username
+            self.changed()
+
+    def remove_user(self, name):
+        """Метод удаляющий пользователя."""
+        with self.lock:
+            user = self.get_user(name)
+            user_id = user["id"]
+            # Удаление из списков контактов других пользователей
+            for owner_id in self.contact_owners.pop(user_id, set()):
+                self.contacts[owner_id].pop(user_id, None)
+                self.record_contact_change(
+                    self.users[self.names[owner_id]], name, deleted=True
+                )
+            for contact_id in self.contacts.pop(user_id, {}):
+                self.contact_owners[contact_id].discard(user_id)
+            self.contact_changes.pop(user_id, None)
+            self.active.pop(user_id, None)
+            if self.user_history.pop(user_id, None):
+                self.history = [
+                    record
+                    for record in self.history
+                    if record.user_id != user_id
+                ]
+            for key in [key for key in self.daily if key[0] == user_id]:
+                del self.daily[key]
+                self.daily_ips.pop(key, None)
+            self.statistic.pop(user_id, None)
+            del self.users[name]
+            del self.names[user_id]
+            self.changed()
+
+    def user_exists(self, username):
+        """Метод проверяющий существование пользователя."""
+        return username in self.users
+
+    def user_logout(self, username):
+        """Метод фиксирующий отключения пользователя."""
+        with self.lock:
+            user = self.users.get(username)
+            if user is None or user["id"] not in self.active:
+                raise NoResultFound("Active user not found")
+            del self.active[user["id"]]
+            self.changed()
+
+    def user_list(self):
+        """Метод получения списка пользователя"""
+        with self.lock:
+            return [
+                {"name": name, "last_login": self.users[name]["last_login"]}
+                for name in sorted(self.users)
+            ]
+
+    def active_users_list(self):
+        """Метод получения активных пользователей"""
+        with self.lock:
+            rows = [
+                {
+                    "name": self.names[user_id],
+                    "ip_address": ip_address,
+                    "port": port,
+                    "login_time": login_time,
+                }
+                for user_id, (ip_address, port, login_time) in (
+                    self.active.items()
+                )
+            ]
+        return sorted(rows, key=lambda row: row["login_time"], reverse=True)
+
+    def login_history(self, username=None):
+        """
+        Функция возвращающая историю входов
+        по пользователю или всем пользователям
+        """
+
+        with self.lock:
+            records = self.history
+            if username:
+                user = self.users.get(username)
+                records = self.user_history.get(user["id"], []) if user else []
+            rows = [
+                {
+                    "name": self.names[record.user_id],
+                    "date_time": record.date_time,
+                    "ip_address": record.ip_address,
+                    "port": record.port,
+                }
+                for record in records
+            ]
+        rows.sort(key=lambda row: row["name"])
+        rows.sort(key=lambda row: row["date_time"], reverse=True)
+        return rows
+
+    def iter_login_history(
+        self,
+        username=None,
+        since=None,
+        until=None,
+        cursor=None,
+        limit=LOGIN_HISTORY_PAGE,
+    ):
+        """
+        Метод постраничного чтения истории входов, от новых к старым,
+        параметры как у ServerStorage.iter_login_history. Начало
+        страницы находится двоичным поиском по (date_time, id).
+        """
+
+        with self.lock:
+            records = self.history
+            if username:
+                user = self.users.get(username)
+                records = self.user_history.get(user["id"], []) if user else []
+            end = len(records)
+            if until is not None:
+                end = bisect_left(records, (until,))
+            if cursor is not None:
+                end = min(end, bisect_left(records, tuple(cursor)))
+            rows = []
+            for position in range(end - 1, -1, -1):
+                record = records[position]
+                if len(rows) >= limit or (
+                    since is not None and record.date_time < since
+                ):
+                    break
+                rows.append(
+                    LoginRow(
+                        record.id,
+                        self.names[record.user_id],
+                        record.date_time,
+                        record.ip_address,
+                        record.port,
+                    )
+                )
+        return iter(rows)
+
+    def archive_login_history(
+        self, before, archive_path, batch_size=RETENTION_BATCH
+    ):
+        """
+        Метод архивирования одной пачки истории входов старше before,
+        как ServerStorage.archive_login_history: архив по месяцам,
+        дневная статистика и удаление записей.
+        Возвращает количество обработанных записей.
+        """
+
+        with self.lock:
+            end = min(bisect_left(self.history, (before,)), batch_size)
+            if not end:
+                return 0
+            records = self.history[:end]
+            rows = [
+                ArchiveRow(
+                    record.id,
+                    record.user_id,
+                    self.names[record.user_id],
+                    record.date_time,
+                    record.ip_address,
+                    record.port,
+                )
+                for record in records
+            ]
+            ServerStorage.write_login_archive(rows, archive_path)
+            for record in records:
+                key = (record.user_id, record.date_time.date())
+                day = self.daily.setdefault(
+                    key, [0, record.date_time, record.date_time]
+                )
+                day[0] += 1
+                day[1] = min(day[1], record.date_time)
+                day[2] = max(day[2], record.date_time)
+                self.daily_ips.setdefault(key, set()).add(record.ip_address)
+            del self.history[:end]
+            archived = {record.id for record in records}
+            for user_id in {record.user_id for record in records}:
+                self.user_history[user_id] = [
+                    record
+                    for record in self.user_history[user_id]
+                    if record.id not in archived
+                ]
+            self.changed()
+        logger.debug("Login history archived: %s rows", len(rows))
+        return len(rows)
+
+    def login_daily(self, username=None):
+        """
+        Метод возвращающий дневную статистику входов, свёрнутую
+        из архивированной истории, от новых дней к старым.
+        """
+
+        with self.lock:
+            rows = [
+                {
+                    "name": self.names[user_id],
+                    "day": day,
+                    "logins": logins,
+                    "distinct_ips": len(self.daily_ips[(user_id, day)]),
+                    "first_seen": first_seen,
+                    "last_seen": last_seen,
+                }
+                for (user_id, day), (logins, first_seen, last_seen) in (
+                    self.daily.items()
+                )
+                if not username or self.names[user_id] == username
+            ]
+        rows.sort(key=lambda row: row["name"])
+        rows.sort(key=lambda row: row["day"], reverse=True)
+        return rows
+
+    def add_contact(self, user_name, contact_name):
+        """Метод добавления контакта для пользователя."""
+        with self.lock:
+            user = self.get_user(user_name)
+            contact = self.users.get(contact_name)
+            if not contact:
+                raise SQLAlchemyError("Contact not in user list")
+            contacts = self.contacts.setdefault(user["id"], {})
+            if contact["id"] in contacts:
+                raise SQLAlchemyError("Contact already exists")
+            contacts[contact["id"]] = datetime.utcnow()
+            self.contact_owners.setdefault(contact["id"], set()).add(
+                user["id"]
+            )
+            self.record_contact_change(user, contact_name, deleted=False)
+            self.changed()
+        logger.debug(
+            "New contact added successfully %s - %s", user_name, contact_name
+        )
+
+    def delete_contact(self, user_name, contact_name):
+        """Метод удаления контакта пользователя."""
+        with self.lock:
+            user = self.get_user(user_name)
+            contact = self.users.get(contact_name)
+            if not contact:
+                raise SQLAlchemyError("Contact not in user list")
+            contacts = self.contacts.get(user["id"], {})
+            if contacts.pop(contact["id"], None) is not None:
+                self.contact_owners[contact["id"]].discard(user["id"])
+                self.record_contact_change(user, contact_name, deleted=True)
+                self.changed()
+
+    def record_contact_change(self, user, contact_name, deleted):
+        """
+        Метод записи изменения списка контактов пользователя user:
+        увеличивает версию списка и сохраняет изменение в журнал.
+        """
+
+        user["contacts_version"] += 1
+        self.contact_changes.setdefault(user["id"], {})[contact_name] = (
+            user["contacts_version"],
+            deleted,
+        )
+
+    def get_contacts_since(self, username, version):
+        """
+        Метод возвращает изменения списка контактов пользователя
+        после версии version, как ServerStorage.get_contacts_since.
+        """
+
+        with self.lock:
+            user = self.get_user(username)
+            changes = {
+                "version": user["contacts_version"],
+                "full": not 0 < version <= user["contacts_version"],
+                "added": [],
+                "deleted": [],
+            }
+            if changes["full"]:
+                changes["added"] = self.get_user_contacts(username)
+                return changes
+            for contact_name, (
+                change_version,
+                deleted,
+            ) in self.contact_changes.get(user["id"], {}).items():
+                if change_version > version:
+                    changes["deleted" if deleted else "added"].append(
+                        contact_name
+                    )
+            return changes
+
+    def get_user_contacts(self, username):
+        """Метод возвращает список контактов пользователя."""
+        with self.lock:
+            user = self.get_user(username)
+            return [
+                self.names[contact_id]
+                for contact_id in self.contacts.get(user["id"], {})
+            ]
+
+    def update_user_statistic(self, from_user, to_user):
+        """Метод обновляющий статистику сообщений пользователя"""
+        # Если пользователь отправил сообщение самому себе,
+        # то статистику не меняем
+        if from_user == to_user:
+            return
+        with self.lock:
+            sender = self.get_user(from_user)
+            recipient = self.get_user(to_user)
+            self.statistic.setdefault(sender["id"], [0, 0])[0] += 1
+            self.statistic.setdefault(recipient["id"], [0, 0])[1] += 1
+            self.changed()
+
+    def increment_user_statistic(self, username, sent=0, received=0):
+        """
+        Метод увеличения счётчиков отправленных и полученных сообщений
+        одного пользователя.
+        """
+
+        with self.lock:
+            user = self.get_user(username)
+            statistic = self.statistic.setdefault(user["id"], [0, 0])
+            statistic[0] += sent
+            statistic[1] += received
+            self.changed()
+
+    def get_user_statistic(self):
+        """Метод получающий статистику всех пользователей"""
+        with self.lock:
+            return [
+                {
+                    "name": self.names[user_id],
+                    "last_login": self.users[self.names[user_id]][
+                        "last_login"
+                    ],
+                    "sent_count": sent_count,
+                    "received_count": received_count,
+                }
+                for user_id, (sent_count, received_count) in (
+                    self.statistic.items()
+                )
+            ]
+
+    def get_hash(self, name):
+        """Метод получения хэша пароля пользователя."""
+        user = self.users.get(name)
+        if user is None:
+            # Как ServerStorage: хэша неизвестного пользователя нет
+            raise TypeError(f"User not exist {name}")
+        return user["passwd_hash"]
+
+
+class MemorySnapshot(threading.Thread):
+    """
+    Класс - поток сохранения снимков MemoryStorage: каждые interval
+    секунд сохраняет снимок, если данные изменились.
+    """
+
+    def __init__(self, database, interval=60):
+        super().__init__(daemon=True)
+        self.database = database
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        """Метод содержащий основной цикл потока снимков."""
+        while not self.stopped.wait(self.interval):
+            try:
+                self.database.save_snapshot()
+            except OSError as e:
+                logger.error("Memory storage snapshot error: %s", e)
+
+    def stop(self):
+        """Метод остановки потока снимков."""
+        self.stopped.set()
@@ -0,0 +1,240 @@
+import base64
+import binascii
+import logging
+import os
+import re
+import struct
+import threading
+from datetime import datetime, timedelta
+from functools import partial
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Text,
+    create_engine,
+    event,
+    func,
+    select,
+)
+
+from app_utils.settings import HISTORY_PAGE_SIZE, SERVER_DATABASE_PRAGMAS
+from log.server_log_config import LOGGER_NAME
+from server.server_database import set_sqlite_pragmas
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# Файлы разделов хранилища: один файл SQLite на месяц
+PARTITION_FILE = "messages-{}.db3"
+PARTITION_PATTERN = re.compile(r"^messages-(\d{4}-\d{2})\.db3$")
+PARTITION_KEY_FORMAT = "%Y-%m"
+
+# Курсор страницы истории: id сообщения, с которого начинается
+# следующая (более ранняя) страница
+CURSOR_FORMAT = struct.Struct(">Q")
+
+message_metadata = MetaData()
+
+# Сообщения раздела. Переписка двух пользователей - пара имён
+# user_a < user_b, индекс по переписке и id выбирает страницу
+# переписки без просмотра остальных сообщений раздела.
+message_table = Table(
+    "message",
+    message_metadata,
+    Column("id", Integer, primary_key=True, autoincrement=False),
+    Column("user_a", String(255), nullable=False),
+    Column("user_b", String(255), nullable=False),
+    Column("from_user", String(255), nullable=False),
+    Column("to_user", String(255), nullable=False),
+    Column("date_time", DateTime, nullable=False),
+    Column("message", Text, nullable=False),
+    Index("ix_message_conversation", "user_a", "user_b", "id"),
+)
+
+
+def conversation(first, second):
+    """Функция ключа переписки двух пользователей: пара имён по порядку."""
+    return (first, second) if first <= second else (second, first)
+
+
+def encode_cursor(message_id):
+    """Функция создания курсора страницы истории по id сообщения."""
+    return (
+        base64.urlsafe_b64encode(CURSOR_FORMAT.pack(message_id))
+        .decode("ascii")
+        .rstrip("=")
+    )
+
+
+def decode_cursor(cursor):
+    """
+    Функция разбора курсора страницы истории, возвращает id
+    сообщения. При неверном курсоре вызывает ValueError.
+    """
+
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return CURSOR_FORMAT.unpack(data)[0]
+    except (TypeError, binascii.Error, struct.error):
+        raise ValueError(f"Bad history cursor: {cursor!r}")
+
+
+class MessageStore:
+    """
+    Класс - хранилище сообщений, переданных сервером, для выдачи
+    истории переписки клиентам (действие get_history).
+
+    Сообщения хранятся в разделах - отдельных файлах SQLite
+    messages-ГГГГ-ММ.db3 каталога path, по месяцу отправки, поэтому
+    старые месяцы можно архивировать или удалять целыми файлами.
+    Идентификаторы сообщений возрастают во всех разделах, новое
+    сообщение записывается в последний раздел: порядок id совпадает
+    с порядком разделов. Страницы истории выбираются от новых
+    сообщений к старым, курсор страницы не зависит от устройства
+    хранилища (encode_cursor).
+    """
+
+    def __init__(self, path, pragmas=SERVER_DATABASE_PRAGMAS):
+        self.path = path
+        self.pragmas = pragmas
+        os.makedirs(path, exist_ok=True)
+        self.lock = threading.Lock()
+        # Разделы по порядку месяцев: [ключ ГГГГ-ММ, ...] и движки
+        self.keys = []
+        self.engines = {}
+        # Наименьший id раздела, None - в разделе нет сообщений
+        self.first_ids = {}
+        self.next_id = 1
+        for name in sorted(os.listdir(path)):
+            match = PARTITION_PATTERN.match(name)
+            if match:
+                self.open_partition(match.group(1))
+        logger.debug(
+            "Message store %s: %s partitions, next id %s",
+            path,
+            len(self.keys),
+            self.next_id,
+        )
+
+    def open_partition(self, key):
+        """Метод открытия (создания) раздела с ключом key."""
+        engine = create_engine(
+            f"sqlite:///{os.path.join(self.path, PARTITION_FILE.format(key))}",
+            echo=False,
+            connect_args={"check_same_thread": False},
+        )
+        event.listen(
+            engine,
+            "connect",
+            partial(set_sqlite_pragmas, pragmas=self.pragmas),
+        )
+        message_metadata.create_all(engine)
+        with engine.connect() as connection:
+            first_id, last_id = connection.execute(
+                select(
+                    func.min(message_table.c.id), func.max(message_table.c.id)
+                )
+            ).one()
+        self.keys.append(key)
+        self.engines[key] = engine
+        self.first_ids[key] = first_id
+        if last_id is not None:
+            self.next_id = max(self.next_id, last_id + 1)
+        return engine
+
+    def close(self):
+        """Метод закрытия соединений всех разделов."""
+        for engine in self.engines.values():
+            engine.dispose()
+
+    def append(self, messages, date_time=None):
+        """
+        Метод сохранения сообщений одной транзакцией. messages -
+        словари с ключами from, to и message. Время сообщений пачки
+        различается на микросекунду: клиенты упорядочивают историю
+        по времени. Возвращает список id сообщений.
+        """
+
+        if not messages:
+            return []
+        date_time = date_time or datetime.utcnow()
+        with self.lock:
+            key = date_time.strftime(PARTITION_KEY_FORMAT)
+            if self.keys and key < self.keys[-1]:
+                # Часы переведены назад: id и разделы остаются
+                # упорядоченными
+                key = self.keys[-1]
+            if not self.keys or key != self.keys[-1]:
+                self.open_partition(key)
+            ids = list(range(self.next_id, self.next_id + len(messages)))
+            rows = []
+            for offset, (message_id, message) in enumerate(zip(ids, messages)):
+                user_a, user_b = conversation(message["from"], message["to"])
+                rows.append(
+                    {
+                        "id": message_id,
+                        "user_a": user_a,
+                        "user_b": user_b,
+                        "from_user": message["from"],
+                        "to_user": message["to"],
+                        "date_time": date_time
+                        + timedelta(microseconds=offset),
+                        "message": message["message"],
+                    }
+                )
+            with self.engines[key].begin() as connection:
+                connection.execute(message_table.insert(), rows)
+            self.next_id = ids[-1] + 1
+            if self.first_ids[key] is None:
+                self.first_ids[key] = ids[0]
+        return ids
+
+    def get_history(self, username, contact, cursor=None, limit=None):
+        """
+        Метод выборки страницы переписки пользователей username
+        и contact от новых сообщений к старым. cursor - курсор
+        предыдущей страницы (None - с последнего сообщения).
+        Возвращает кортеж (строки, курсор следующей страницы или None),
+        строки содержат поля id, from_user, to_user, date_time
+        и message. При неверном курсоре вызывает ValueError.
+        """
+
+        limit = limit or HISTORY_PAGE_SIZE
+        before = decode_cursor(cursor) if cursor is not None else None
+        user_a, user_b = conversation(username, contact)
+        with self.lock:
+            partitions = [
+                (key, self.engines[key])
+                for key in reversed(self.keys)
+                if self.first_ids[key] is not None
+                and (before is None or self.first_ids[key] < before)
+            ]
+        rows = []
+        for key, engine in partitions:
+            query = (
+                select(
+                    message_table.c.id,
+                    message_table.c.from_user,
+                    message_table.c.to_user,
+                    message_table.c.date_time,
+                    message_table.c.message,
+                )
+                .where(
+                    message_table.c.user_a == user_a,
+                    message_table.c.user_b == user_b,
+                )
+                .order_by(message_table.c.id.desc())
+                .limit(limit - len(rows))
+            )
+            if before is not None:
+                query = query.where(message_table.c.id < before)
+            with engine.connect() as connection:
+                rows.extend(connection.execute(query).all())
+            if len(rows) == limit:
+                return rows, encode_cursor(rows[-1].id)
+        return rows, None
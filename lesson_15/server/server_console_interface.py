@@ -1,4 +1,5 @@
-from app_utils.settings import SERVER_CONSOLE_COMMAND_LIST
+from app_utils.settings import LOGIN_HISTORY_PAGE, SERVER_CONSOLE_COMMAND_LIST
+from app_utils.utils import trace_stats
 
 
 def print_help():
@@ -7,10 +8,34 @@ def print_help():
     print("active_users - список подключенных пользователей")
     print("login_history - история входов пользователя")
     print("stat - статистика пользователя")
+    print("trace - статистика вызовов функций сервера")
     print("exit - завершение работы сервера.")
     print("help - вывод справки по поддерживаемым командам")
 
 
+def print_login_history(database, name):
+    """
+    Функция постраничного вывода истории входов: после каждой
+    страницы Enter выводит следующую, q - завершает вывод.
+    """
+
+    cursor = None
+    while True:
+        count = 0
+        for row in database.iter_login_history(name, cursor=cursor):
+            print(
+                f"Пользователь: {row.name}"
+                f" время входа: {row.date_time}."
+                f" Вход с: {row.ip_address}:{row.port}"
+            )
+            cursor = (row.date_time, row.id)
+            count += 1
+        if count < LOGIN_HISTORY_PAGE:
+            break
+        if input("Enter - следующая страница, q - завершить: ") == "q":
+            break
+
+
 def run_server_console_interface(server, database):
     """Функция консольного управления сервером"""
     while True:
@@ -39,12 +64,7 @@ def run_server_console_interface(server, database):
                 "Введите имя пользователя для просмотра истории."
                 " Для вывода всей истории, просто нажмите Enter: "
             )
-            for user in database.login_history(name):
-                print(
-                    f"Пользователь: {user['name']}"
-                    f" время входа: {user['date_time']}."
-                    f" Вход с: {user['ip_address']}:{user['port']}"
-                )
+            print_login_history(database, name)
         elif command == "stat":
             for user in database.get_user_statistic():
                 print(
@@ -52,5 +72,14 @@ def run_server_console_interface(server, database):
                     f" : sent: {user['sent_count']}"
                     f" received: {user['received_count']}"
                 )
+        elif command == "trace":
+            for name, stat in trace_stats().items():
+                print(
+                    f"{name}: calls: {stat['calls']},"
+                    f" traced: {stat['traced']},"
+                    f" sampled: {stat['sampled_time']:.6f}s,"
+                    f" total (est.): {stat['estimated_total']:.6f}s,"
+                    f" avg: {stat['avg_time']:.6f}s"
+                )
         else:
             print("Команда не распознана.")
@@ -1,32 +1,151 @@
+import gzip
+import json
 import logging
-from datetime import datetime
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from functools import partial
 
 from sqlalchemy import (
+    Boolean,
     Column,
+    Date,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
     String,
+    UniqueConstraint,
     create_engine,
+    event,
     func,
+    inspect,
+    select,
+    text,
+    tuple_,
 )
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import NoResultFound, SQLAlchemyError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy.orm import relationship, scoped_session, sessionmaker
 
 import log.server_log_config  # noqa
+from app_utils.settings import (
+    LOGIN_HISTORY_PAGE,
+    RETENTION_BATCH,
+    RETENTION_PAUSE,
+    SERVER_DATABASE_MAX_OVERFLOW,
+    SERVER_DATABASE_POOL_SIZE,
+    SERVER_DATABASE_PRAGMA_CHOICES,
+    SERVER_DATABASE_PRAGMAS,
+    SERVER_DATABASE_PROFILE,
+    SERVER_DATABASE_PROFILES,
+)
 from log.server_log_config import LOGGER_NAME
 
 logger = logging.getLogger(LOGGER_NAME)
 
 Base = declarative_base()
 
+# Удаление повторяющихся строк перед созданием уникального индекса
+# в базе предыдущих версий: остаётся первая строка, счётчики
+# статистики повторяющихся строк суммируются.
+DEDUPLICATE_STATEMENTS = {
+    "ux_user_contact_user_contact": (
+        "DELETE FROM user_contact WHERE id NOT IN"
+        " (SELECT min(id) FROM user_contact GROUP BY user_id, contact_id)",
+    ),
+    "ux_user_statistic_user": (
+        "UPDATE user_statistic SET"
+        " sent_count = (SELECT sum(sent_count) FROM user_statistic AS s"
+        " WHERE s.user_id = user_statistic.user_id),"
+        " received_count = (SELECT sum(received_count)"
+        " FROM user_statistic AS s"
+        " WHERE s.user_id = user_statistic.user_id)"
+        " WHERE id IN (SELECT min(id) FROM user_statistic"
+        " GROUP BY user_id HAVING count(*) > 1)",
+        "DELETE FROM user_statistic WHERE id NOT IN"
+        " (SELECT min(id) FROM user_statistic GROUP BY user_id)",
+    ),
+}
+
+
+# Параметры, применяемые к соединениям только для чтения: режим журнала
+# и синхронизация относятся к записи
+READ_PRAGMAS = ("cache_size", "mmap_size", "temp_store", "busy_timeout")
+
+
+def storage_pragmas(profile=SERVER_DATABASE_PROFILE, **overrides):
+    """
+    Функция формирования параметров соединений базы сервера: параметры
+    профиля profile из SERVER_DATABASE_PROFILES, заменённые непустыми
+    значениями overrides. Проверяет значения, при ошибке
+    вызывает ValueError.
+    """
+
+    if profile not in SERVER_DATABASE_PROFILES:
+        raise ValueError(f"Unknown storage profile: {profile}")
+    pragmas = dict(SERVER_DATABASE_PROFILES[profile])
+    for name, value in overrides.items():
+        if name not in pragmas:
+            raise ValueError(f"Unknown storage parameter: {name}")
+        if value is None or str(value).strip() == "":
+            continue
+        value = str(value).strip()
+        if name in SERVER_DATABASE_PRAGMA_CHOICES:
+            value = value.upper()
+            if value not in SERVER_DATABASE_PRAGMA_CHOICES[name]:
+                raise ValueError(f"Wrong value of {name}: {value}")
+        else:
+            try:
+                value = int(value)
+            except ValueError:
+                raise ValueError(f"{name} must be an integer") from None
+        pragmas[name] = value
+    return pragmas
+
+
+def set_sqlite_pragmas(
+    dbapi_connection, connection_record, pragmas=SERVER_DATABASE_PRAGMAS
+):
+    """Функция настройки соединения SQLite параметрами pragmas."""
+
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+
+def set_read_only(
+    dbapi_connection, connection_record, pragmas=SERVER_DATABASE_PRAGMAS
+):
+    """
+    Функция настройки соединения чтения: запрещает изменение базы
+    и задаёт параметры чтения из pragmas (кэш, mmap, время ожидания
+    блокировки).
+    """
+
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only = 1")
+    for name in READ_PRAGMAS:
+        cursor.execute(f"PRAGMA {name} = {pragmas[name]}")
+    cursor.close()
+
 
 class ServerStorage:
     """
     Класс - оболочка для работы с базой данных сервера.
     Использует SQLite базу данных, реализован с помощью
     SQLAlchemy ORM и используется декларативный подход.
+
+    Параметры соединений SQLite (режим журнала, синхронизация, кэш)
+    задаются словарём pragmas, по умолчанию база работает в режиме
+    WAL. Запись и запросы потока сервера
+    выполняются через self.session - своя сессия для каждого потока
+    (scoped_session) из пула соединений. Методы чтения для окон
+    и консоли (списки пользователей, история входов, статистика)
+    открывают короткую сессию только для чтения и не блокируют запись.
     """
 
     class User(Base):
@@ -43,6 +162,10 @@ class ServerStorage:
             DateTime, default=datetime.utcnow, server_default=func.now()
         )
         passwd_hash = Column(String(255), nullable=False)
+        # Версия списка контактов, увеличивается при каждом изменении
+        contacts_version = Column(
+            Integer, nullable=False, default=0, server_default="0"
+        )
 
         active_user = relationship(
             "ActiveUser", uselist=False, back_populates="user"
@@ -95,12 +218,68 @@ class ServerStorage:
 
         user = relationship("User", back_populates="login_history")
 
+        # История входов всех пользователей и одного пользователя
+        # в порядке времени
+        __table_args__ = (
+            Index("ix_login_history_date", "date_time"),
+            Index("ix_login_history_user_date", "user_id", "date_time"),
+        )
+
         def __str__(self):
             return (
                 f"{self.user.name} - {self.date_time} "
                 f"- {self.ip_address}:{self.port}"
             )
 
+    class LoginDaily(Base):
+        """
+        Класс - отображение таблицы дневной статистики входов:
+        история входов старше срока хранения, свёрнутая по дням.
+        """
+
+        __tablename__ = "login_daily"
+
+        id = Column(Integer, primary_key=True)
+        user_id = Column(ForeignKey("user.id"), nullable=False)
+        day = Column(Date, nullable=False)
+        logins = Column(Integer, nullable=False, default=0)
+        distinct_ips = Column(Integer, nullable=False, default=0)
+        first_seen = Column(DateTime, nullable=False)
+        last_seen = Column(DateTime, nullable=False)
+
+        __table_args__ = (
+            Index("ux_login_daily_user_day", "user_id", "day", unique=True),
+        )
+
+        def __str__(self):
+            return f"{self.user_id} - {self.day} - {self.logins}"
+
+    class LoginDailyIp(Base):
+        """
+        Класс - отображение таблицы адресов входов за день, по ней
+        считается количество различных адресов дневной статистики.
+        """
+
+        __tablename__ = "login_daily_ip"
+
+        id = Column(Integer, primary_key=True)
+        user_id = Column(ForeignKey("user.id"), nullable=False)
+        day = Column(Date, nullable=False)
+        ip_address = Column(String(40), nullable=False)
+
+        __table_args__ = (
+            Index(
+                "ux_login_daily_ip_user_day_ip",
+                "user_id",
+                "day",
+                "ip_address",
+                unique=True,
+            ),
+        )
+
+        def __str__(self):
+            return f"{self.user_id} - {self.day} - {self.ip_address}"
+
     class UserContact(Base):
         """
         Класс - отображение таблицы контактов пользователей.
@@ -118,9 +297,48 @@ class ServerStorage:
         user = relationship("User", foreign_keys=[user_id])
         contact = relationship("User", foreign_keys=[contact_id])
 
+        # Контакт добавляется пользователю один раз, индекс по
+        # contact_id нужен для удаления пользователя из чужих списков
+        __table_args__ = (
+            Index(
+                "ux_user_contact_user_contact",
+                "user_id",
+                "contact_id",
+                unique=True,
+            ),
+            Index("ix_user_contact_contact", "contact_id"),
+        )
+
         def __str__(self):
             return f"{self.user.name} - {self.contact.name}"
 
+    class ContactChange(Base):
+        """
+        Класс - отображение журнала изменений списков контактов.
+        Для каждой пары пользователь - контакт хранится последнее
+        изменение: версия списка контактов, в которой оно сделано,
+        и признак удаления контакта.
+        """
+
+        __tablename__ = "contact_change"
+
+        id = Column(Integer, primary_key=True)
+        user_id = Column(ForeignKey("user.id"), nullable=False)
+        contact_name = Column(String(255), nullable=False)
+        version = Column(Integer, nullable=False)
+        deleted = Column(Boolean, nullable=False, default=False)
+
+        __table_args__ = (
+            UniqueConstraint("user_id", "contact_name"),
+            Index("ix_contact_change_user_version", "user_id", "version"),
+        )
+
+        def __str__(self):
+            return (
+                f"{self.user_id} - {self.contact_name}"
+                f" - {self.version} - {self.deleted}"
+            )
+
     class UserStatistic(Base):
         """
         Класс - отображение таблицы статистики.
@@ -135,13 +353,20 @@ class ServerStorage:
 
         user = relationship("User", back_populates="statistic")
 
+        # Одна строка статистики на пользователя
+        __table_args__ = (
+            Index("ux_user_statistic_user", "user_id", unique=True),
+        )
+
         def __str__(self):
             return (
                 f"{self.user.name} - Sent: {self.sent_count}"
                 f" - Accepted: {self.received_count}"
             )
 
-    def __init__(self, path):
+    def __init__(self, path, pragmas=SERVER_DATABASE_PRAGMAS):
+        # Параметры соединений SQLite (профиль секции [STORAGE] server.ini)
+        self.pragmas = pragmas
         # Создаём движок базы данных
         # echo=False - отключаем ведение лога (вывод sql-запросов)
         # pool_recycle -
@@ -152,16 +377,98 @@ class ServerStorage:
             f"sqlite:///{path}",
             echo=False,
             pool_recycle=7200,
+            pool_size=SERVER_DATABASE_POOL_SIZE,
+            max_overflow=SERVER_DATABASE_MAX_OVERFLOW,
             connect_args={"check_same_thread": False},
         )
+        event.listen(
+            self.engine,
+            "connect",
+            partial(set_sqlite_pragmas, pragmas=self.pragmas),
+        )
         Base.metadata.create_all(self.engine)
+        self.migrate()
+        # Соединения только для чтения (окна и консоль сервера)
+        self.read_engine = create_engine(
+            f"sqlite:///file:{os.path.abspath(path)}?mode=ro&uri=true",
+            echo=False,
+            pool_recycle=7200,
+            pool_size=SERVER_DATABASE_POOL_SIZE,
+            max_overflow=SERVER_DATABASE_MAX_OVERFLOW,
+            connect_args={"check_same_thread": False},
+        )
+        event.listen(
+            self.read_engine,
+            "connect",
+            partial(set_read_only, pragmas=self.pragmas),
+        )
 
-        # Создаём сессию
-        Session = sessionmaker(bind=self.engine)  # noqa
-        self.session = Session()
+        # Создаём сессии: сессия записи своя в каждом потоке
+        self.Session = sessionmaker(bind=self.engine)  # noqa
+        self.session = scoped_session(self.Session)
+        self.ReadSession = sessionmaker(bind=self.read_engine)  # noqa
         self.session.query(self.ActiveUser).delete()
         self.session.commit()
 
+    def migrate(self):
+        """
+        Функция обновления схемы базы, созданной предыдущими версиями:
+        добавляет версию списка контактов пользователя и создаёт
+        недостающие индексы. Перед созданием уникального индекса
+        удаляются повторяющиеся строки.
+        """
+
+        with self.engine.begin() as connection:
+            inspector = inspect(connection)
+            columns = {
+                column["name"] for column in inspector.get_columns("user")
+            }
+            if "contacts_version" not in columns:
+                self.migrate_contacts_version(connection)
+            for table in Base.metadata.sorted_tables:
+                existing = {
+                    index["name"]
+                    for index in inspector.get_indexes(table.name)
+                }
+                for index in table.indexes:
+                    if index.name in existing:
+                        continue
+                    for statement in DEDUPLICATE_STATEMENTS.get(
+                        index.name, ()
+                    ):
+                        connection.execute(text(statement))
+                    index.create(connection)
+                    logger.info("Index %s created", index.name)
+
+    @staticmethod
+    def migrate_contacts_version(connection):
+        """
+        Функция добавления версии списка контактов пользователя
+        и заполнения журнала изменений существующими контактами.
+        """
+
+        connection.execute(
+            text(
+                "ALTER TABLE user ADD COLUMN contacts_version INTEGER"
+                " NOT NULL DEFAULT 0"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT OR IGNORE INTO contact_change"
+                " (user_id, contact_name, version, deleted)"
+                " SELECT DISTINCT user_contact.user_id, user.name, 1, 0"
+                " FROM user_contact"
+                " JOIN user ON user.id = user_contact.contact_id"
+            )
+        )
+        connection.execute(
+            text(
+                "UPDATE user SET contacts_version = 1 WHERE id IN"
+                " (SELECT user_id FROM contact_change)"
+            )
+        )
+
     def data_as_dict(self, data_in_tuple):
         """
         Метод конвертации списка в словарь, использую данные ответа из query
@@ -229,11 +536,26 @@ class ServerStorage:
 
     def remove_user(self, name):
         """Метод удаляющий пользователя из базы."""
-        user = self.session.query(self.User).filter_by(name=name).first()
+        user = self.session.query(self.User).filter_by(name=name).one()
+        # Удаление из списков контактов других пользователей
+        for owner in (
+            self.session.query(self.User)
+            .join(self.UserContact, self.UserContact.user_id == self.User.id)
+            .filter(self.UserContact.contact_id == user.id)
+            .distinct()
+        ):
+            self.record_contact_change(owner, name, deleted=True)
+        self.session.query(self.ContactChange).filter_by(
+            user_id=user.id
+        ).delete()
         self.session.query(self.ActiveUser).filter_by(user_id=user.id).delete()
         self.session.query(self.LoginHistory).filter_by(
             user_id=user.id
         ).delete()
+        self.session.query(self.LoginDaily).filter_by(user_id=user.id).delete()
+        self.session.query(self.LoginDailyIp).filter_by(
+            user_id=user.id
+        ).delete()
         self.session.query(self.UserContact).filter_by(
             user_id=user.id
         ).delete()
@@ -265,29 +587,31 @@ class ServerStorage:
 
     def user_list(self):
         """Метод получения списка пользователя"""
-        data = (
-            self.session.query(self.User.name, self.User.last_login)
-            .order_by(self.User.name)
-            .all()
-        )
+        with self.ReadSession() as session:
+            data = (
+                session.query(self.User.name, self.User.last_login)
+                .order_by(self.User.name)
+                .all()
+            )
         return self.data_as_dict(data)
 
     def active_users_list(self):
         """Метод получения активных пользователей"""
         # Запрашиваем соединение таблиц
         # и собираем кортежи имя, адрес, порт, время.
-        query = (
-            self.session.query(
-                self.User.name,
-                self.ActiveUser.ip_address,
-                self.ActiveUser.port,
-                self.ActiveUser.login_time,
+        with self.ReadSession() as session:
+            query = (
+                session.query(
+                    self.User.name,
+                    self.ActiveUser.ip_address,
+                    self.ActiveUser.port,
+                    self.ActiveUser.login_time,
+                )
+                .join(self.User)
+                .order_by(self.ActiveUser.login_time.desc())  # noqa
             )
-            .join(self.User)
-            .order_by(self.ActiveUser.login_time.desc())  # noqa
-        )
-        # Кортежи в словари
-        return self.data_as_dict(query.all())
+            # Кортежи в словари
+            return self.data_as_dict(query.all())
 
     def login_history(self, username=None):
         """
@@ -296,19 +620,235 @@ class ServerStorage:
         """
 
         # Запрашиваем историю входа
-        query = self.session.query(
+        with self.ReadSession() as session:
+            query = session.query(
+                self.User.name,
+                self.LoginHistory.date_time,
+                self.LoginHistory.ip_address,
+                self.LoginHistory.port,
+            ).join(self.User)
+            # Если было указано имя пользователя, то фильтруем по нему
+            if username:
+                query = query.filter(self.User.name == username)
+            data_from_db = query.order_by(
+                self.LoginHistory.date_time.desc(), self.User.name
+            ).all()  # noqa
+        return self.data_as_dict(data_from_db)
+
+    def iter_login_history(
+        self,
+        username=None,
+        since=None,
+        until=None,
+        cursor=None,
+        limit=LOGIN_HISTORY_PAGE,
+    ):
+        """
+        Метод постраничного чтения истории входов, от новых к старым.
+        Записи можно отфильтровать по имени пользователя и интервалу
+        времени [since, until) (datetime в UTC). cursor - кортеж
+        (date_time, id) последней записи предыдущей страницы.
+        Возвращает итератор не более чем limit строк с полями id,
+        name, date_time, ip_address и port.
+
+        Страница выбирается по индексу (date_time) или (user_id,
+        date_time), поэтому время выборки не зависит от размера
+        истории.
+        """
+
+        history = self.LoginHistory
+        query = select(
+            history.id,
             self.User.name,
-            self.LoginHistory.date_time,
-            self.LoginHistory.ip_address,
-            self.LoginHistory.port,
-        ).join(self.User)
-        # Если было указано имя пользователя, то фильтруем по нему
+            history.date_time,
+            history.ip_address,
+            history.port,
+        ).join(self.User, self.User.id == history.user_id)
         if username:
-            query = query.filter(self.User.name == username)
-        data_from_db = query.order_by(
-            self.LoginHistory.date_time.desc(), self.User.name
-        ).all()  # noqa
-        return self.data_as_dict(data_from_db)
+            query = query.where(self.User.name == username)
+        if since is not None:
+            query = query.where(history.date_time >= since)
+        if until is not None:
+            query = query.where(history.date_time < until)
+        if cursor is not None:
+            query = query.where(
+                tuple_(history.date_time, history.id) < tuple_(*cursor)
+            )
+        query = query.order_by(
+            history.date_time.desc(), history.id.desc()
+        ).limit(limit)
+        # Страница ограничена limit строками и читается целиком,
+        # чтобы сразу вернуть соединение в пул
+        with self.ReadSession() as session:
+            return iter(session.execute(query).all())
+
+    def archive_login_history(
+        self, before, archive_path, batch_size=RETENTION_BATCH
+    ):
+        """
+        Метод архивирования одной пачки истории входов старше before
+        (datetime в UTC). Записи дописываются в сжатые архивы
+        archive_path/login_history-ГГГГ-ММ.jsonl.gz (по месяцу входа),
+        сворачиваются в дневную статистику login_daily и удаляются.
+        Статистика и удаление фиксируются одной транзакцией после
+        записи архива, поэтому при сбое записи могут попасть в архив
+        повторно, но не теряются. Выполняется в отдельной сессии,
+        блокировка записи удерживается на время одной пачки.
+        Возвращает количество обработанных записей.
+        """
+
+        history = self.LoginHistory
+        with self.Session() as session, session.begin():
+            rows = session.execute(
+                select(
+                    history.id,
+                    history.user_id,
+                    self.User.name,
+                    history.date_time,
+                    history.ip_address,
+                    history.port,
+                )
+                .join(self.User, self.User.id == history.user_id)
+                .where(history.date_time < before)
+                .order_by(history.date_time, history.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                return 0
+            self.write_login_archive(rows, archive_path)
+            self.rollup_login_history(session, rows)
+            session.execute(
+                history.__table__.delete().where(
+                    history.id.in_([row.id for row in rows])
+                )
+            )
+        logger.debug("Login history archived: %s rows", len(rows))
+        return len(rows)
+
+    @staticmethod
+    def write_login_archive(rows, archive_path):
+        """
+        Метод записи строк истории входов в архивы по месяцам.
+        Данные сбрасываются на диск до удаления строк из базы.
+        """
+
+        months = defaultdict(list)
+        for row in rows:
+            months[row.date_time.strftime("%Y-%m")].append(row)
+        os.makedirs(archive_path, exist_ok=True)
+        for month, month_rows in months.items():
+            path = os.path.join(
+                archive_path, f"login_history-{month}.jsonl.gz"
+            )
+            with open(path, "ab") as file:
+                with gzip.GzipFile(fileobj=file, mode="ab") as archive:
+                    for row in month_rows:
+                        record = {
+                            "id": row.id,
+                            "name": row.name,
+                            "date_time": row.date_time.isoformat(),
+                            "ip_address": row.ip_address,
+                            "port": row.port,
+                        }
+                        archive.write(
+                            json.dumps(record, ensure_ascii=False).encode()
+                            + b"\n"
+                        )
+                file.flush()
+                os.fsync(file.fileno())
+
+    def rollup_login_history(self, session, rows):
+        """
+        Метод добавления строк истории входов в дневную статистику:
+        количество входов, время первого и последнего входа
+        и количество различных адресов пользователя за день.
+        """
+
+        days = {}
+        addresses = set()
+        for row in rows:
+            key = (row.user_id, row.date_time.date())
+            logins, first_seen, last_seen = days.get(
+                key, (0, row.date_time, row.date_time)
+            )
+            days[key] = (
+                logins + 1,
+                min(first_seen, row.date_time),
+                max(last_seen, row.date_time),
+            )
+            addresses.add((*key, row.ip_address))
+
+        daily = self.LoginDaily.__table__
+        statement = insert(daily)
+        session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[daily.c.user_id, daily.c.day],
+                set_={
+                    "logins": daily.c.logins + statement.excluded.logins,
+                    "first_seen": func.min(
+                        daily.c.first_seen, statement.excluded.first_seen
+                    ),
+                    "last_seen": func.max(
+                        daily.c.last_seen, statement.excluded.last_seen
+                    ),
+                },
+            ),
+            [
+                {
+                    "user_id": user_id,
+                    "day": day,
+                    "logins": logins,
+                    "distinct_ips": 0,
+                    "first_seen": first_seen,
+                    "last_seen": last_seen,
+                }
+                for (user_id, day), (logins, first_seen, last_seen) in (
+                    days.items()
+                )
+            ],
+        )
+        daily_ip = self.LoginDailyIp.__table__
+        session.execute(
+            insert(daily_ip).on_conflict_do_nothing(),
+            [
+                {"user_id": user_id, "day": day, "ip_address": ip_address}
+                for user_id, day, ip_address in addresses
+            ],
+        )
+        session.execute(
+            daily.update()
+            .where(tuple_(daily.c.user_id, daily.c.day).in_(list(days)))
+            .values(
+                distinct_ips=select(func.count())
+                .where(
+                    daily_ip.c.user_id == daily.c.user_id,
+                    daily_ip.c.day == daily.c.day,
+                )
+                .scalar_subquery()
+            )
+        )
+
+    def login_daily(self, username=None):
+        """
+        Метод возвращающий дневную статистику входов, свёрнутую
+        из архивированной истории, от новых дней к старым.
+        """
+
+        daily = self.LoginDaily
+        with self.ReadSession() as session:
+            query = session.query(
+                self.User.name,
+                daily.day,
+                daily.logins,
+                daily.distinct_ips,
+                daily.first_seen,
+                daily.last_seen,
+            ).join(self.User, self.User.id == daily.user_id)
+            if username:
+                query = query.filter(self.User.name == username)
+            return self.data_as_dict(
+                query.order_by(daily.day.desc(), self.User.name).all()
+            )
 
     def add_contact(self, user_name, contact_name):
         """Метод добавления контакта для пользователя."""
@@ -335,6 +875,7 @@ class ServerStorage:
             user_id=user.id, contact_id=user_for_contact.id
         )
         self.session.add(new_user_contact)
+        self.record_contact_change(user, contact_name, deleted=False)
         self.session.commit()
         logger.debug(f"New contact added successfully {new_user_contact}")
 
@@ -353,11 +894,70 @@ class ServerStorage:
 
         if not user_for_contact:
             raise SQLAlchemyError("Contact not in user list")
-        self.session.query(self.UserContact).filter_by(
-            user_id=user.id, contact_id=user_for_contact.id
-        ).delete()
+        deleted = (
+            self.session.query(self.UserContact)
+            .filter_by(user_id=user.id, contact_id=user_for_contact.id)
+            .delete()
+        )
+        if deleted:
+            self.record_contact_change(user, contact_name, deleted=True)
         self.session.commit()
 
+    def record_contact_change(self, user, contact_name, deleted):
+        """
+        Метод записи изменения списка контактов пользователя user:
+        увеличивает версию списка и сохраняет изменение в журнал.
+        Изменения фиксирует вызывающий метод.
+        """
+
+        user.contacts_version += 1
+        change = (
+            self.session.query(self.ContactChange)
+            .filter_by(user_id=user.id, contact_name=contact_name)
+            .one_or_none()
+        )
+        if change:
+            change.version = user.contacts_version
+            change.deleted = deleted
+        else:
+            self.session.add(
+                self.ContactChange(
+                    user_id=user.id,
+                    contact_name=contact_name,
+                    version=user.contacts_version,
+                    deleted=deleted,
+                )
+            )
+
+    def get_contacts_since(self, username, version):
+        """
+        Метод возвращает изменения списка контактов пользователя
+        после версии version: словарь с текущей версией (version),
+        добавленными (added) и удалёнными (deleted) контактами.
+        Если у клиента нет версии или она неизвестна серверу,
+        возвращается полный список контактов с признаком full.
+        """
+
+        user = self.session.query(self.User).filter_by(name=username).one()
+        changes = {
+            "version": user.contacts_version,
+            "full": not 0 < version <= user.contacts_version,
+            "added": [],
+            "deleted": [],
+        }
+        if changes["full"]:
+            changes["added"] = self.get_user_contacts(username)
+            return changes
+        query = self.session.query(
+            self.ContactChange.contact_name, self.ContactChange.deleted
+        ).filter(
+            self.ContactChange.user_id == user.id,
+            self.ContactChange.version > version,
+        )
+        for contact_name, deleted in query.all():
+            changes["deleted" if deleted else "added"].append(contact_name)
+        return changes
+
     def get_user_contacts(self, username):
         """Метод возвращает список контактов пользователя."""
         # id пользователя
@@ -412,11 +1012,16 @@ class ServerStorage:
             user_recipient.received_count += 1
         else:
             # Если нет создаем запись
-            user = (
-                self.session.query(self.User)
-                .filter(self.User.name == to_user)
-                .one()
-            )
+            try:
+                user = (
+                    self.session.query(self.User)
+                    .filter(self.User.name == to_user)
+                    .one()
+                )
+            except NoResultFound:
+                # Отменяем изменение статистики отправителя
+                self.session.rollback()
+                raise
             user_recipient = self.UserStatistic(
                 user_id=user.id, received_count=1
             )
@@ -424,15 +1029,41 @@ class ServerStorage:
 
         self.session.commit()
 
+    def increment_user_statistic(self, username, sent=0, received=0):
+        """
+        Метод увеличения счётчиков отправленных и полученных сообщений
+        одного пользователя (статистика пользователей разных
+        сегментов ShardedStorage).
+        """
+
+        statistic = (
+            self.session.query(self.UserStatistic)
+            .join(self.UserStatistic.user)
+            .filter(self.User.name == username)
+            .one_or_none()
+        )
+        if statistic:
+            statistic.sent_count += sent
+            statistic.received_count += received
+        else:
+            user = self.session.query(self.User).filter_by(name=username).one()
+            self.session.add(
+                self.UserStatistic(
+                    user_id=user.id, sent_count=sent, received_count=received
+                )
+            )
+        self.session.commit()
+
     def get_user_statistic(self):
         """Метод получающий статистику всех пользователе"""
-        query = self.session.query(
-            self.User.name,
-            self.User.last_login,
-            self.UserStatistic.sent_count,
-            self.UserStatistic.received_count,
-        ).join(self.User)
-        return self.data_as_dict(query.all())
+        with self.ReadSession() as session:
+            query = session.query(
+                self.User.name,
+                self.User.last_login,
+                self.UserStatistic.sent_count,
+                self.UserStatistic.received_count,
+            ).join(self.User)
+            return self.data_as_dict(query.all())
 
     def get_hash(self, name):
         """Метод получения хэша пароля пользователя."""
@@ -444,5 +1075,61 @@ class ServerStorage:
         return passwd_hash[0]
 
 
+class LoginHistoryRetention(threading.Thread):
+    """
+    Класс - поток хранения истории входов. Каждые interval секунд
+    архивирует записи старше max_age_days дней пачками по batch_size
+    (ServerStorage.archive_login_history) с паузой pause между
+    пачками, чтобы не задерживать запись в базу сервером.
+    """
+
+    def __init__(
+        self,
+        database,
+        max_age_days,
+        archive_path,
+        interval=3600,
+        batch_size=RETENTION_BATCH,
+        pause=RETENTION_PAUSE,
+    ):
+        super().__init__(daemon=True)
+        self.database = database
+        self.max_age = timedelta(days=max_age_days)
+        self.archive_path = archive_path
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.stopped = threading.Event()
+
+    def run_once(self):
+        """Метод архивирования всех устаревших записей пачками."""
+        before = datetime.utcnow() - self.max_age
+        total = 0
+        while not self.stopped.is_set():
+            count = self.database.archive_login_history(
+                before, self.archive_path, self.batch_size
+            )
+            total += count
+            if count < self.batch_size:
+                break
+            self.stopped.wait(self.pause)
+        if total:
+            logger.info("Login history retention: %s rows archived", total)
+        return total
+
+    def run(self):
+        """Метод содержащий основной цикл потока хранения."""
+        while not self.stopped.is_set():
+            try:
+                self.run_once()
+            except (SQLAlchemyError, OSError) as e:
+                logger.error("Login history retention error: %s", e)
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        """Метод остановки потока хранения."""
+        self.stopped.set()
+
+
 if __name__ == "__main__":
     pass
@@ -0,0 +1,444 @@
+import heapq
+import logging
+import os
+import threading
+import zlib
+from functools import partial
+
+from sqlalchemy import (
+    Column,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    create_engine,
+    event,
+    select,
+)
+from sqlalchemy.exc import NoResultFound, SQLAlchemyError
+
+import log.server_log_config  # noqa
+from app_utils.settings import (
+    LOGIN_HISTORY_PAGE,
+    RETENTION_BATCH,
+    SERVER_DATABASE_PRAGMAS,
+    SERVER_DATABASE_SHARDS,
+)
+from log.server_log_config import LOGGER_NAME
+from server.memory_storage import LoginRow
+from server.server_database import ServerStorage, set_sqlite_pragmas
+
+logger = logging.getLogger(LOGGER_NAME)
+
+# Файл каталога пользователей и имена файлов сегментов
+DIRECTORY_FILE = "directory.db3"
+SHARD_FILE = "shard_{}.db3"
+
+# Хэш пароля записи контакта из другого сегмента: по такой записи
+# войти нельзя, она нужна только для списка контактов владельца
+STUB_PASSWD_HASH = ""
+
+directory_metadata = MetaData()
+
+# Файлы сегментов, номер сегмента - индекс в списке
+shard_table = Table(
+    "shard",
+    directory_metadata,
+    Column("id", Integer, primary_key=True, autoincrement=False),
+    Column("file", String(255), nullable=False),
+)
+
+# Сегмент пользователя
+user_shard_table = Table(
+    "user_shard",
+    directory_metadata,
+    Column("name", String(255), primary_key=True),
+    Column("shard", Integer, nullable=False),
+)
+
+
+def shard_for_name(name, shards):
+    """
+    Функция выбора сегмента нового пользователя: стабильный
+    хэш имени (не зависит от запуска интерпретатора).
+    """
+
+    return zlib.crc32(name.encode()) % shards
+
+
+class ShardedStorage:
+    """
+    Класс - хранилище сервера, разделённое по пользователям на
+    несколько файлов SQLite (сегментов) с интерфейсом ServerStorage.
+
+    Каждый сегмент - база ServerStorage. Пользователь, его история
+    входов, контакты, журнал изменений контактов и статистика хранятся
+    в сегменте пользователя, каталог (directory.db3) хранит сегмент
+    каждого пользователя. Новый пользователь попадает в сегмент
+    shard_for_name. Количество сегментов shards задаётся при создании
+    хранилища (по умолчанию SERVER_DATABASE_SHARDS) и меняется
+    утилитой reshard.py.
+
+    Контакт из другого сегмента добавляется в сегмент владельца
+    записью пользователя без пароля (STUB_PASSWD_HASH), такие записи
+    удаляются вместе с пользователем (remove_user). Списки всех
+    пользователей и истории объединяются из всех сегментов.
+    Идентификатор строки истории iter_login_history -
+    id * количество сегментов + номер сегмента.
+    """
+
+    def __init__(self, path, shards=None, pragmas=SERVER_DATABASE_PRAGMAS):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.directory = create_engine(
+            f"sqlite:///{os.path.join(path, DIRECTORY_FILE)}",
+            echo=False,
+            connect_args={"check_same_thread": False},
+        )
+        event.listen(
+            self.directory,
+            "connect",
+            partial(set_sqlite_pragmas, pragmas=pragmas),
+        )
+        directory_metadata.create_all(self.directory)
+        self.lock = threading.Lock()
+
+        with self.directory.begin() as connection:
+            files = connection.execute(
+                select(shard_table.c.file).order_by(shard_table.c.id)
+            ).scalars()
+            files = list(files)
+            if not files:
+                files = [
+                    SHARD_FILE.format(index)
+                    for index in range(shards or SERVER_DATABASE_SHARDS)
+                ]
+                connection.execute(
+                    shard_table.insert(),
+                    [
+                        {"id": index, "file": file}
+                        for index, file in enumerate(files)
+                    ],
+                )
+            elif shards and len(files) != shards:
+                logger.warning(
+                    "Storage %s has %s shards, use reshard.py to change",
+                    path,
+                    len(files),
+                )
+            # Каталог пользователей невелик и хранится в памяти
+            self.user_shards = dict(
+                connection.execute(
+                    select(user_shard_table.c.name, user_shard_table.c.shard)
+                ).all()
+            )
+        self.shards = [
+            ServerStorage(os.path.join(path, file), pragmas=pragmas)
+            for file in files
+        ]
+
+    def close(self):
+        """Метод закрытия соединений сегментов и каталога."""
+        for shard in self.shards:
+            shard.session.remove()
+            shard.engine.dispose()
+            shard.read_engine.dispose()
+        self.directory.dispose()
+
+    def shard_index(self, username):
+        """Метод номера сегмента пользователя (None - нет такого)."""
+        return self.user_shards.get(username)
+
+    def shard_of(self, username):
+        """
+        Метод сегмента пользователя, если пользователь не найден -
+        NoResultFound (как Query.one() ServerStorage).
+        """
+
+        index = self.user_shards.get(username)
+        if index is None:
+            raise NoResultFound("No row was found when one was required")
+        return self.shards[index]
+
+    def is_home(self, index, username):
+        """Метод проверки: запись username в сегменте index не копия."""
+        return self.user_shards.get(username) == index
+
+    def user_login(self, username, ip_address, port):
+        """Метод выполняющийся при входе пользователя."""
+        if username not in self.user_shards:
+            raise ValueError(f"User not exist {username}")
+        self.shard_of(username).user_login(username, ip_address, port)
+
+    def add_update_user(self, username, passwd_hash):
+        """
+        Метод добавления пользователя или обновления ему пароля,
+        новый пользователь записывается в каталог.
+        """
+
+        with self.lock:
+            index = self.user_shards.get(username)
+            if index is None:
+                index = shard_for_name(username, len(self.shards))
+                with self.directory.begin() as connection:
+                    connection.execute(
+                        user_shard_table.insert(),
+                        {"name": username, "shard": index},
+                    )
+                self.user_shards[username] = index
+        self.shards[index].add_update_user(username, passwd_hash)
+
+    def remove_user(self, name):
+        """
+        Метод удаляющий пользователя из его сегмента, а также из
+        списков контактов пользователей всех сегментов.
+        """
+
+        self.shard_of(name)
+        for shard in self.shards:
+            if shard.user_exists(name):
+                shard.remove_user(name)
+        with self.lock:
+            with self.directory.begin() as connection:
+                connection.execute(
+                    user_shard_table.delete().where(
+                        user_shard_table.c.name == name
+                    )
+                )
+            del self.user_shards[name]
+
+    def user_exists(self, username):
+        """Метод проверяющий существование пользователя."""
+        return username in self.user_shards
+
+    def user_logout(self, username):
+        """Метод фиксирующий отключения пользователя."""
+        self.shard_of(username).user_logout(username)
+
+    def user_list(self):
+        """Метод получения списка пользователей всех сегментов."""
+        return list(
+            heapq.merge(
+                *(
+                    [
+                        user
+                        for user in shard.user_list()
+                        if self.is_home(index, user["name"])
+                    ]
+                    for index, shard in enumerate(self.shards)
+                ),
+                key=lambda user: user["name"],
+            )
+        )
+
+    def active_users_list(self):
+        """Метод получения активных пользователей всех сегментов."""
+        return list(
+            heapq.merge(
+                *(shard.active_users_list() for shard in self.shards),
+                key=lambda user: user["login_time"],
+                reverse=True,
+            )
+        )
+
+    def login_history(self, username=None):
+        """
+        Функция возвращающая историю входов
+        по пользователю или всем пользователям
+        """
+
+        if username:
+            index = self.shard_index(username)
+            if index is None:
+                return []
+            return self.shards[index].login_history(username)
+        rows = [row for shard in self.shards for row in shard.login_history()]
+        rows.sort(key=lambda row: row["name"])
+        rows.sort(key=lambda row: row["date_time"], reverse=True)
+        return rows
+
+    def iter_login_history(
+        self,
+        username=None,
+        since=None,
+        until=None,
+        cursor=None,
+        limit=LOGIN_HISTORY_PAGE,
+    ):
+        """
+        Метод постраничного чтения истории входов, от новых к старым,
+        параметры как у ServerStorage.iter_login_history. Страница
+        собирается из страниц сегментов, курсор (date_time, id)
+        переводится в курсор каждого сегмента.
+        """
+
+        count = len(self.shards)
+        if username:
+            index = self.shard_index(username)
+            indexes = [] if index is None else [index]
+        else:
+            indexes = range(count)
+        pages = []
+        for index in indexes:
+            shard_cursor = None
+            if cursor is not None:
+                # Строки сегмента с id * count + index < id курсора
+                shard_cursor = (
+                    cursor[0],
+                    (cursor[1] - index + count - 1) // count,
+                )
+            pages.append(
+                [
+                    LoginRow(
+                        row.id * count + index,
+                        row.name,
+                        row.date_time,
+                        row.ip_address,
+                        row.port,
+                    )
+                    for row in self.shards[index].iter_login_history(
+                        username, since, until, shard_cursor, limit
+                    )
+                ]
+            )
+        rows = heapq.merge(
+            *pages, key=lambda row: (row.date_time, row.id), reverse=True
+        )
+        return iter(list(rows)[:limit])
+
+    def archive_login_history(
+        self, before, archive_path, batch_size=RETENTION_BATCH
+    ):
+        """
+        Метод архивирования пачки из batch_size самых старых записей
+        истории входов всех сегментов старше before. Архив каждого
+        сегмента пишется в archive_path/shard_N.
+        Возвращает количество обработанных записей.
+        """
+
+        oldest = []
+        for index, shard in enumerate(self.shards):
+            history = shard.LoginHistory
+            with shard.ReadSession() as session:
+                oldest.append(
+                    [
+                        (date_time, index)
+                        for date_time, in session.execute(
+                            select(history.date_time)
+                            .where(history.date_time < before)
+                            .order_by(history.date_time, history.id)
+                            .limit(batch_size)
+                        )
+                    ]
+                )
+        counts = [0] * len(self.shards)
+        for date_time, index in heapq.merge(*oldest):
+            if sum(counts) == batch_size:
+                break
+            counts[index] += 1
+        total = 0
+        for index, shard_count in enumerate(counts):
+            if shard_count:
+                total += self.shards[index].archive_login_history(
+                    before,
+                    os.path.join(archive_path, f"shard_{index}"),
+                    shard_count,
+                )
+        return total
+
+    def login_daily(self, username=None):
+        """
+        Метод возвращающий дневную статистику входов всех сегментов,
+        от новых дней к старым.
+        """
+
+        if username:
+            index = self.shard_index(username)
+            if index is None:
+                return []
+            return self.shards[index].login_daily(username)
+        rows = [row for shard in self.shards for row in shard.login_daily()]
+        rows.sort(key=lambda row: row["name"])
+        rows.sort(key=lambda row: row["day"], reverse=True)
+        return rows
+
+    def add_contact(self, user_name, contact_name):
+        """
+        Метод добавления контакта для пользователя. Контакт из другого
+        сегмента сначала копируется в сегмент пользователя.
+        """
+
+        shard = self.shard_of(user_name)
+        if contact_name not in self.user_shards:
+            raise SQLAlchemyError("Contact not in user list")
+        if not shard.user_exists(contact_name):
+            shard.add_update_user(contact_name, STUB_PASSWD_HASH)
+        shard.add_contact(user_name, contact_name)
+
+    def delete_contact(self, user_name, contact_name):
+        """Метод удаления контакта пользователя."""
+        shard = self.shard_of(user_name)
+        if contact_name not in self.user_shards:
+            raise SQLAlchemyError("Contact not in user list")
+        # Нет записи контакта в сегменте - нет и контакта
+        if shard.user_exists(contact_name):
+            shard.delete_contact(user_name, contact_name)
+
+    def get_contacts_since(self, username, version):
+        """
+        Метод возвращает изменения списка контактов пользователя
+        после версии version, как ServerStorage.get_contacts_since.
+        """
+
+        return self.shard_of(username).get_contacts_since(username, version)
+
+    def get_user_contacts(self, username):
+        """Метод возвращает список контактов пользователя."""
+        return self.shard_of(username).get_user_contacts(username)
+
+    def update_user_statistic(self, from_user, to_user):
+        """
+        Метод обновляющий статистику сообщений пользователей, счётчики
+        пользователей разных сегментов обновляются в их сегментах.
+        """
+
+        if from_user == to_user:
+            return
+        sender = self.shard_of(from_user)
+        recipient = self.shard_of(to_user)
+        if sender is recipient:
+            sender.update_user_statistic(from_user, to_user)
+            return
+        sender.increment_user_statistic(from_user, sent=1)
+        recipient.increment_user_statistic(to_user, received=1)
+
+    def increment_user_statistic(self, username, sent=0, received=0):
+        """
+        Метод увеличения счётчиков отправленных и полученных сообщений
+        одного пользователя.
+        """
+
+        self.shard_of(username).increment_user_statistic(
+            username, sent, received
+        )
+
+    def get_user_statistic(self):
+        """
+        Метод получающий статистику пользователей всех сегментов,
+        строки копий контактов из других сегментов пропускаются.
+        """
+
+        return [
+            row
+            for index, shard in enumerate(self.shards)
+            for row in shard.get_user_statistic()
+            if self.is_home(index, row["name"])
+        ]
+
+    def get_hash(self, name):
+        """Метод получения хэша пароля пользователя."""
+        index = self.shard_index(name)
+        if index is None:
+            # Как ServerStorage: хэша неизвестного пользователя нет
+            raise TypeError(f"User not exist {name}")
+        return self.shards[index].get_hash(name)
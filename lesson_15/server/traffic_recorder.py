@@ -0,0 +1,121 @@
+import os
+import struct
+import threading
+import time
+import weakref
+
+# Сигнатура файла записи трафика
+CAPTURE_MAGIC = b"CSACAP01"
+
+# Заголовок кадра: время (double), номер соединения (uint32),
+# направление (uint8), длина данных (uint32)
+FRAME_HEADER = struct.Struct("<dIBI")
+
+# Направления кадров
+DIRECTION_IN = 0  # клиент -> сервер
+DIRECTION_OUT = 1  # сервер -> клиент
+DIRECTION_CLOSE = 2  # сервер закрыл соединение
+
+# Размер буфера записи в файл
+CAPTURE_BUFFER_SIZE = 64 * 1024
+
+
+class TrafficRecorder:
+    """
+    Класс записи сетевого трафика сервера в компактный двоичный файл.
+    Каждый кадр содержит время, номер соединения, направление
+    и байты в том виде, в котором они прошли через сокет.
+    При превышении размера max_bytes файл ротируется по схеме
+    RotatingFileHandler: path -> path.1 -> ... -> path.backup_count.
+    """
+
+    def __init__(self, path, max_bytes=0, backup_count=5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.lock = threading.Lock()
+        # Номера соединений, сокет -> номер
+        self.connections = weakref.WeakKeyDictionary()
+        self.next_connection = 1
+        self.file = None
+        self.size = 0
+        self.open_file()
+
+    def open_file(self):
+        """Метод открытия файла записи, пишет сигнатуру в новый файл."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(self.path, "ab", buffering=CAPTURE_BUFFER_SIZE)
+        self.size = self.file.tell()
+        if not self.size:
+            self.file.write(CAPTURE_MAGIC)
+            self.size = len(CAPTURE_MAGIC)
+
+    def rotate(self):
+        """Метод ротации файлов записи."""
+        self.file.close()
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                source = f"{self.path}.{i}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{i + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.open_file()
+
+    def record(self, sock, direction, data):
+        """Метод записи одного кадра трафика сокета sock."""
+        with self.lock:
+            if self.file is None:
+                return
+            conn_id = self.connections.get(sock)
+            if conn_id is None:
+                conn_id = self.next_connection
+                self.next_connection += 1
+                self.connections[sock] = conn_id
+            self.file.write(
+                FRAME_HEADER.pack(time.time(), conn_id, direction, len(data))
+            )
+            self.file.write(data)
+            self.size += FRAME_HEADER.size + len(data)
+            if self.max_bytes and self.size >= self.max_bytes:
+                self.rotate()
+
+    def flush(self):
+        """Метод сброса буфера записи на диск."""
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+
+    def close(self):
+        """Метод закрытия файла записи."""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def read_capture(paths):
+    """
+    Функция - генератор кадров из файлов записи трафика.
+    Файлы читаются в переданном порядке (от старых к новым).
+    Возвращает кортежи (время, номер соединения, направление, данные).
+    """
+
+    for path in paths:
+        with open(path, "rb") as capture:
+            if capture.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+                raise ValueError(f"Not a traffic capture file: {path}")
+            while True:
+                header = capture.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    break
+                timestamp, conn_id, direction, length = FRAME_HEADER.unpack(
+                    header
+                )
+                data = capture.read(length)
+                if len(data) < length:
+                    break
+                yield timestamp, conn_id, direction, data
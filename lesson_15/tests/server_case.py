@@ -0,0 +1,105 @@
+import logging
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from client.core import ClientCore  # noqa: E402
+from server.core import ServerCore  # noqa: E402
+from server.server_database import ServerStorage  # noqa: E402
+
+# Пароль тестовых пользователей
+PASSWORD = "password"
+
+
+def free_port():
+    """Функция выбора свободного порта для тестового сервера."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ServerTestCase(TestCase):
+    """
+    Базовый класс тестов с работающим сервером: временный каталог,
+    база ServerStorage и поток ServerCore на свободном порту.
+    Пользователи users регистрируются, пары contacts (пользователь,
+    контакт) добавляются в контакты до запуска сервера. Клиенты,
+    подключённые методом connect, отключаются в tearDown.
+    """
+
+    users = ("anna", "boris")
+    contacts = ()
+    database_file = "server.db3"
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.temp_dir = tempfile.mkdtemp()
+        self.database = ServerStorage(
+            os.path.join(self.temp_dir, self.database_file)
+        )
+        self.server = ServerCore(
+            server_port=free_port(),
+            server_ip="127.0.0.1",
+            database=self.database,
+            **self.server_options(),
+        )
+        for name in self.users:
+            self.database.add_update_user(
+                name, self.server.get_hash(name, PASSWORD)
+            )
+        for name, contact in self.contacts:
+            self.database.add_contact(name, contact)
+        self.server.run()
+        time.sleep(0.3)
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+            client.sock.close()
+        self.server.close()
+        self.server.thread.join(3)
+        self.close_storage()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        logging.disable(logging.NOTSET)
+
+    def server_options(self):
+        """Метод дополнительных параметров ServerCore."""
+        return {}
+
+    def close_storage(self):
+        """Метод закрытия соединений базы после остановки сервера."""
+        self.database.session.remove()
+        self.database.engine.dispose()
+        self.database.read_engine.dispose()
+
+    def connect(self, name, **callbacks):
+        """Метод подключения клиента с циклом приёма в потоке."""
+        client = ClientCore(
+            "127.0.0.1", self.server.port, name, PASSWORD, **callbacks
+        )
+        client.connect()
+        threading.Thread(target=client.run, daemon=True).start()
+        self.assertTrue(client.reader_started.wait(3))
+        self.clients.append(client)
+        return client
+
+    def disconnect(self, client):
+        """Метод отключения клиента."""
+        client.close()
+        client.sock.close()
+        self.clients.remove(client)
+
+    def wait_until(self, condition, timeout=5):
+        """Метод ожидания выполнения условия condition."""
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
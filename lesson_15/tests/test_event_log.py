@@ -0,0 +1,206 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from unittest import TestCase, main
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from server.event_log import EventLog, EventLogStorage  # noqa: E402
+from server.server_database import ServerStorage  # noqa: E402
+from tests.test_memory_storage import storage_scenario  # noqa: E402
+
+
+def close_storage(database):
+    """Функция закрытия соединений базы сервера."""
+    database.session.remove()
+    database.engine.dispose()
+    database.read_engine.dispose()
+
+
+class TestEventLog(TestCase):
+    """Проверка сегментов, выборок и сжатия журнала событий."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.temp_dir = tempfile.mkdtemp()
+        self.start = datetime(2026, 1, 1)
+        self.log = self.open_log()
+
+    def tearDown(self):
+        self.log.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        logging.disable(logging.NOTSET)
+
+    def open_log(self):
+        """Метод открытия журнала с маленькими сегментами."""
+        return EventLog(self.temp_dir, segment_records=10, index_interval=3)
+
+    def append(self, count, user_id=1):
+        """Метод записи count событий с интервалом в минуту."""
+        return [
+            self.log.append(
+                user_id,
+                f"10.0.0.{number}",
+                7000 + number,
+                self.start + timedelta(minutes=self.log.next_id + number),
+            )
+            for number in range(count)
+        ]
+
+    def segment_files(self):
+        """Метод списка файлов сегментов журнала."""
+        return sorted(
+            name for name in os.listdir(self.temp_dir) if name.endswith(".log")
+        )
+
+    def test_read(self):
+        ids = self.append(25)
+        self.append(5, user_id=2)
+        self.assertEqual(len(self.segment_files()), 3)
+        self.assertEqual(
+            [record.id for record in self.log.read({1})], ids[::-1]
+        )
+        records = self.log.read()
+        page = self.log.read(
+            before=(records[4].date_time, records[4].id), limit=7
+        )
+        self.assertEqual(page, records[5:12])
+        since = records[20].date_time
+        self.assertEqual(self.log.read(since=since), records[:21])
+        self.assertEqual(page[0].ip_address, f"10.0.0.{page[0].port - 7000}")
+
+        # Время не убывает при переводе часов назад
+        record_id = self.log.append(3, "10.0.0.9", 1, self.start)
+        self.assertEqual(self.log.read(limit=1)[0].id, record_id)
+        self.assertEqual(
+            self.log.read(limit=1)[0].date_time, records[0].date_time
+        )
+        with self.assertRaises(ValueError):
+            self.log.append(1, "x" * 47, 1)
+
+        # Количество записей и индекс восстанавливаются из файлов
+        self.log.close()
+        self.log = self.open_log()
+        self.assertEqual(self.log.read(), [self.log.read()[0]] + records)
+        self.assertEqual(self.append(1), [record_id + 1])
+
+    def test_trim_and_compact(self):
+        self.append(15)
+        self.append(10, user_id=2)
+        self.append(3)
+        records = self.log.read()
+        self.assertEqual(
+            [record.id for record in self.log.scan(self.start, 5)], []
+        )
+        old = self.log.scan(records[0].date_time, 12)
+        self.assertEqual(old, records[::-1][:12])
+        self.log.trim(old[-1].id)
+        self.log.delete_user(2)
+        live = records[:3] + records[13:16]
+        self.assertEqual(self.log.read(), live)
+        self.assertEqual(self.log.compact(), 2)
+        # Первый сегмент удалён, второй переписан без пользователя 2,
+        # отметка удаления нужна для последнего сегмента
+        self.assertEqual(len(self.segment_files()), 2)
+        self.assertEqual(self.log.deleted, {2: records[0].id})
+        self.assertEqual(self.log.compact(), 0)
+
+        self.log.close()
+        self.log = self.open_log()
+        self.assertEqual(self.log.read(), live)
+        self.assertEqual(self.append(1), [records[0].id + 1])
+
+
+class TestEventLogStorage(TestCase):
+    """
+    Проверка совпадения ответов EventLogStorage и ServerStorage
+    и переноса истории входов в журнал.
+    """
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.temp_dir = tempfile.mkdtemp()
+        self.databases = []
+
+    def tearDown(self):
+        for database in self.databases:
+            if isinstance(database, EventLogStorage):
+                database.close()
+            close_storage(database)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        logging.disable(logging.NOTSET)
+
+    def path(self, name):
+        """Метод пути во временном каталоге."""
+        return os.path.join(self.temp_dir, name)
+
+    def open_storage(self, name="log.db3"):
+        """Метод открытия базы с журналом входов."""
+        database = EventLogStorage(
+            self.path(name), self.path("login_log"), segment_records=4
+        )
+        self.databases.append(database)
+        return database
+
+    def test_same_results(self):
+        sql = ServerStorage(self.path("server.db3"))
+        self.databases.append(sql)
+        event_log = self.open_storage()
+        self.assertEqual(
+            storage_scenario(event_log, self.path("log_archive")),
+            storage_scenario(sql, self.path("sql_archive")),
+        )
+        # Время последнего входа записывается в базу пачкой
+        users = event_log.user_list()
+        self.assertEqual(event_log.flush_logins(), 2)
+        self.assertEqual(event_log.user_list(), users)
+
+    def test_reopen(self):
+        sql = ServerStorage(self.path("log.db3"))
+        self.databases.append(sql)
+        for name in ("anna", "boris"):
+            sql.add_update_user(name, f"{name}_hash")
+        sql.user_login("anna", "10.0.0.1", 7001)
+        sql.user_login("boris", "10.0.0.2", 7002)
+        expected = sql.login_history()
+
+        # История входов базы переносится в журнал
+        database = self.open_storage()
+        self.assertEqual(database.login_history(), expected)
+        self.assertEqual(
+            database.session.query(database.LoginHistory).count(), 0
+        )
+        for port in range(7003, 7010):
+            database.user_login("anna", "10.0.0.3", port)
+            database.user_logout("anna")
+        self.assertEqual(
+            database.archive_login_history(
+                datetime.utcnow() + timedelta(seconds=1),
+                self.path("archive"),
+                batch_size=5,
+            ),
+            5,
+        )
+        database.remove_user("boris")
+        history = database.login_history()
+        self.assertEqual(len(history), 4)
+        self.assertEqual(database.event_log.compact(), 2)
+        database.close()
+
+        # Граница архивирования хранится в базе
+        os.remove(self.path(os.path.join("login_log", "state.json")))
+        database = self.open_storage()
+        database.add_update_user("boris", "boris_hash")
+        self.assertEqual(database.login_history(), history)
+        self.assertEqual(database.login_history("boris"), [])
+        self.assertEqual(
+            [row.port for row in database.iter_login_history("anna", limit=3)],
+            [7009, 7008, 7007],
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import json
+import os
+import sys
+import time
+from unittest import TestCase, main
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app_utils.utils import JsonFrameDecoder  # noqa: E402
+from tests.server_case import ServerTestCase  # noqa: E402
+
+
+class TestJsonFrameDecoder(TestCase):
+    """Проверка разбора потока байт на JSON - сообщения."""
+
+    def test_split_frames(self):
+        decoder = JsonFrameDecoder()
+        chunks = [
+            b'{"a": "ab',
+            b'c", "b": tr',
+            b'ue, "n": 1.',
+            b'5}{"x": "\\u00',
+            '41", "y": "п'.encode()[:-1],
+            '41", "y": "п'.encode()[-1:] + b'"} ',
+        ]
+        frames = [frame for chunk in chunks for frame in decoder.feed(chunk)]
+        self.assertEqual(
+            frames, [{"a": "abc", "b": True, "n": 1.5}, {"x": "A", "y": "п"}]
+        )
+        self.assertEqual(decoder.buffer, "")
+
+    def test_malformed(self):
+        for data in (b"hello", b"{bad json}", b'{"a": 1 x}', b'{"a": trux}'):
+            with self.assertRaises(json.JSONDecodeError):
+                JsonFrameDecoder().feed(data)
+
+        # Сообщения до ошибки не теряются
+        decoder = JsonFrameDecoder()
+        with self.assertRaises(json.JSONDecodeError) as context:
+            decoder.feed(b'{"a":1} {"b": 2}garbage')
+        self.assertEqual(context.exception.frames, [{"a": 1}, {"b": 2}])
+        self.assertEqual(decoder.buffer, "garbage")
+
+
+class TestServerFrames(ServerTestCase):
+    """Проверка обработки сервером сообщений перед данными не JSON."""
+
+    def test_frames_before_garbage(self):
+        anna = self.connect("anna")
+        request = {
+            "action": "get_contacts",
+            "time": time.time(),
+            "user_login": "anna",
+        }
+        with anna.lock:
+            anna.start_waiting()
+            try:
+                anna.sock.sendall(json.dumps(request).encode() + b"garbage")
+                answers = [anna.wait_response(), anna.wait_response()]
+            finally:
+                anna.waiting = False
+        self.assertEqual(
+            [answer["response"] for answer in answers], [202, 400]
+        )
+
+
+if __name__ == "__main__":
+    main()
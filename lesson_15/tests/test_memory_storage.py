@@ -0,0 +1,197 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+from unittest import TestCase, main
+
+from sqlalchemy.exc import NoResultFound, SQLAlchemyError
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from server.memory_storage import MemoryStorage  # noqa: E402
+from server.server_database import ServerStorage  # noqa: E402
+
+
+def without_time(data):
+    """Функция замены дат в ответе хранилища для сравнения."""
+    if isinstance(data, (list, tuple)):
+        return [without_time(item) for item in data]
+    if isinstance(data, dict):
+        return {key: without_time(value) for key, value in data.items()}
+    if isinstance(data, (datetime, date)):
+        return "time"
+    return data
+
+
+def sorted_changes(changes):
+    """Функция сортировки контактов ответа get_contacts_since."""
+    return {
+        key: sorted(value) if isinstance(value, list) else value
+        for key, value in changes.items()
+    }
+
+
+def storage_scenario(database, archive_path):
+    """
+    Функция выполнения одинаковой последовательности операций
+    с хранилищем сервера, возвращает ответы хранилища без дат.
+    """
+
+    result = {}
+    for name in ("anna", "boris", "clara", "denis"):
+        database.add_update_user(name, f"{name}_hash")
+    database.add_update_user("anna", "new_hash")
+    database.user_login("anna", "10.0.0.1", 7001)
+    database.user_login("boris", "10.0.0.2", 7002)
+    database.user_logout("anna")
+    database.user_login("anna", "10.0.0.3", 7003)
+    database.user_login("clara", "10.0.0.3", 7004)
+    database.add_contact("anna", "boris")
+    database.add_contact("anna", "clara")
+    database.add_contact("anna", "denis")
+    database.add_contact("boris", "clara")
+    database.delete_contact("anna", "boris")
+    database.delete_contact("anna", "boris")
+    database.update_user_statistic("anna", "boris")
+    database.update_user_statistic("anna", "boris")
+    database.update_user_statistic("boris", "anna")
+    database.update_user_statistic("clara", "clara")
+    database.increment_user_statistic("denis", sent=2)
+    database.increment_user_statistic("denis", received=1)
+
+    errors = []
+    calls = (
+        (database.user_login, ("nobody", "1.1.1.1", 1)),
+        (database.add_contact, ("anna", "nobody")),
+        (database.add_contact, ("anna", "clara")),
+        (database.delete_contact, ("anna", "nobody")),
+        (database.get_user_contacts, ("nobody",)),
+        (database.get_contacts_since, ("nobody", 0)),
+        (database.update_user_statistic, ("anna", "nobody")),
+        (database.remove_user, ("nobody",)),
+    )
+    for method, args in calls:
+        try:
+            method(*args)
+        except (ValueError, SQLAlchemyError) as e:
+            errors.append((method.__name__, type(e).__name__, str(e)))
+    result["errors"] = [
+        error if error[1] != "NoResultFound" else error[:2] for error in errors
+    ]
+
+    # Порядок контактов в ответе не определён
+    result["contacts_since"] = [
+        sorted_changes(database.get_contacts_since("anna", version))
+        for version in range(6)
+    ]
+    database.remove_user("clara")
+    result["contacts_after_remove"] = sorted_changes(
+        database.get_contacts_since("anna", 4)
+    )
+    result["boris_contacts"] = sorted(database.get_user_contacts("boris"))
+    result["users"] = database.user_list()
+    result["exists"] = [
+        database.user_exists(name) for name in ("anna", "clara")
+    ]
+    result["hash"] = database.get_hash("anna")
+    result["active"] = database.active_users_list()
+    result["statistic"] = sorted(
+        database.get_user_statistic(), key=lambda row: row["name"]
+    )
+    result["history"] = database.login_history()
+    result["history_anna"] = database.login_history("anna")
+
+    pages = []
+    cursor = None
+    while True:
+        page = list(database.iter_login_history(cursor=cursor, limit=2))
+        if not page:
+            break
+        pages.append([(row.name, row.ip_address, row.port) for row in page])
+        cursor = (page[-1].date_time, page[-1].id)
+    result["pages"] = pages
+    result["pages_anna"] = [
+        (row.name, row.port)
+        for row in database.iter_login_history("anna", limit=10)
+    ]
+    result["archived"] = database.archive_login_history(
+        datetime.utcnow() + timedelta(seconds=1),
+        archive_path,
+        batch_size=2,
+    )
+    result["history_after_archive"] = database.login_history()
+    result["daily"] = database.login_daily()
+    return without_time(result)
+
+
+class TestMemoryStorage(TestCase):
+    """
+    Проверка совпадения ответов MemoryStorage и ServerStorage
+    на одинаковую последовательность операций.
+    """
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.temp_dir = tempfile.mkdtemp()
+        self.sql = ServerStorage(os.path.join(self.temp_dir, "server.db3"))
+        self.memory = MemoryStorage(os.path.join(self.temp_dir, "memory.pkl"))
+
+    def tearDown(self):
+        self.sql.session.remove()
+        self.sql.engine.dispose()
+        self.sql.read_engine.dispose()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        logging.disable(logging.NOTSET)
+
+    def archive_path(self, name):
+        """Метод пути архива истории входов хранилища."""
+        return os.path.join(self.temp_dir, name)
+
+    def test_same_results(self):
+        self.assertEqual(
+            storage_scenario(self.memory, self.archive_path("memory")),
+            storage_scenario(self.sql, self.archive_path("sql")),
+        )
+
+    def test_errors(self):
+        result = storage_scenario(self.memory, self.archive_path("memory"))
+        errors = result["errors"]
+        self.assertEqual(
+            [error[1] for error in errors],
+            [
+                "ValueError",
+                "SQLAlchemyError",
+                "SQLAlchemyError",
+                "SQLAlchemyError",
+                "NoResultFound",
+                "NoResultFound",
+                "NoResultFound",
+                "NoResultFound",
+            ],
+        )
+        self.assertTrue(issubclass(NoResultFound, SQLAlchemyError))
+
+    def test_snapshot(self):
+        expected = storage_scenario(self.memory, self.archive_path("memory"))
+        self.assertTrue(self.memory.save_snapshot())
+        self.assertFalse(self.memory.save_snapshot())
+        restored = MemoryStorage(self.memory.snapshot_path)
+        self.assertEqual(restored.user_list(), self.memory.user_list())
+        self.assertEqual(restored.active_users_list(), [])
+        self.assertEqual(restored.login_history(), self.memory.login_history())
+        self.assertEqual(restored.login_daily(), self.memory.login_daily())
+        self.assertEqual(len(expected["daily"]), 2)
+        self.assertEqual(
+            restored.get_contacts_since("anna", 4),
+            self.memory.get_contacts_since("anna", 4),
+        )
+        restored.add_update_user("eva", "eva_hash")
+        self.assertNotIn(restored.users["eva"]["id"], self.memory.names)
+        restored.user_login("eva", "10.0.0.5", 7005)
+        self.assertEqual(len(restored.login_history()), 2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from unittest import TestCase, main
+from unittest.mock import patch
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app_utils.errors import ServerError  # noqa: E402
+from client.client_database import ClientDatabase  # noqa: E402
+from client.history_backfill import HistoryBackfill  # noqa: E402
+from server.message_store import MessageStore, decode_cursor  # noqa: E402
+from tests.server_case import ServerTestCase  # noqa: E402
+
+
+def collect_history(store, username, contact, limit):
+    """Функция чтения всей переписки постранично, возвращает id."""
+    ids = []
+    cursor = None
+    while True:
+        rows, cursor = store.get_history(username, contact, cursor, limit)
+        ids.extend(row.id for row in rows)
+        if cursor is None:
+            return ids
+
+
+class TestMessageStore(TestCase):
+    """Проверка разделов хранилища сообщений и страниц истории."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = MessageStore(self.temp_dir)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        logging.disable(logging.NOTSET)
+
+    def append(self, month, count, sender="anna", recipient="boris"):
+        """Метод сохранения count сообщений месяца month 2026 года."""
+        return self.store.append(
+            [
+                {"from": sender, "to": recipient, "message": f"{number}"}
+                for number in range(count)
+            ],
+            date_time=datetime(2026, month, 10),
+        )
+
+    def test_partitions(self):
+        first = self.append(1, 5)
+        other = self.append(1, 3, "clara", "anna")
+        second = self.append(3, 4, "boris", "anna")
+        # Часы переведены назад - сообщения в последнем разделе
+        third = self.append(2, 2)
+        self.assertEqual(
+            sorted(
+                name
+                for name in os.listdir(self.temp_dir)
+                if name.endswith(".db3")
+            ),
+            ["messages-2026-01.db3", "messages-2026-03.db3"],
+        )
+        expected = (first + second + third)[::-1]
+        self.assertEqual(
+            collect_history(self.store, "anna", "boris", 3), expected
+        )
+        self.assertEqual(
+            collect_history(self.store, "boris", "anna", 100), expected
+        )
+        self.assertEqual(
+            collect_history(self.store, "clara", "anna", 2), other[::-1]
+        )
+        self.assertEqual(collect_history(self.store, "boris", "clara", 2), [])
+
+        # Нумерация продолжается после повторного открытия
+        self.store.close()
+        self.store = MessageStore(self.temp_dir)
+        self.assertEqual(self.append(3, 1), [third[-1] + 1])
+
+    def test_bad_cursor(self):
+        self.append(1, 2)
+        for cursor in ("not a cursor", "AAAA", 12):
+            with self.assertRaises(ValueError):
+                self.store.get_history("anna", "boris", cursor)
+
+
+class TestHistoryProtocol(ServerTestCase):
+    """
+    Проверка сохранения сообщений сервером, запроса get_history
+    и загрузки истории в базу клиента.
+    """
+
+    users = ("anna", "boris", "mallory")
+    contacts = (("anna", "boris"),)
+
+    def setUp(self):
+        super().setUp()
+        self.received = []
+        self.acks = []
+        self.anna = self.connect("anna", on_message=self.received.append)
+        self.boris = self.connect("boris", on_ack=self.acks.append)
+        self.client_database = None
+
+    def tearDown(self):
+        if self.client_database:
+            self.client_database.close()
+            self.client_database.engine.dispose()
+        super().tearDown()
+
+    def server_options(self):
+        """Метод подключения хранилища сообщений к серверу."""
+        self.store = MessageStore(os.path.join(self.temp_dir, "messages"))
+        return {"message_store": self.store}
+
+    def close_storage(self):
+        """Метод закрытия базы сервера и хранилища сообщений."""
+        super().close_storage()
+        self.store.close()
+
+    def send(self, count, start=0):
+        """Метод отправки count сообщений от boris к anna."""
+        for number in range(start, start + count):
+            self.boris.send_message("anna", f"text {number}", msg_id=number)
+        self.wait_until(lambda: len(self.acks) >= start + count)
+
+    def test_get_history(self):
+        self.send(7)
+        history_ids = [message["history_id"] for message in self.received]
+        self.assertEqual([ack["history_id"] for ack in self.acks], history_ids)
+
+        pages = self.anna.get_history("boris", limit=3, pages=2)
+        self.assertEqual([len(page["messages"]) for page in pages], [3, 3])
+        self.assertEqual([page["last"] for page in pages], [False, True])
+        rest = self.boris.get_history("anna", pages[-1]["cursor"], limit=3)
+        self.assertEqual(rest[-1]["cursor"], None)
+        messages = [
+            message for page in pages + rest for message in page["messages"]
+        ]
+        self.assertEqual(
+            [message["id"] for message in messages], history_ids[::-1]
+        )
+        self.assertEqual(messages[0]["message"], "text 6")
+        self.assertEqual(messages[0]["from"], "boris")
+
+        # Размер страницы ограничен в байтах
+        with patch("server.core.HISTORY_PAGE_BYTES", 200):
+            pages = self.anna.get_history("boris", pages=10)
+        self.assertTrue(all(len(page["messages"]) < 7 for page in pages))
+        self.assertEqual(
+            [message["id"] for page in pages for message in page["messages"]],
+            history_ids[::-1],
+        )
+        with self.assertRaises(ServerError):
+            self.anna.get_history("boris", cursor="bad cursor")
+        decode_cursor(pages[0]["cursor"])
+
+    def test_forged_sender(self):
+        mallory = self.connect("mallory")
+        with self.assertRaises(ServerError):
+            mallory.request(
+                {
+                    "action": "msg",
+                    "time": time.time(),
+                    "from": "boris",
+                    "to": "anna",
+                    "message": "forged",
+                    "msg_id": 1,
+                }
+            )
+        self.send(1, start=0)
+        self.assertEqual([ack["msg_id"] for ack in self.acks], [0])
+        self.assertEqual(
+            [message["message"] for message in self.received], ["text 0"]
+        )
+        rows, _ = self.store.get_history("anna", "boris")
+        self.assertEqual([row.message for row in rows], ["text 0"])
+
+    def test_backfill(self):
+        self.send(5)
+        path = os.path.join(self.temp_dir, "client.db3")
+        with patch(
+            "client.client_database.CLIENT_DATABASE", f"sqlite:///{path}"
+        ):
+            self.client_database = ClientDatabase("anna")
+        self.client_database.add_contact("boris")
+        # Сообщение, полученное до загрузки истории
+        received = self.received[-1]
+        self.client_database.save_message(
+            "boris",
+            "anna",
+            received["message"],
+            server_id=received["history_id"],
+        ).result()
+
+        loaded = []
+        lock = threading.Lock()
+
+        def backfill(pages):
+            thread = HistoryBackfill(
+                self.anna,
+                self.client_database,
+                lock,
+                on_loaded=loaded.append,
+                pages=pages,
+            )
+            with patch("server.core.HISTORY_PAGE_SIZE", 2):
+                thread.start()
+                thread.join(10)
+
+        backfill(pages=1)
+        self.assertEqual(loaded, ["boris"])
+        page = self.client_database.get_chat_page("boris", limit=100)
+        self.assertEqual(
+            [row.message for row in page],
+            [f"text {number}" for number in range(5)],
+        )
+        self.assertEqual(
+            self.client_database.get_history_sync("boris"), (None, True)
+        )
+
+        # Повторная загрузка - только новые сообщения
+        self.send(3, start=5)
+        backfill(pages=2)
+        self.assertEqual(loaded, ["boris", "boris"])
+        page = self.client_database.get_chat_page("boris", limit=100)
+        self.assertEqual(len(page), 8)
+        self.assertEqual(page[-1].message, "text 7")
+
+
+if __name__ == "__main__":
+    main()
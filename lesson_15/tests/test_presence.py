@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+from unittest import main
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app_utils.settings import PRESENCE_COALESCE  # noqa: E402
+from tests.server_case import ServerTestCase  # noqa: E402
+
+
+class TestPresence(ServerTestCase):
+    """
+    Проверка подписки на присутствие контактов и объединения
+    входов и выходов в одно сообщение.
+    """
+
+    users = ("anna", "boris", "clara", "denis")
+    contacts = (("anna", "boris"), ("anna", "clara"), ("anna", "denis"))
+
+    def setUp(self):
+        super().setUp()
+        self.updates = {}
+
+    def connect(self, name):
+        """Метод подключения клиента, сохраняющего сообщения присутствия."""
+        updates = self.updates.setdefault(name, [])
+        return super().connect(name, on_presence=updates.append)
+
+    def wait_updates(self, name, count):
+        """Метод ожидания count сообщений о присутствии."""
+        self.wait_until(lambda: len(self.updates[name]) >= count)
+        return [
+            (sorted(update["online"]), sorted(update["offline"]))
+            for update in self.updates[name]
+        ]
+
+    def test_presence(self):
+        boris = self.connect("boris")
+        anna = self.connect("anna")
+        # Вход boris отправлен до подписки
+        time.sleep(PRESENCE_COALESCE * 2)
+        self.assertEqual(anna.subscribe_presence(), ["boris"])
+
+        # Два входа за окно объединения - одно сообщение
+        clara = self.connect("clara")
+        denis = self.connect("denis")
+        self.assertEqual(
+            self.wait_updates("anna", 1), [(["clara", "denis"], [])]
+        )
+
+        # Повторный вход за окно объединения не отправляется
+        self.disconnect(clara)
+        self.connect("clara")
+        self.disconnect(denis)
+        self.assertEqual(self.wait_updates("anna", 2)[1], ([], ["denis"]))
+
+        # Подписка на часть контактов заменяет прежнюю
+        self.assertEqual(anna.subscribe_presence(["boris"]), ["boris"])
+        self.disconnect(boris)
+        self.connect("denis")
+        self.assertEqual(self.wait_updates("anna", 3)[2], ([], ["boris"]))
+        time.sleep(1)
+        self.assertEqual(len(self.updates["anna"]), 3)
+        self.assertEqual(self.updates["clara"], [])
+
+        # Подписка отменяется при отключении подписчика
+        self.disconnect(anna)
+        self.wait_until(lambda: not self.server.presence_watchers)
+        self.assertEqual(self.server.presence_subscriptions, {})
+
+
+if __name__ == "__main__":
+    main()
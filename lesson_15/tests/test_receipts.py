@@ -0,0 +1,281 @@
+import json
+import logging
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+from unittest import TestCase, main
+from unittest.mock import patch
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app_utils.errors import ServerError  # noqa: E402
+from app_utils.settings import RECEIPT_READ, RECEIPT_RECEIVED  # noqa: E402
+from app_utils.utils import (  # noqa: E402
+    add_to_ranges,
+    id_ranges,
+    intersect_ranges,
+    merge_ranges,
+)
+from client.client_database import (  # noqa: E402
+    MESSAGE_DELIVERED,
+    MESSAGE_PENDING,
+    MESSAGE_READ,
+    MESSAGE_RECEIVED,
+    ClientDatabase,
+)
+from server.core import ServerCore  # noqa: E402
+from tests.server_case import ServerTestCase, free_port  # noqa: E402
+
+
+class TestReceiptCoalescing(TestCase):
+    """
+    Проверка объединения уведомлений о получении и прочтении
+    в одно сообщение отправителю за цикл сервера.
+    """
+
+    def setUp(self):
+        self.server = ServerCore(
+            server_port=free_port(), server_ip="127.0.0.1", database=None
+        )
+        self.sender, self.peer = socket.socketpair()
+        self.server.user_names = {"boris": self.sender}
+        # Сообщения boris, переданные сервером получателям
+        self.server.routed = {
+            "boris": {"anna": [[1, 4], [8, 9]], "clara": [[5, 6]]}
+        }
+
+    def tearDown(self):
+        self.sender.close()
+        self.peer.close()
+
+    def queue(self, recipient, status, receipts):
+        """Метод учёта уведомления получателя recipient."""
+        self.server.queue_receipts(
+            {
+                "user_login": recipient,
+                "status": status,
+                "receipts": receipts,
+            }
+        )
+
+    def test_ranges(self):
+        self.assertEqual(id_ranges([7, 1, 3, 2, 9, 8, 2]), [[1, 3], [7, 9]])
+        self.assertEqual(merge_ranges([[5, 9], [1, 4], [6, 7]]), [[1, 9]])
+        for ranges in ([[3, 1]], [["1", 2]], [[True, 2]], [[1]], [1]):
+            with self.assertRaises((TypeError, ValueError)):
+                merge_ranges(ranges)
+        self.assertEqual(
+            intersect_ranges([[1, 5], [7, 20]], [[0, 2], [4, 8], [15, 30]]),
+            [[1, 2], [4, 5], [7, 8], [15, 20]],
+        )
+        ranges = []
+        for identifier in (1, 2, 3, 7, 5, 4):
+            add_to_ranges(ranges, identifier)
+        self.assertEqual(ranges, [[1, 5], [7, 7]])
+
+    def test_one_frame_per_sender(self):
+        self.queue("anna", RECEIPT_RECEIVED, {"boris": [[1, 3]]})
+        self.queue("anna", RECEIPT_RECEIVED, {"boris": [[4, 4], [8, 9]]})
+        self.queue("anna", RECEIPT_READ, {"boris": [[1, 2]]})
+        self.queue("clara", RECEIPT_RECEIVED, {"boris": [[5, 5]]})
+        # Уведомления о сообщениях, не переданных получателю,
+        # не принимаются
+        self.queue("clara", RECEIPT_READ, {"boris": [[1, 3]]})
+        self.queue("anna", RECEIPT_READ, {"boris": [[20, 30]]})
+        # Отправитель не подключён - уведомление не сохраняется
+        self.queue("anna", RECEIPT_RECEIVED, {"denis": [[1, 1]]})
+        self.server.send_receipts()
+        self.server.send_receipts()
+
+        self.peer.settimeout(1)
+        frame = json.loads(self.peer.recv(65536).decode())
+        self.assertEqual(frame["action"], "receipt")
+        self.assertEqual(
+            frame["receipts"],
+            {
+                RECEIPT_RECEIVED: {
+                    "anna": [[1, 4], [8, 9]],
+                    "clara": [[5, 5]],
+                },
+                RECEIPT_READ: {"anna": [[1, 2]]},
+            },
+        )
+        self.assertEqual(self.server.receipts, {})
+
+    def test_ack_to_sender_socket(self):
+        other, other_peer = socket.socketpair()
+        self.addCleanup(other.close)
+        self.addCleanup(other_peer.close)
+        self.server.clients = [self.sender, other]
+        # Подтверждение получает сокет, отправивший сообщение,
+        # а не пользователь из поля from
+        self.server.send_ack({"from": "boris", "msg_id": 3, "sock": other})
+        other_peer.settimeout(1)
+        frame = json.loads(other_peer.recv(65536).decode())
+        self.assertEqual(frame["msg_id"], 3)
+        self.peer.setblocking(False)
+        with self.assertRaises(BlockingIOError):
+            self.peer.recv(65536)
+
+
+class TestClientReceipts(TestCase):
+    """Проверка хранения статусов уведомлений в базе клиента."""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.temp_dir = tempfile.mkdtemp()
+        path = os.path.join(self.temp_dir, "client.db3")
+        with patch(
+            "client.client_database.CLIENT_DATABASE", f"sqlite:///{path}"
+        ):
+            self.database = ClientDatabase("anna")
+
+    def tearDown(self):
+        self.database.close()
+        self.database.engine.dispose()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        logging.disable(logging.NOTSET)
+
+    def statuses(self, ids):
+        """Метод чтения статусов сообщений."""
+        self.database.session.expire_all()
+        return [
+            self.database.session.get(self.database.Message, msg_id).status
+            for msg_id in ids
+        ]
+
+    def test_receipts(self):
+        ids = [
+            self.database.save_message(
+                "anna", contact, "text", status=MESSAGE_PENDING
+            ).result()
+            for contact in ("boris", "boris", "clara", "boris")
+        ]
+        for msg_id in ids:
+            self.database.set_message_status(msg_id, MESSAGE_DELIVERED)
+        received = self.database.set_receipts(
+            "boris", MESSAGE_RECEIVED, id_ranges(ids)
+        ).result()
+        self.assertEqual(received, [ids[0], ids[1], ids[3]])
+        read = self.database.set_receipts(
+            "boris", MESSAGE_READ, [[ids[0], ids[0]]]
+        ).result()
+        self.assertEqual(read, [ids[0]])
+        # Повторное уведомление и подтверждение сервера
+        # не понижают статус
+        self.assertEqual(
+            self.database.set_receipts(
+                "boris", MESSAGE_RECEIVED, [[ids[0], ids[0]]]
+            ).result(),
+            [],
+        )
+        self.database.set_message_status(ids[0], MESSAGE_DELIVERED).result()
+        self.assertEqual(
+            self.statuses(ids),
+            [
+                MESSAGE_READ,
+                MESSAGE_RECEIVED,
+                MESSAGE_DELIVERED,
+                MESSAGE_RECEIVED,
+            ],
+        )
+
+    def test_mark_read(self):
+        for remote_id in (11, None, 12):
+            self.database.save_message(
+                "boris", "anna", "text", remote_id=remote_id
+            )
+        self.database.save_message("clara", "anna", "text", remote_id=5)
+        self.assertEqual(self.database.mark_read("boris").result(), [11, 12])
+        self.assertEqual(self.database.mark_read("boris").result(), [])
+        self.assertEqual(self.database.mark_read("clara").result(), [5])
+
+
+class TestReceiptProtocol(ServerTestCase):
+    """
+    Проверка передачи msg_id получателю и уведомлений
+    о получении и прочтении отправителю.
+    """
+
+    users = ("anna", "boris", "mallory")
+
+    def setUp(self):
+        super().setUp()
+        self.received = []
+        self.receipts = []
+        self.anna = self.connect("anna", on_message=self.received.append)
+        self.boris = self.connect(
+            "boris",
+            on_ack=lambda message: None,
+            on_receipt=self.receipts.append,
+        )
+
+    def collected(self, status):
+        """Метод объединения диапазонов полученных уведомлений."""
+        return merge_ranges(
+            [
+                ranges
+                for receipt in self.receipts
+                for ranges in receipt["receipts"]
+                .get(status, {})
+                .get("anna", [])
+            ]
+        )
+
+    def test_receipts(self):
+        for msg_id in (1, 2, 3, 5):
+            self.boris.send_message("anna", f"text {msg_id}", msg_id=msg_id)
+        self.wait_until(lambda: len(self.received) >= 4)
+        msg_ids = [message["msg_id"] for message in self.received]
+        self.assertEqual(msg_ids, [1, 2, 3, 5])
+
+        self.anna.send_receipts(RECEIPT_RECEIVED, {"boris": msg_ids})
+        self.anna.send_receipts(RECEIPT_READ, {"boris": msg_ids[:2]})
+        self.wait_until(lambda: self.collected(RECEIPT_READ) == [[1, 2]])
+        self.assertEqual(self.collected(RECEIPT_RECEIVED), [[1, 3], [5, 5]])
+        self.assertLessEqual(len(self.receipts), 2)
+
+    def test_ack_is_not_response(self):
+        # Ответ на сообщение с msg_id для неизвестного пользователя
+        # не принимается за ответ на следующий запрос
+        self.anna.send_message("nobody", "text", msg_id=1)
+        self.assertEqual(self.anna.get_contacts(), [])
+        self.anna.send_message("nobody", "text", msg_id=2)
+        self.assertEqual(self.anna.get_contacts(), [])
+
+    def test_forged_sender(self):
+        mallory_received = []
+        mallory = self.connect("mallory", on_message=mallory_received.append)
+        with self.assertRaises(ServerError):
+            mallory.request(
+                {
+                    "action": "msg",
+                    "time": time.time(),
+                    "from": "boris",
+                    "to": "mallory",
+                    "message": "forged",
+                    "msg_id": 7,
+                }
+            )
+        mallory.send_receipts(RECEIPT_READ, {"boris": [7]})
+        self.boris.send_message("anna", "text", msg_id=1)
+        self.wait_until(lambda: self.received)
+        self.anna.send_receipts(RECEIPT_READ, {"boris": [1]})
+        self.wait_until(lambda: self.collected(RECEIPT_READ) == [[1, 1]])
+
+        self.assertEqual(mallory_received, [])
+        self.assertEqual(self.server.routed["boris"], {"anna": [[1, 1]]})
+        self.assertFalse(
+            any(
+                "mallory" in recipients
+                for receipt in self.receipts
+                for recipients in receipt["receipts"].values()
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from unittest import TestCase, main
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from reshard import Resharder, open_source  # noqa: E402
+from server.server_database import ServerStorage  # noqa: E402
+from server.sharded_storage import ShardedStorage  # noqa: E402
+from tests.test_memory_storage import (  # noqa: E402
+    sorted_changes,
+    storage_scenario,
+    without_time,
+)
+
+# Сегменты пользователей сценария при 3 сегментах:
+# anna и denis - 0, boris - 1, clara - 2
+SHARDS = 3
+
+
+class TestShardedStorage(TestCase):
+    """
+    Проверка совпадения ответов ShardedStorage и ServerStorage,
+    постраничного чтения истории всех сегментов.
+    """
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.temp_dir = tempfile.mkdtemp()
+        self.sql = ServerStorage(os.path.join(self.temp_dir, "server.db3"))
+        self.sharded = ShardedStorage(
+            os.path.join(self.temp_dir, "shards"), shards=SHARDS
+        )
+
+    def tearDown(self):
+        self.sql.session.remove()
+        self.sql.engine.dispose()
+        self.sql.read_engine.dispose()
+        self.sharded.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        logging.disable(logging.NOTSET)
+
+    def reshard(self, source, shards):
+        """Метод копирования хранилища source в новый каталог."""
+        storage, databases = open_source(source)
+        path = os.path.join(self.temp_dir, f"resharded_{shards}")
+        destination = ShardedStorage(path, shards=shards)
+        resharder = Resharder(destination)
+        for database, is_home in databases:
+            resharder.copy_users(database, is_home)
+        for database, is_home in databases:
+            resharder.copy_source(database, is_home)
+        destination.close()
+        if isinstance(storage, ShardedStorage):
+            storage.close()
+        else:
+            storage.session.remove()
+            storage.engine.dispose()
+            storage.read_engine.dispose()
+        return path
+
+    def test_same_results(self):
+        self.assertEqual(
+            storage_scenario(
+                self.sharded, os.path.join(self.temp_dir, "sharded_archive")
+            ),
+            storage_scenario(
+                self.sql, os.path.join(self.temp_dir, "sql_archive")
+            ),
+        )
+        # Контакты из других сегментов не попадают в список пользователей
+        self.assertEqual(
+            [user["name"] for user in self.sharded.user_list()],
+            ["anna", "boris", "denis"],
+        )
+        self.assertEqual(
+            sorted(
+                shard_index
+                for shard_index in self.sharded.user_shards.values()
+            ),
+            [0, 0, 1],
+        )
+
+    def test_reshard(self):
+        storage_scenario(self.sql, os.path.join(self.temp_dir, "archive"))
+        self.sql.add_update_user("eva", "eva_hash")
+        self.sql.user_login("eva", "10.0.0.5", 7005)
+        self.sql.add_contact("eva", "anna")
+        self.sql.add_contact("anna", "eva")
+        names = ("anna", "boris", "denis", "eva")
+
+        def snapshot(database):
+            return {
+                "users": without_time(database.user_list()),
+                "history": without_time(database.login_history()),
+                "daily": without_time(database.login_daily()),
+                "contacts": {
+                    name: sorted(database.get_user_contacts(name))
+                    for name in names
+                },
+                "since": {
+                    name: sorted_changes(database.get_contacts_since(name, 0))
+                    for name in names
+                },
+                "statistic": sorted(
+                    database.get_user_statistic(),
+                    key=lambda row: row["name"],
+                ),
+                "hash": [database.get_hash(name) for name in names],
+            }
+
+        expected = snapshot(self.sql)
+        path = self.reshard(os.path.join(self.temp_dir, "server.db3"), SHARDS)
+        resharded = ShardedStorage(path)
+        self.assertEqual(snapshot(resharded), expected)
+        resharded.close()
+
+        # Повторное разбиение на другое число сегментов
+        path = self.reshard(path, 2)
+        resharded = ShardedStorage(path)
+        self.assertEqual(len(resharded.shards), 2)
+        self.assertEqual(snapshot(resharded), expected)
+        resharded.add_contact("boris", "eva")
+        self.assertEqual(resharded.get_user_contacts("boris"), ["eva"])
+        resharded.close()
+
+    def test_history_pages(self):
+        names = [f"user_{number}" for number in range(12)]
+        for name in names:
+            self.sharded.add_update_user(name, "hash")
+        for port in range(5):
+            for name in names:
+                self.sharded.user_login(name, "10.0.0.1", port)
+                self.sharded.user_logout(name)
+        expected = self.sharded.login_history()
+
+        rows = []
+        cursor = None
+        while True:
+            page = list(
+                self.sharded.iter_login_history(cursor=cursor, limit=7)
+            )
+            if not page:
+                break
+            rows.extend(page)
+            cursor = (page[-1].date_time, page[-1].id)
+        self.assertEqual(len({row.id for row in rows}), len(expected))
+        self.assertEqual(
+            [(row.name, row.date_time) for row in rows],
+            [(row["name"], row["date_time"]) for row in expected],
+        )
+        self.assertEqual(
+            len(list(self.sharded.iter_login_history("user_3", limit=100))),
+            5,
+        )
+
+
+if __name__ == "__main__":
+    main()
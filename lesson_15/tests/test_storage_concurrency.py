@@ -0,0 +1,142 @@
+import io
+import os
+import sys
+import threading
+import time
+from contextlib import redirect_stdout
+from unittest import main
+from unittest.mock import patch
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from client.core import ClientCore  # noqa: E402
+from server.server_console_interface import print_login_history  # noqa: E402
+from tests.server_case import PASSWORD, ServerTestCase  # noqa: E402
+
+# Длительность нагрузки (секунды), количество клиентов и пользователей
+STRESS_DURATION = 3
+CLIENT_THREADS = 4
+USERS = 8
+
+
+class TestStorageConcurrency(ServerTestCase):
+    """
+    Нагрузочный тест базы сервера: поток сервера обрабатывает входы,
+    сообщения и контакты клиентов, одновременно окно сервера
+    и консоль читают списки пользователей, статистику и историю
+    входов, окно регистрирует новых пользователей.
+    """
+
+    users = tuple(f"user_{number}" for number in range(USERS))
+    database_file = "server_base.db3"
+
+    def setUp(self):
+        super().setUp()
+        self.stop = threading.Event()
+        self.errors = []
+        self.logins = 0
+        self.logins_lock = threading.Lock()
+
+    def run_worker(self, work):
+        """Метод выполнения work в цикле до окончания нагрузки."""
+        try:
+            while not self.stop.is_set():
+                work()
+        except Exception as e:  # noqa
+            self.errors.append(repr(e))
+
+    def client_work(self, number):
+        """Клиент: вход, контакты, сообщения и выход."""
+        name = f"user_{number}"
+        contact = f"user_{(number + 1) % USERS}"
+        # Сервер должен обработать выход предыдущего подключения
+        while name in self.server.active_sessions:
+            if not self.server.thread.is_alive():
+                raise RuntimeError("server thread stopped")
+            time.sleep(0.01)
+        client = ClientCore(
+            "127.0.0.1",
+            self.server.port,
+            name,
+            PASSWORD,
+            on_ack=lambda message: None,
+        )
+        client.connect()
+        with self.logins_lock:
+            self.logins += 1
+        reader = threading.Thread(target=client.run, daemon=True)
+        reader.start()
+        # Пока цикл приёма не запущен, запросы читают сокет сами
+        while not client.reader_active:
+            time.sleep(0.001)
+        client.get_contacts()
+        client.add_contact(contact)
+        client.get_contacts_since(0)
+        # Ответы на сообщения с msg_id передаются в on_ack
+        for message in range(5):
+            client.send_message(contact, f"message {message}", msg_id=message)
+        client.delete_contact(contact)
+        client.close()
+        reader.join(3)
+
+    def gui_work(self):
+        """Окно сервера: таблицы пользователей, статистика, история."""
+        self.database.active_users_list()
+        self.database.get_user_statistic()
+        self.database.user_list()
+        list(self.database.iter_login_history())
+
+    def gui_register_work(self):
+        """Окно регистрации пользователей: запись из потока окна."""
+        name = f"new_user_{time.monotonic_ns()}"
+        self.database.add_update_user(name, "hash")
+        time.sleep(0.05)
+
+    def console_work(self):
+        """Консоль сервера: постраничный вывод истории входов."""
+        with patch("builtins.input", return_value=""), redirect_stdout(
+            io.StringIO()
+        ):
+            print_login_history(self.database, "user_0")
+            print_login_history(self.database, "")
+        self.database.login_history("user_1")
+
+    def test_concurrent_access(self):
+        workers = [
+            threading.Thread(
+                target=self.run_worker,
+                args=(lambda number=number: self.client_work(number),),
+            )
+            for number in range(CLIENT_THREADS)
+        ]
+        workers += [
+            threading.Thread(target=self.run_worker, args=(work,))
+            for work in (
+                self.gui_work,
+                self.gui_register_work,
+                self.console_work,
+            )
+        ]
+        for worker in workers:
+            worker.start()
+        time.sleep(STRESS_DURATION)
+        self.stop.set()
+        for worker in workers:
+            worker.join(10)
+
+        # Сервер обрабатывает выход последних клиентов
+        deadline = time.monotonic() + 5
+        while self.server.active_sessions and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        self.assertEqual(self.errors, [])
+        self.assertTrue(self.server.thread.is_alive())
+        self.assertGreater(self.logins, 0)
+        self.assertEqual(self.database.active_users_list(), [])
+        with self.database.ReadSession() as session:
+            history = session.query(self.database.LoginHistory).count()
+        self.assertEqual(history, self.logins)
+
+
+if __name__ == "__main__":
+    main()